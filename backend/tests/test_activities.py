@@ -1,7 +1,12 @@
+import asyncio
+import logging
+import os
 import sys
+import time
 import types
 import unittest
 from unittest.mock import patch, MagicMock, AsyncMock
+import httpx
 from pydantic import BaseModel
 
 # Create a real in-memory shared module with minimal stubs
@@ -28,11 +33,20 @@ temporalio_activity_mod = types.ModuleType('temporalio.activity')
 def no_op_decorator(f):
     return f
 temporalio_activity_mod.defn = no_op_decorator
+temporalio_activity_mod.logger = logging.getLogger('temporalio.activity')
 sys.modules['temporalio.activity'] = temporalio_activity_mod
 
 import importlib
 activities = importlib.import_module('temporals.base.activities')
 
+CONCURRENT_ENRICHMENTS = 50
+UPSTREAM_DELAY_SECONDS = 0.1
+
+def mock_http(handler):
+    """Routes every httpx.AsyncClient the activities open through handler instead of the network."""
+    client_class = httpx.AsyncClient
+    return patch('httpx.AsyncClient', lambda **kwargs: client_class(transport=httpx.MockTransport(handler), **kwargs))
+
 class TestActivities(unittest.IsolatedAsyncioTestCase):
     async def test_assign_report_number(self):
         with patch('random.randint', return_value=12345):
@@ -52,22 +66,66 @@ class TestActivities(unittest.IsolatedAsyncioTestCase):
             self.assertEqual(result, 8)
 
     async def test_find_ais_neighbours_success(self):
-        # Patch requests.request to simulate API call
-        fake_response = MagicMock()
-        fake_response.raise_for_status = MagicMock()
-        fake_response.json.return_value = [{"vessel_name": "ShipA"}, {"vessel_name": "ShipB"}]
-        with patch('requests.request', return_value=fake_response):
+        # Serve the AIS mock's answer from an in-process transport
+        def handler(request):
+            self.assertEqual(request.url.params["radius"], "10")
+            return httpx.Response(200, json=[{"vessel_name": "ShipA"}, {"vessel_name": "ShipB"}])
+        with mock_http(handler):
             report = EnrichedReportDetails(latitude=0, longitude=0, visibility=10)
             result = await activities.find_ais_neighbours(report)
             self.assertEqual(result, ["ShipA", "ShipB"])
 
     async def test_find_ais_neighbours_http_error(self):
-        # Patch requests.request to raise an exception
-        with patch('requests.request', side_effect=Exception("fail")):
+        with mock_http(lambda request: httpx.Response(503)):
             report = EnrichedReportDetails(latitude=0, longitude=0, visibility=10)
-            with self.assertRaises(Exception):
+            with self.assertRaises(httpx.HTTPStatusError):
                 await activities.find_ais_neighbours(report)
 
+    async def test_slow_upstreams_do_not_block_other_activities(self):
+        # Load test: many enrichments waiting on slow upstreams at once, as on a worker's event loop
+        async def slow_handler(request):
+            await asyncio.sleep(UPSTREAM_DELAY_SECONDS)
+            if request.url.host == "api.openai.com":
+                return httpx.Response(200, json={"choices": [{"message": {"content": "enriched"}}]})
+            if request.url.host == "api.openweathermap.org":
+                return httpx.Response(200, json={"visibility": 8000})
+            return httpx.Response(200, json=[{"vessel_name": "ShipA"}])
+        report = EnrichedReportDetails(latitude=0, longitude=0, visibility=10)
+        with mock_http(slow_handler), patch.dict(os.environ, {"OPENAI_API_KEY": "test", "OPENWEATHERMAP_API_KEY": "test"}):
+            start = time.perf_counter()
+            results = await asyncio.gather(*[
+                activity(report)
+                for activity in (activities.find_ais_neighbours, activities.llm_enrich, activities.calculate_visibility)
+                for _ in range(CONCURRENT_ENRICHMENTS)
+            ])
+            elapsed = time.perf_counter() - start
+        self.assertEqual(results, [["ShipA"]] * CONCURRENT_ENRICHMENTS + ["enriched"] * CONCURRENT_ENRICHMENTS + [8000] * CONCURRENT_ENRICHMENTS)
+        # Blocking clients would take 3 * CONCURRENT_ENRICHMENTS * UPSTREAM_DELAY_SECONDS (15s); waiting concurrently takes about one delay
+        self.assertLess(elapsed, 10 * UPSTREAM_DELAY_SECONDS)
+
+    async def test_activities_reuse_the_injected_pools(self):
+        seen = []
+        def handler(request):
+            seen.append(request.url.host)
+            if request.url.host == "api.openweathermap.org":
+                return httpx.Response(200, json={"visibility": 8000})
+            return httpx.Response(200, json=[{"vessel_name": "ShipA"}])
+        http_clients = sys.modules['http_clients']
+        pools = http_clients.HttpClients({upstream: httpx.AsyncClient(transport=httpx.MockTransport(handler)) for upstream in http_clients.UPSTREAMS})
+        report = EnrichedReportDetails(latitude=0, longitude=0, visibility=10)
+        # One-off clients would have to go through the patched constructor
+        with patch('httpx.AsyncClient', side_effect=AssertionError("opened a new client")), patch.dict(os.environ, {"OPENWEATHERMAP_API_KEY": "test"}):
+            activities.use_http_clients(pools)
+            try:
+                for _ in range(3):
+                    self.assertEqual(await activities.find_ais_neighbours(report), ["ShipA"])
+                    self.assertEqual(await activities.calculate_visibility(report), 8000)
+            finally:
+                activities.use_http_clients(None)
+        self.assertEqual(seen, ["0.0.0.0", "api.openweathermap.org"] * 3)
+        self.assertFalse(any(client.is_closed for client in pools.clients.values()))
+        await pools.aclose()
+
     async def test_convert_to_prometheus_metrics(self):
         # Patch _convert_to_prometheus_metrics to return a known value
         with patch('temporals.base.activities._convert_to_prometheus_metrics', new=AsyncMock(return_value="foo_metric")):
@@ -0,0 +1,74 @@
+import hashlib
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+import importlib
+ais_cache = importlib.import_module('scripts.ais_mock.ais_cache')
+
+class TestAISCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp.name, "cache")
+        self.df = pd.DataFrame({
+            "MMSI": ["111", "111", "222"],
+            "BaseDateTime": pd.to_datetime(["2024-05-05T00:00:00", "2024-05-05T00:01:00", "2024-05-05T00:00:30"]),
+            "LAT": [37.0, 37.1, 38.0],
+            "VesselName": ["ALPHA", "ALPHA", np.nan],
+            "Status": [0, 5, 15],
+        })
+        self.arrays = {"time_order": np.array([0, 2, 1])}
+        self.meta = {"grid_cell_deg": 0.1}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        ais_cache.save_dataset(self.cache_dir, "abc", self.df, self.arrays, self.meta)
+        df, arrays = ais_cache.load_dataset(self.cache_dir, "abc", self.meta)
+        self.assertEqual(df["MMSI"].tolist(), ["111", "111", "222"])
+        self.assertTrue(pd.isna(df["VesselName"].iloc[2]))
+        self.assertEqual(df["VesselName"].iloc[0], "ALPHA")
+        self.assertTrue((df["BaseDateTime"] == self.df["BaseDateTime"]).all())
+        self.assertEqual(df["LAT"].tolist(), [37.0, 37.1, 38.0])
+        self.assertEqual(df["Status"].tolist(), [0, 5, 15])
+        self.assertEqual(arrays["time_order"].tolist(), [0, 2, 1])
+        # Numeric columns are memory-mapped rather than copied into RAM
+        self.assertIsInstance(arrays["time_order"], np.memmap)
+
+    def test_categorical_codes_stay_memory_mapped(self):
+        df = self.df.assign(VesselName=self.df["VesselName"].astype("category"))
+        ais_cache.save_dataset(self.cache_dir, "abc", df, self.arrays, self.meta)
+        loaded, _ = ais_cache.load_dataset(self.cache_dir, "abc", self.meta)
+        self.assertEqual(loaded["VesselName"].tolist()[:2], ["ALPHA", "ALPHA"])
+        codes = loaded["VesselName"].array.codes
+        while codes is not None and not isinstance(codes, np.memmap):
+            codes = codes.base
+        self.assertIsInstance(codes, np.memmap)
+
+    def test_entry_lock_is_reusable(self):
+        with ais_cache.entry_lock(self.cache_dir, "abc") as locked:
+            self.assertTrue(locked)
+            self.assertTrue(os.path.exists(os.path.join(self.cache_dir, "abc.lock")))
+        with ais_cache.entry_lock(self.cache_dir, "abc") as locked:
+            self.assertTrue(locked)
+
+    def test_miss_on_unknown_hash_or_changed_meta(self):
+        ais_cache.save_dataset(self.cache_dir, "abc", self.df, self.arrays, self.meta)
+        self.assertIsNone(ais_cache.load_dataset(self.cache_dir, "def", self.meta))
+        self.assertIsNone(ais_cache.load_dataset(self.cache_dir, "abc", {"grid_cell_deg": 0.5}))
+
+    def test_file_sha256(self):
+        path = os.path.join(self.tmp.name, "data.csv")
+        with open(path, "wb") as f:
+            f.write(b"MMSI,LAT\n1,2\n")
+        first = ais_cache.file_sha256(path)
+        self.assertEqual(first, hashlib.sha256(b"MMSI,LAT\n1,2\n").hexdigest())
+        with open(path, "ab") as f:
+            f.write(b"3,4\n")
+        self.assertNotEqual(ais_cache.file_sha256(path), first)
+
+if __name__ == "__main__":
+    unittest.main()
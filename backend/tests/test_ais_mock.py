@@ -0,0 +1,568 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+
+# main.py imports its sibling modules by name, as when it is run from scripts/ais_mock
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts', 'ais_mock'))
+import importlib
+ais_main = importlib.import_module('main')
+
+CSV_HEADER = "MMSI,BaseDateTime,LAT,LON,SOG,COG,Heading,VesselName,IMO,CallSign,VesselType,Status,Length,Width,Draft,Cargo,TransceiverClass\n"
+CSV_ROWS = [
+    "367000002,2024-05-05T00:02:00,37.78959,-122.38512,5.6,180.2,511,BRAVO,IMO9000002,WDB2,70,0,120,20,,70,A\n",
+    "367000001,2024-05-05T00:01:00,37.78000,-122.38000,0.1,0,90,ALPHA,,WDA1,,5,,,,,B\n",
+    "367000001,2024-05-05T00:00:00,37.77000,-122.37000,0.2,1,90,ALPHA,,WDA1,,5,,,,,B\n",
+    "367000003,not-a-time,37.0,-122.0,0,0,0,,,,,,,,,,A\n",
+    ",2024-05-05T00:00:00,37.0,-122.0,0,0,0,,,,,,,,,,A\n",
+    "367000004,2024-05-05T00:00:00,,-122.0,0,0,0,,,,,,,,,,A\n",
+]
+
+def write_csv(directory, rows=CSV_ROWS):
+    path = os.path.join(directory, "ais.csv")
+    with open(path, "w") as f:
+        f.write(CSV_HEADER)
+        f.writelines(rows)
+    return path
+
+class CsvTestCase(unittest.TestCase):
+    """Gives each test a temporary directory (self.tmp) holding a CSV of ROWS (self.csv_path); set ROWS to None to write no CSV."""
+    ROWS = CSV_ROWS
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        if self.ROWS is not None:
+            self.csv_path = write_csv(self.tmp.name, self.ROWS)
+
+class TestIngestion(CsvTestCase):
+    def test_read_and_clean_declares_compact_dtypes(self):
+        df = ais_main.read_and_clean_ais_csv(self.csv_path)
+        self.assertEqual(df["MMSI"].dtype, np.int32)
+        self.assertEqual(df["LAT"].dtype, np.float32)
+        self.assertEqual(df["LON"].dtype, np.float32)
+        self.assertEqual(str(df["BaseDateTime"].dtype), ais_main.TIME_DTYPE)
+        self.assertIsInstance(df["VesselName"].dtype, pd.CategoricalDtype)
+        self.assertIsInstance(df["CallSign"].dtype, pd.CategoricalDtype)
+
+    def test_read_and_clean_drops_invalid_rows_and_sorts(self):
+        df = ais_main.read_and_clean_ais_csv(self.csv_path)
+        self.assertEqual(df["MMSI"].tolist(), [367000001, 367000001, 367000002])
+        self.assertEqual(df["BaseDateTime"].dt.minute.tolist(), [0, 1, 2])
+        self.assertTrue(pd.isna(df["IMO"].iloc[0]))
+        self.assertEqual(df["VesselName"].iloc[2], "BRAVO")
+
+    def test_read_and_clean_enforces_memory_budget(self):
+        path = write_csv(self.tmp.name, CSV_ROWS[:3] * 10000)
+        with patch.object(ais_main, 'MEMORY_BUDGET_MB', 1):
+            self.assertIsNone(ais_main.read_and_clean_ais_csv(path))
+
+    def test_memory_budget_covers_the_build_peak(self):
+        path = write_csv(self.tmp.name, CSV_ROWS[:3] * 10000)
+        with patch.object(ais_main, 'MEMORY_BUDGET_MB', 16):
+            df = ais_main.read_and_clean_ais_csv(path)
+        prepared_bytes = int(df.memory_usage(index=False, deep=True).sum()) + len(df) * ais_main.INDEX_BYTES_PER_ROW
+        # The prepared data alone fits in 3 MB, but sorting, indexing and the raw chunk do not
+        self.assertLess(prepared_bytes, 3 * 1024 * 1024)
+        with patch.object(ais_main, 'MEMORY_BUDGET_MB', 3):
+            self.assertIsNone(ais_main.read_and_clean_ais_csv(path))
+
+    def test_widen_float32_restores_decimals(self):
+        values = np.array([5.6, 37.78959, -122.38512, 511, 0, np.nan], dtype=np.float32)
+        widened = ais_main.widen_float32(values)
+        self.assertEqual(widened[:5].tolist(), [5.6, 37.78959, -122.38512, 511.0, 0.0])
+        self.assertTrue(np.isnan(widened[5]))
+
+class TestMMSIOffsets(unittest.TestCase):
+    def test_build_and_lookup_offsets(self):
+        mmsi_values = np.array([111, 111, 111, 222, 333, 333], dtype=np.int32)
+        keys, starts, ends = ais_main.build_mmsi_offsets(mmsi_values)
+        self.assertEqual(keys.tolist(), [111, 222, 333])
+        self.assertEqual(starts.tolist(), [0, 3, 4])
+        self.assertEqual(ends.tolist(), [3, 4, 6])
+        partition = ais_main.Partition(None, keys, starts, ends, None, None, None)
+        row_starts, row_ends = partition.lookup_mmsi_rows(np.array([333, 999, 111, 100]))
+        self.assertEqual(row_starts.tolist(), [4, 0, 0, 0])
+        self.assertEqual(row_ends.tolist(), [6, 0, 3, 0])
+
+class TestSerialization(CsvTestCase):
+    def test_payload_matches_pydantic_models(self):
+        df = ais_main.read_and_clean_ais_csv(self.csv_path)
+        latest = df.iloc[[1, 2]].copy()
+        latest["distance_km"] = [0.12345678901, 1.5]
+        for col in latest.columns:
+            if latest[col].dtype == np.float32:
+                latest[col] = ais_main.widen_float32(latest[col].to_numpy())
+        offset = pd.Timedelta(days=900, microseconds=250)
+        simulated = latest["BaseDateTime"].to_numpy() + offset.to_timedelta64()
+        tail_times = np.array(["2026-10-18T10:00:00", "2026-10-18T10:01:00.5", "2026-10-18T10:02:00"], dtype="datetime64[us]")
+        tail_counts = np.array([2, 1])
+        tail_lats, tail_lons = [37.78, 37.77, 37.78959], [-122.38, -122.37, -122.38512]
+
+        payload = ais_main.build_ship_payload(
+            latest, simulated, tail_counts, tail_lats, tail_lons, ais_main.iso_timestamps(tail_times)
+        )
+        positions = [ais_main.Position(lat=a, lon=b, timestamp=t) for a, b, t in zip(tail_lats, tail_lons, tail_times.tolist())]
+        expected = [
+            ais_main.ShipData.from_record(record=record, tail_positions=tail, dist=record["distance_km"], simulated_time=record["BaseDateTime"] + offset)
+            for (_, record), tail in zip(latest.iterrows(), [positions[:2], positions[2:]])
+        ]
+        self.assertEqual(ais_main.dumps(payload), TypeAdapter(list[ais_main.ShipData]).dump_json(expected))
+
+    def test_json_and_ndjson_responses_match(self):
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', None):
+            with TestClient(ais_main.app) as client:
+                params = {"lat": 37.78, "lon": -122.38, "radius": 5, "tail_hours": 1}
+                as_json = client.get("/ships", params=params)
+                as_ndjson = client.get("/ships", params=params, headers={"Accept": ais_main.NDJSON_MEDIA_TYPE})
+        self.assertEqual(as_json.status_code, 200)
+        self.assertEqual(as_ndjson.headers["content-type"], ais_main.NDJSON_MEDIA_TYPE)
+        ships = as_json.json()
+        self.assertEqual([ship["mmsi"] for ship in ships], ["367000001", "367000002"])
+        self.assertEqual(len(ships[0]["tail"]), 2)
+        self.assertEqual(ships[1]["sog"], 5.6)
+        self.assertEqual([ais_main.ShipData(**ship).model_dump(mode="json") for ship in ships], ships)
+        self.assertEqual([json.loads(line) for line in as_ndjson.text.splitlines()], ships)
+
+class TestBatchEndpoint(CsvTestCase):
+    def test_batch_matches_single_queries(self):
+        queries = [
+            {"lat": 37.78, "lon": -122.38, "radius": 5, "tail_hours": 1},
+            {"lat": 37.78959, "lon": -122.38512, "radius": 0.5, "tail_hours": 24},
+            {"lat": 0, "lon": 0, "radius": 1, "tail_hours": 1},
+        ]
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', None):
+            with TestClient(ais_main.app) as client:
+                batch = client.post("/ships/batch", json={"queries": queries, "sim_window_minutes": 60})
+                singles = [client.get("/ships", params={**query, "sim_window_minutes": 60}) for query in queries]
+                empty = client.post("/ships/batch", json={"queries": []})
+        self.assertEqual(batch.status_code, 200)
+        results = batch.json()
+        self.assertEqual([result["query"] for result in results], queries)
+        self.assertEqual(results[0]["ships"], singles[0].json())
+        self.assertEqual([ship["mmsi"] for ship in results[1]["ships"]], ["367000002"])
+        self.assertEqual(results[1]["ships"], singles[1].json())
+        self.assertEqual(results[2]["ships"], [])
+        self.assertEqual(singles[2].status_code, 404)
+        self.assertEqual(empty.status_code, 422)
+
+class TestFieldProjection(CsvTestCase):
+    def test_projected_fields_match_full_response(self):
+        params = {"lat": 37.78, "lon": -122.38, "radius": 5, "tail_hours": 1}
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', None), \
+             patch.object(ais_main, 'select_ship_tails', wraps=ais_main.select_ship_tails) as select_ship_tails:
+            with TestClient(ais_main.app) as client:
+                full = client.get("/ships", params=params).json()
+                self.assertEqual(select_ship_tails.call_count, 1)
+                names = client.get("/ships", params={**params, "fields": "vessel_name,mmsi"}).json()
+                repeated = client.get("/ships", params=[*params.items(), ("fields", "mmsi"), ("fields", "vessel_name")]).json()
+                # Tails are not selected unless requested
+                self.assertEqual(select_ship_tails.call_count, 1)
+                tails = client.get("/ships", params={**params, "fields": "tail"}).json()
+                batch = client.post("/ships/batch", json={"queries": [params], "fields": ["vessel_name"]}).json()
+                unknown = client.get("/ships", params={**params, "fields": "mmsi,colour"})
+        self.assertEqual(names, [{"mmsi": ship["mmsi"], "vessel_name": ship["vessel_name"]} for ship in full])
+        self.assertEqual(repeated, names)
+        self.assertEqual(tails, [{"tail": ship["tail"]} for ship in full])
+        self.assertEqual(batch[0]["ships"], [{"vessel_name": ship["vessel_name"]} for ship in full])
+        self.assertEqual(unknown.status_code, 422)
+        # Projected ships validate against the published schema
+        for ship in names + tails + batch[0]["ships"]:
+            self.assertEqual(ais_main.ProjectedShipData(**ship).model_dump(mode="json", exclude_unset=True), ship)
+
+    def test_openapi_documents_projected_ships_and_encodings(self):
+        spec = ais_main.app.openapi()
+        self.assertNotIn("required", spec["components"]["schemas"]["ProjectedShipData"])
+        ships_content = spec["paths"]["/ships"]["get"]["responses"]["200"]["content"]
+        self.assertEqual(ships_content["application/json"]["schema"]["items"], {"$ref": "#/components/schemas/ProjectedShipData"})
+        self.assertEqual(set(ships_content), {"application/json", ais_main.NDJSON_MEDIA_TYPE, ais_main.MSGPACK_MEDIA_TYPE, ais_main.ARROW_STREAM_MEDIA_TYPE})
+        batch_ships = spec["components"]["schemas"]["ShipBatchResult"]["properties"]["ships"]
+        self.assertEqual(batch_ships["items"], {"$ref": "#/components/schemas/ProjectedShipData"})
+
+class TestShipTrack(CsvTestCase):
+    # Six fixes north, a turn, then five fixes east, 10 seconds apart
+    ROWS = CSV_ROWS + [
+        f"367000009,2024-05-05T00:{i * 10 // 60:02d}:{i * 10 % 60:02d},{lat:.5f},{lon:.5f},8,0,0,TRACKER,,WDT9,70,0,,,,,A\n"
+        for i, (lat, lon) in enumerate([(37.700 + 0.001 * i, -122.400) for i in range(6)] + [(37.705, -122.400 + 0.001 * i) for i in range(1, 6)])
+    ]
+
+    def test_track_simplification_and_budget(self):
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', None):
+            with TestClient(ais_main.app) as client:
+                raw = client.get("/ships/367000009/track", params={"hours": 1}).json()
+                simplified = client.get("/ships/367000009/track", params={"hours": 1, "tolerance_m": 5}).json()
+                budget = client.get("/ships/367000009/track", params={"hours": 1, "tolerance_m": 5, "max_points": 2}).json()
+                unknown = client.get("/ships/367000099/track")
+                too_small = client.get("/ships/367000009/track", params={"max_points": 1})
+                too_long = client.get("/ships/367000009/track", params={"hours": 1e12})
+        self.assertEqual(raw["total_points"], 11)
+        self.assertEqual(len(raw["points"]), 11)
+        TypeAdapter(ais_main.ShipTrack).validate_python(raw)
+        # Only the start, the turn and the end survive
+        self.assertEqual([(point["lat"], point["lon"]) for point in simplified["points"]], [(37.7, -122.4), (37.705, -122.4), (37.705, -122.395)])
+        self.assertEqual(simplified["points"][1]["timestamp"], raw["points"][5]["timestamp"])
+        self.assertEqual([(point["lat"], point["lon"]) for point in budget["points"]], [(37.7, -122.4), (37.705, -122.395)])
+        self.assertEqual(unknown.status_code, 404)
+        self.assertEqual(too_small.status_code, 422)
+        self.assertEqual(too_long.status_code, 422)
+
+class TestNearestShips(CsvTestCase):
+    # A ship 30km south, and one that passed the query point earlier but is now 60km north
+    ROWS = CSV_ROWS + [
+        "367000020,2024-05-05T00:01:30,37.510,-122.380,12,180,180,SOUTH,,WDS2,70,0,,,,,A\n",
+        "367000021,2024-05-05T00:00:10,37.780,-122.380,12,0,0,PASSING,,WDP1,70,0,,,,,A\n",
+        "367000021,2024-05-05T00:01:50,38.320,-122.380,12,0,0,PASSING,,WDP1,70,0,,,,,A\n",
+    ]
+
+    def test_k_nearest_by_latest_position(self):
+        params = {"lat": 37.78, "lon": -122.38, "tail_hours": 1}
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', None):
+            with TestClient(ais_main.app) as client:
+                everything = client.get("/ships", params={**params, "radius": 20000}).json()
+                nearest = client.get("/ships", params={**params, "k": 3}).json()
+                capped = client.get("/ships", params={**params, "k": 10, "radius": 40, "fields": "mmsi"}).json()
+                all_ships = client.get("/ships", params={**params, "k": 10, "fields": "mmsi"}).json()
+                nothing_near = client.get("/ships", params={"lat": 0, "lon": 0, "k": 1, "radius": 100})
+                no_radius = client.get("/ships", params=params)
+                bad_k = client.get("/ships", params={**params, "k": 0})
+        self.assertEqual([ship["mmsi"] for ship in nearest], ["367000001", "367000002", "367000020"])
+        self.assertEqual(nearest, sorted(everything, key=lambda ship: ship["distance_km"])[:3])
+        self.assertAlmostEqual(nearest[2]["distance_km"], 30.0, delta=0.1)
+        # The passing ship is ranked by where it is now, not by where it was
+        self.assertEqual(capped, [{"mmsi": "367000001"}, {"mmsi": "367000002"}, {"mmsi": "367000020"}])
+        self.assertEqual([ship["mmsi"] for ship in all_ships], ["367000001", "367000002", "367000020", "367000021"])
+        self.assertEqual(nothing_near.status_code, 404)
+        self.assertEqual(no_radius.status_code, 422)
+        self.assertEqual(bad_k.status_code, 422)
+
+class TestBinaryFormats(CsvTestCase):
+    def test_msgpack_and_arrow_match_json(self):
+        import msgpack
+        import pyarrow.ipc
+        params = {"lat": 37.78, "lon": -122.38, "radius": 5, "tail_hours": 1}
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', None):
+            with TestClient(ais_main.app) as client:
+                browser = client.get("/ships", params=params, headers={"Accept": "text/html,application/xhtml+xml,*/*;q=0.8"})
+                packed = client.get("/ships", params=params, headers={"Accept": "application/x-msgpack"})
+                arrow = client.get("/ships", params=params, headers={"Accept": "application/json;q=0.5, application/vnd.apache.arrow.stream"})
+                cached_arrow = client.get("/ships", params=params, headers={"Accept": "application/vnd.apache.arrow.stream"})
+        ships = browser.json()
+        self.assertEqual(browser.headers["content-type"], "application/json")
+        self.assertEqual(browser.headers["vary"], "Accept")
+        self.assertEqual(packed.headers["content-type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(packed.content), ships)
+        self.assertEqual(arrow.headers["content-type"], "application/vnd.apache.arrow.stream")
+        self.assertEqual(cached_arrow.content, arrow.content)
+        table = pyarrow.ipc.open_stream(arrow.content).read_all()
+        self.assertEqual(table.column_names, list(ais_main.SHIP_FIELDS))
+        self.assertEqual(table.column("mmsi").to_pylist(), [ship["mmsi"] for ship in ships])
+        self.assertEqual(table.column("sog").to_pylist(), [ship["sog"] for ship in ships])
+        self.assertEqual(table.column("anomalies").to_pylist(), [ship["anomalies"] for ship in ships])
+        self.assertEqual(
+            [[(point["lat"], point["lon"], point["timestamp"].isoformat()) for point in tail] for tail in table.column("tail").to_pylist()],
+            [[(point["lat"], point["lon"], point["timestamp"]) for point in ship["tail"]] for ship in ships]
+        )
+
+    def test_negotiation(self):
+        serialization = sys.modules['serialization']
+        self.assertEqual(ais_main.negotiate_ships_media_type(None), "application/json")
+        self.assertEqual(ais_main.negotiate_ships_media_type("image/png"), "application/json")
+        self.assertEqual(ais_main.negotiate_ships_media_type("application/x-ndjson"), "application/x-ndjson")
+        self.assertEqual(ais_main.negotiate_ships_media_type("application/msgpack;q=0.9, application/vnd.apache.arrow.stream;q=0.9"), "application/msgpack")
+        self.assertEqual(ais_main.negotiate_ships_media_type("application/msgpack;q=0, */*"), "application/json")
+        with patch.object(serialization, 'msgpack', None):
+            # Falls back to the next acceptable type, and only refuses when none is left
+            self.assertEqual(ais_main.negotiate_ships_media_type("application/msgpack, application/json;q=0.1"), "application/json")
+            with self.assertRaises(ais_main.HTTPException) as refused:
+                ais_main.negotiate_ships_media_type("application/msgpack")
+        self.assertEqual(refused.exception.status_code, 406)
+
+class TestAnomalyFlags(CsvTestCase):
+    # One fix 100km off the ship's track, then back on it
+    ROWS = CSV_ROWS + [
+        f"367000010,2024-05-05T00:00:{i * 10:02d},{lat:.3f},-122.380,8,0,0,SPOOFED,,WDS1,70,0,,,,,A\n"
+        for i, lat in enumerate([37.780, 37.781, 38.700, 37.783, 37.784])
+    ]
+
+    def test_ships_report_anomalies(self):
+        params = {"lat": 37.78, "lon": -122.38, "radius": 5, "tail_hours": 1}
+        cache_dir = os.path.join(self.tmp.name, "cache")
+        for cache in (None, cache_dir, cache_dir):
+            with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', cache):
+                with TestClient(ais_main.app) as client:
+                    ships = client.get("/ships", params=params).json()
+                    flags = client.get("/ships", params={**params, "fields": "mmsi,anomalies"}).json()
+            self.assertEqual({ship["mmsi"]: ship["anomalies"] for ship in ships}, {"367000001": [], "367000002": [], "367000010": ["teleport"]})
+            self.assertEqual(flags, [{"mmsi": ship["mmsi"], "anomalies": ship["anomalies"]} for ship in ships])
+            TypeAdapter(list[ais_main.ShipData]).validate_python(ships)
+
+class TestLatestRecordPerShip(CsvTestCase):
+    ROWS = CSV_ROWS + [
+        # Left the search area after its last fix inside it
+        "367000005,2024-05-05T00:01:30,37.78100,-122.38100,1,0,0,ECHO,,,,,,,,,A\n",
+        "367000005,2024-05-05T00:02:00,38.50000,-123.50000,1,0,0,ECHO,,,,,,,,,A\n",
+        # Two fixes with the same timestamp: the first row wins
+        "367000006,2024-05-05T00:01:00,37.78200,-122.38200,1,0,0,FOXTROT,,,,,,,,,A\n",
+        "367000006,2024-05-05T00:01:00,37.78300,-122.38300,1,0,0,FOXTROT,,,,,,,,,A\n",
+    ]
+
+    def test_latest_fix_inside_radius(self):
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', None):
+            with TestClient(ais_main.app) as client:
+                response = client.get("/ships", params={"lat": 37.78, "lon": -122.38, "radius": 5, "tail_hours": 1})
+                offset = ais_main.time_offset
+        self.assertEqual(response.status_code, 200)
+        ships = {ship["mmsi"]: ship for ship in response.json()}
+        self.assertEqual(list(ships), ["367000001", "367000002", "367000005", "367000006"])
+        self.assertEqual((ships["367000005"]["latest_lat"], ships["367000005"]["latest_lon"]), (37.781, -122.381))
+        self.assertEqual(ships["367000005"]["latest_timestamp"], (pd.Timestamp("2024-05-05T00:01:30") + offset).isoformat())
+        self.assertEqual(ships["367000006"]["latest_lat"], 37.782)
+        self.assertEqual(ships["367000001"]["latest_lat"], 37.78)
+
+class TestResultCache(CsvTestCase):
+    def test_nearby_repeated_queries_are_cached(self):
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', None), \
+             patch.object(ais_main, 'RESULT_CACHE_TTL_SECONDS', 3600):
+            with TestClient(ais_main.app) as client:
+                first = client.get("/ships", params={"lat": 37.78, "lon": -122.38, "radius": 5, "tail_hours": 0.1})
+                # Within the lat/lon quantum of the first query
+                second = client.get("/ships", params={"lat": 37.7801, "lon": -122.3801, "radius": 5, "tail_hours": 0.1})
+                empty = [client.get("/ships", params={"lat": 0, "lon": 0, "radius": 1}) for _ in range(2)]
+                other = client.get("/ships", params={"lat": 37.78, "lon": -122.38, "radius": 5, "tail_hours": 1})
+                stats = client.get("/health").json()["result_cache"]
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual([response.status_code for response in empty], [404, 404])
+        self.assertEqual(empty[1].json(), empty[0].json())
+        self.assertEqual(other.status_code, 200)
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (2, 3, 3))
+
+    def test_zero_bucket_settings_disable_the_cache(self):
+        for setting in ('RESULT_CACHE_TTL_SECONDS', 'RESULT_CACHE_LATLON_DEG', 'RESULT_CACHE_RADIUS_KM', 'RESULT_CACHE_MB'):
+            with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', None), \
+                 patch.object(ais_main, setting, 0):
+                with TestClient(ais_main.app) as client:
+                    ships = client.get("/ships", params={"lat": 37.78, "lon": -122.38, "radius": 5, "tail_hours": 0.1})
+                    health = client.get("/health").json()
+            self.assertEqual(ships.status_code, 200, setting)
+            self.assertIsNone(health["result_cache"], setting)
+
+class TestQueryOffloading(CsvTestCase):
+    def test_slow_query_times_out_without_blocking_health(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow_find_ships(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return []
+
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', None), \
+             patch.object(ais_main, 'QUERY_WORKERS', 1), patch.object(ais_main, 'QUERY_QUEUE_DEPTH', 0), \
+             patch.object(ais_main, 'QUERY_TIMEOUT_SECONDS', 0.2), patch.object(ais_main, 'find_ships', slow_find_ships):
+            with TestClient(ais_main.app) as client:
+                slow = client.get("/ships", params={"lat": 37.78, "lon": -122.38, "radius": 5})
+                self.assertTrue(started.is_set())
+                # The timed-out query still holds the only worker, but the event loop is free
+                health = client.get("/health")
+                busy = client.get("/ships", params={"lat": 37.78, "lon": -122.38, "radius": 5})
+                release.set()
+        self.assertEqual(slow.status_code, 504)
+        self.assertEqual(health.status_code, 200)
+        self.assertEqual(health.json()["query_pool"]["running"], 1)
+        self.assertEqual(busy.status_code, 503)
+        self.assertEqual(busy.headers["retry-after"], "1")
+
+class TestMetrics(CsvTestCase):
+    def test_ships_query_is_measured(self):
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', None), \
+             patch.object(ais_main, 'SERVER_TIMING', True):
+            with TestClient(ais_main.app) as client:
+                ships = client.get("/ships", params={"lat": 37.78, "lon": -122.38, "radius": 5, "tail_hours": 0.1})
+                missing = client.get("/ships", params={"lat": 0, "lon": 0, "radius": 1})
+                metrics = client.get("/metrics")
+        self.assertEqual(ships.status_code, 200)
+        stages = [entry.split(";")[0] for entry in ships.headers["server-timing"].split(", ")]
+        self.assertEqual(stages, ["time_window", "window_slice", "radius_filter", "latest_per_ship", "tails", "payload", "encode", "total"])
+        self.assertEqual(missing.status_code, 404)
+        self.assertIn("server-timing", missing.headers)
+
+        self.assertTrue(metrics.headers["content-type"].startswith("text/plain"))
+        text = metrics.text
+        self.assertIn('ais_query_stage_seconds_count{endpoint="/ships",stage="radius_filter"}', text)
+        self.assertIn('ais_request_seconds_count{endpoint="/ships",status="404"}', text)
+        self.assertIn('ais_query_response_bytes_sum{endpoint="/ships"}', text)
+        self.assertIn('ais_load_stage_seconds_count{stage="read_csv"}', text)
+
+class TestHotSwap(CsvTestCase):
+    def test_reload_swaps_data_while_running_queries_keep_their_snapshot(self):
+        new_ship = "367000005,2024-05-05T00:01:30,37.78100,-122.38100,3.0,0,0,ECHO,,WDE5,70,0,,,,,A\n"
+        params = {"lat": 37.78, "lon": -122.38, "radius": 5, "tail_hours": 1}
+        started, release = threading.Event(), threading.Event()
+        latest_record_per_ship = ais_main.latest_record_per_ship
+
+        def paused_latest_record_per_ship(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return latest_record_per_ship(*args, **kwargs)
+
+        running = {}
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', None):
+            with TestClient(ais_main.app) as client:
+                generation = ais_main.dataset_generation
+                before = client.get("/ships", params=params).json()
+                with patch.object(ais_main, 'latest_record_per_ship', paused_latest_record_per_ship):
+                    # A query that has already read its partitions when the swap happens
+                    query = threading.Thread(target=lambda: running.update(ships=ais_main.find_ships(37.78, -122.38, 5, 1, 60)))
+                    query.start()
+                    self.assertTrue(started.wait(5))
+                    write_csv(self.tmp.name, CSV_ROWS + [new_ship])
+                    reload = client.post("/admin/reload")
+                    release.set()
+                    query.join(5)
+                after = client.get("/ships", params=params).json()
+                health = client.get("/health").json()
+        self.assertEqual(reload.status_code, 200)
+        report = reload.json()
+        self.assertEqual((report["status"], report["generation"], report["loaded"]), ("swapped", generation + 1, ["all"]))
+        self.assertIn("peak_rss_mb", report)
+        self.assertEqual([ship["mmsi"] for ship in running["ships"]], [ship["mmsi"] for ship in before])
+        # The result cache does not serve answers from the old data
+        self.assertEqual([ship["mmsi"] for ship in after], ["367000001", "367000002", "367000005"])
+        self.assertEqual(health["dataset"]["generation"], generation + 1)
+
+    def test_workers_reload_when_another_worker_is_asked_to(self):
+        new_ship = "367000005,2024-05-05T00:01:30,37.78100,-122.38100,3.0,0,0,ECHO,,WDE5,70,0,,,,,A\n"
+        params = {"lat": 37.78, "lon": -122.38, "radius": 5, "tail_hours": 1}
+        cache_dir = os.path.join(self.tmp.name, "cache")
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', cache_dir), \
+                patch.object(ais_main, 'WORKERS', 2), patch.object(ais_main, 'RELOAD_TRIGGER_POLL_SECONDS', 0.05):
+            with TestClient(ais_main.app) as client:
+                generation = ais_main.dataset_generation
+                # The worker that gets the request reloads once, and signals the others
+                self.assertEqual(client.post("/admin/reload").status_code, 200)
+                self.assertEqual(ais_main.read_reload_trigger(), ais_main.reload_trigger_seen)
+                time.sleep(0.3)
+                self.assertEqual(ais_main.dataset_generation, generation + 1)
+                # A request accepted by another worker
+                write_csv(self.tmp.name, CSV_ROWS + [new_ship])
+                ais_main.write_reload_trigger()
+                deadline = time.time() + 5
+                while ais_main.dataset_generation < generation + 2 and time.time() < deadline:
+                    time.sleep(0.05)
+                self.assertEqual(ais_main.dataset_generation, generation + 2)
+                after = client.get("/ships", params=params).json()
+        self.assertEqual([ship["mmsi"] for ship in after], ["367000001", "367000002", "367000005"])
+
+class TestPositionStream(CsvTestCase):
+    def read_events(self, headers=None, **params):
+        box = {"min_lat": 37.775, "max_lat": 37.8, "min_lon": -122.39, "max_lon": -122.38}
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.csv_path), patch.object(ais_main, 'CACHE_DIR', None):
+            with TestClient(ais_main.app) as client:
+                response = client.get("/ships/stream", params={**box, "tick_seconds": 0.1, **params}, headers=headers or {})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith(ais_main.SSE_MEDIA_TYPE))
+        return [block for block in response.text.split("\n\n") if block]
+
+    def test_backfill_then_only_new_fixes(self):
+        first, second = self.read_events(backfill_minutes=10, max_ticks=2)
+        lines = dict(line.split(": ", 1) for line in first.splitlines())
+        self.assertEqual(lines["event"], "positions")
+        fixes = json.loads(lines["data"])["fixes"]
+        # Fixes outside the box are skipped; the rest arrive in time order
+        self.assertEqual([(fix["mmsi"], fix["lat"], fix["lon"]) for fix in fixes], [("367000001", 37.78, -122.38), ("367000002", 37.78959, -122.38512)])
+        self.assertEqual(fixes[1]["sog"], 5.6)
+        # Nothing new was recorded since the first tick
+        self.assertEqual(second, ": keepalive")
+
+    def test_resume_from_last_event_id(self):
+        first_fix_time = np.datetime64("2024-05-05T00:01:00", "us").astype(np.int64)
+        first, = self.read_events(headers={"Last-Event-ID": str(first_fix_time)}, max_ticks=1)
+        fixes = json.loads(dict(line.split(": ", 1) for line in first.splitlines())["data"])["fixes"]
+        self.assertEqual([fix["mmsi"] for fix in fixes], ["367000002"])
+
+    def test_invalid_last_event_id_falls_back_to_the_backfill(self):
+        # Too large for int64, and the int64 minimum, which is NaT
+        for last_event_id in ("99999999999999999999", "-9223372036854775808", "abc"):
+            first, = self.read_events(headers={"Last-Event-ID": last_event_id}, backfill_minutes=10, max_ticks=1)
+            fixes = json.loads(dict(line.split(": ", 1) for line in first.splitlines())["data"])["fixes"]
+            self.assertEqual([fix["mmsi"] for fix in fixes], ["367000001", "367000002"])
+
+    def test_ticks_run_on_the_query_pool(self):
+        threads = []
+        def fixes_in_box(*args):
+            threads.append(threading.current_thread().name)
+            return real_fixes_in_box(*args)
+        real_fixes_in_box, real_run = ais_main.fixes_in_box, ais_main.QueryPool.run
+        rejected = []
+        async def run(pool, func, *args):
+            if not rejected:
+                rejected.append(func)
+                raise ais_main.QueryPoolFull("busy")
+            return await real_run(pool, func, *args)
+        with patch.object(ais_main, 'fixes_in_box', fixes_in_box), patch.object(ais_main.QueryPool, 'run', run):
+            first, second = self.read_events(backfill_minutes=10, max_ticks=2)
+        # A tick the pool cannot take is skipped; its fixes come with the next one
+        self.assertEqual(first, ": keepalive")
+        fixes = json.loads(dict(line.split(": ", 1) for line in second.splitlines())["data"])["fixes"]
+        self.assertEqual([fix["mmsi"] for fix in fixes], ["367000001", "367000002"])
+        self.assertTrue(threads and all(name.startswith("ais-query") for name in threads))
+
+class TestDailyPartitions(CsvTestCase):
+    ROWS = None # One file per day instead
+
+    def setUp(self):
+        super().setUp()
+        rows = {
+            "AIS_2024_05_05.csv": ["367000001,2024-05-05T23:50:00,37.77000,-122.37000,1,0,90,ALPHA,,WDA1,70,0,,,,,A\n"],
+            "AIS_2024_05_06.csv": ["367000001,2024-05-06T00:10:00,37.78000,-122.38000,1,0,90,ALPHA,,WDA1,70,0,,,,,A\n"],
+            "AIS_2024_05_07.csv": ["367000001,2024-05-07T12:00:00,37.79000,-122.39000,1,0,90,ALPHA,,WDA1,70,0,,,,,A\n"],
+        }
+        for name, day_rows in rows.items():
+            with open(os.path.join(self.tmp.name, name), "w") as f:
+                f.write(CSV_HEADER)
+                f.writelines(day_rows)
+
+    def test_pinned_replay_clock(self):
+        # Worker processes share the parent's clock through AIS_REPLAY_START / AIS_REPLAY_STARTED_AT
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.tmp.name), patch.object(ais_main, 'CACHE_DIR', None), \
+             patch.object(ais_main, 'REPLAY_START', "2024-05-06T00:15:00"), patch.object(ais_main, 'REPLAY_STARTED_AT', "2026-01-01T00:00:00"):
+            with TestClient(ais_main.app):
+                self.assertEqual(ais_main.time_offset, pd.Timestamp("2026-01-01") - pd.Timestamp("2024-05-06T00:15:00"))
+
+    def test_window_across_midnight_loads_only_touched_days(self):
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.tmp.name), patch.object(ais_main, 'CACHE_DIR', None), \
+             patch.object(ais_main, 'REPLAY_START', "2024-05-06T00:15:00"), patch.object(ais_main, 'MAX_LOADED_DAYS', 2):
+            with TestClient(ais_main.app) as client:
+                self.assertEqual(ais_main.ais_store.loaded_keys(), [])
+                response = client.get("/ships", params={"lat": 37.78, "lon": -122.38, "radius": 5, "tail_hours": 1, "sim_window_minutes": 60})
+                self.assertEqual(ais_main.ais_store.loaded_keys(), ["2024-05-05", "2024-05-06"])
+        ship, = response.json()
+        self.assertEqual(ship["latest_lat"], 37.78)
+        # The tail reaches back into the previous day's partition
+        self.assertEqual([point["lat"] for point in ship["tail"]], [37.77, 37.78])
+
+    def test_spans_longer_than_the_loaded_days_are_rejected(self):
+        # A request holds every day it reads, so its window and tails may not touch more days than the store keeps
+        params = {"lat": 37.78, "lon": -122.38, "radius": 5, "sim_window_minutes": 60}
+        with patch.object(ais_main, 'CSV_FILE_PATH', self.tmp.name), patch.object(ais_main, 'CACHE_DIR', None), \
+             patch.object(ais_main, 'REPLAY_START', "2024-05-07T12:00:00"), patch.object(ais_main, 'MAX_QUERY_SPAN_HOURS', 24):
+            with TestClient(ais_main.app) as client:
+                long_tail = client.get("/ships", params={**params, "tail_hours": 24})
+                long_window = client.get("/ships", params={**params, "sim_window_minutes": 25 * 60, "fields": "mmsi"})
+                batch = client.post("/ships/batch", json={"queries": [{**params, "tail_hours": 1}, {**params, "tail_hours": 30}]})
+                self.assertEqual(ais_main.ais_store.loaded_keys(), [])
+                # Without tails, only the window counts
+                names = client.get("/ships", params={**params, "tail_hours": 24, "fields": "vessel_name"})
+        self.assertEqual([long_tail.status_code, long_window.status_code, batch.status_code], [422, 422, 422])
+        self.assertEqual(names.json(), [{"vessel_name": "ALPHA"}])
+
+if __name__ == "__main__":
+    unittest.main()
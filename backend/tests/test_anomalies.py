@@ -0,0 +1,79 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+import numpy as np
+
+# anomalies.py lives next to main.py in scripts/ais_mock
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts', 'ais_mock'))
+import importlib
+anomalies = importlib.import_module('anomalies')
+
+START = np.datetime64("2024-05-05T00:00:00", "us")
+MINUTE = np.timedelta64(60, "s")
+
+def fixes(mmsi, minutes, lats, lon=-122.0):
+    return [(mmsi, START + minute * MINUTE, lat, lon) for minute, lat in zip(minutes, lats)]
+
+class TestDetectAnomalies(unittest.TestCase):
+    def setUp(self):
+        rows = []
+        # 10 knots north, one fix a minute
+        rows += fixes(1, range(10), [37.0 + 0.0028 * i for i in range(10)])
+        # One spoofed fix 30km away, then one 200km away
+        rows += fixes(2, range(10), [37.0 + (0.27 if i == 3 else 0) + (1.8 if i == 7 else 0) for i in range(10)])
+        # Two transmitters 110km apart sharing one MMSI
+        rows += fixes(3, range(12), [38.0 if i % 3 == 0 else 37.0 for i in range(12)])
+        # Silent for over two hours
+        rows += fixes(4, [0, 1, 2, 130, 131], [37.0] * 5)
+        # Consecutive ships far apart are not a jump
+        rows += fixes(5, [0], [10.0])
+        self.mmsi = np.array([row[0] for row in rows], dtype=np.int32)
+        self.times = np.array([row[1] for row in rows])
+        self.lats = np.array([row[2] for row in rows], dtype=np.float32)
+        self.lons = np.array([row[3] for row in rows], dtype=np.float32)
+
+    def names(self, masks, mmsi):
+        return anomalies.anomaly_names(masks[self.mmsi == mmsi], int(np.count_nonzero(self.mmsi == mmsi)))
+
+    def test_flags_per_fix(self):
+        flags = anomalies.detect_anomalies(self.mmsi, self.times, self.lats, self.lons)
+        self.assertEqual(self.names(flags, 1), [[]] * 10)
+        # Both the jump out and the jump back are impossible
+        self.assertEqual(self.names(flags, 2), [[], [], [], ["speed_jump"], ["speed_jump"], [], [], ["teleport"], ["teleport"], []])
+        # Jumps between the two are teleports until the third return (fix 6), then flagged as a shared MMSI
+        self.assertEqual(self.names(flags, 3), [[], ["teleport"], [], ["teleport"], ["teleport"], []] + [[] if i % 3 == 2 else ["duplicate_mmsi"] for i in range(6, 12)])
+        self.assertEqual(self.names(flags, 4), [[], [], [], ["reporting_gap"], []])
+        self.assertEqual(self.names(flags, 5), [[]])
+
+    def test_chunking_does_not_change_flags(self):
+        expected = anomalies.detect_anomalies(self.mmsi, self.times, self.lats, self.lons)
+        for chunk_rows in (1, 3, 7):
+            with patch.object(anomalies, 'CHUNK_ROWS', chunk_rows):
+                self.assertEqual(anomalies.detect_anomalies(self.mmsi, self.times, self.lats, self.lons).tolist(), expected.tolist())
+
+    def test_history_only_includes_earlier_fixes(self):
+        flags = anomalies.detect_anomalies(self.mmsi, self.times, self.lats, self.lons)
+        history = anomalies.ship_history(self.mmsi, flags)
+        self.assertEqual(self.names(history, 2), [[]] * 3 + [["speed_jump"]] * 4 + [["speed_jump", "teleport"]] * 3)
+        self.assertEqual(self.names(history, 5), [[]])
+        ship_ends = np.flatnonzero(np.r_[self.mmsi[1:] != self.mmsi[:-1], True]) + 1
+        self.assertEqual(anomalies.count_ships(history, ship_ends), {"speed_jump": 1, "teleport": 2, "reporting_gap": 1, "duplicate_mmsi": 1})
+        self.assertEqual(anomalies.anomaly_names(None, 2), [[], []])
+        self.assertEqual(anomalies.anomaly_names(np.array([np.nan, 9.0]), 2), [[], ["speed_jump", "duplicate_mmsi"]])
+
+    def test_duplicate_mmsi_is_not_reported_before_the_threshold_return(self):
+        # Ship 3 returns at fixes 3, 4, 6, 7, ...: the third return is fix 6
+        ship = self.mmsi == 3
+        for min_returns, first_duplicate in ((3, 6), (4, 7)):
+            flags = anomalies.detect_anomalies(self.mmsi, self.times, self.lats, self.lons, duplicate_min_returns=min_returns)
+            history = self.names(anomalies.ship_history(self.mmsi, flags), 3)
+            self.assertNotIn("duplicate_mmsi", history[first_duplicate - 1])
+            self.assertIn("duplicate_mmsi", history[first_duplicate])
+            self.assertEqual(self.names(flags, 3)[first_duplicate], ["duplicate_mmsi"])
+        # A ship that has not yet returned often enough keeps its teleports
+        flags = anomalies.detect_anomalies(self.mmsi[ship][:6], self.times[ship][:6], self.lats[ship][:6], self.lons[ship][:6])
+        self.assertFalse((flags & anomalies.DUPLICATE_MMSI).any())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import unittest
+import pandas as pd
+
+# The benchmark modules import the mock's modules by name, as when they are run from scripts/ais_mock
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts', 'ais_mock', 'benchmarks'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts', 'ais_mock'))
+import importlib
+synthetic_ais = importlib.import_module('synthetic_ais')
+bench_ships = importlib.import_module('bench_ships')
+ais_main = importlib.import_module('main')
+
+class TestSyntheticAIS(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_single_file_in_noaa_layout(self):
+        path = os.path.join(self.tmp.name, "ais.csv")
+        synthetic_ais.write_synthetic_ais(path, ships=20, fixes_per_hour=30, hours=2, seed=1)
+        df = pd.read_csv(path)
+        self.assertEqual(list(df.columns), synthetic_ais.NOAA_COLUMNS)
+        self.assertEqual(df["MMSI"].nunique(), 20)
+        self.assertTrue(df["BaseDateTime"].is_monotonic_increasing)
+        # Tracks are continuous: consecutive fixes of a ship are close together
+        steps = df.sort_values(["MMSI", "BaseDateTime"]).groupby("MMSI")["LAT"].diff().abs()
+        self.assertLess(steps.max(), 0.2)
+        # Same seed, same data
+        again = os.path.join(self.tmp.name, "again.csv")
+        synthetic_ais.write_synthetic_ais(again, ships=20, fixes_per_hour=30, hours=2, seed=1)
+        pd.testing.assert_frame_equal(pd.read_csv(again), df)
+        # The mock loads it without dropping rows
+        loaded = ais_main.read_and_clean_ais_csv(path)
+        self.assertEqual(len(loaded), len(df))
+
+    def test_daily_files(self):
+        paths = synthetic_ais.write_synthetic_ais(self.tmp.name, ships=5, fixes_per_hour=10, hours=4, start="2024-05-05T22:00:00", daily_files=True)
+        self.assertEqual([os.path.basename(path) for path in paths], ["AIS_2024_05_05.csv", "AIS_2024_05_06.csv"])
+        days = [pd.to_datetime(pd.read_csv(path)["BaseDateTime"]).dt.day.unique().tolist() for path in paths]
+        self.assertEqual(days, [[5], [6]])
+
+class TestBaselineComparison(unittest.TestCase):
+    def results(self, p50_ms, cold_seconds=1.0):
+        scenario = {"radius_km": 5.0, "window_minutes": 60, "tail_hours": 0.1, "p50_ms": p50_ms, "p99_ms": 20.0}
+        return {
+            "load": {"cold": {"seconds": cold_seconds, "peak_rss_mb": 100.0}, "warm": {"seconds": 0.1, "peak_rss_mb": 80.0}},
+            "queries": {"peak_rss_mb": 120.0, "scenarios": [scenario]},
+        }
+
+    def test_flags_only_regressions_beyond_threshold_and_noise(self):
+        baseline = self.results(p50_ms=10.0)
+        self.assertEqual(bench_ships.compare(self.results(p50_ms=12.0), baseline, 0.25), [])
+        self.assertEqual(bench_ships.compare(self.results(p50_ms=5.0, cold_seconds=0.5), baseline, 0.25), [])
+        regressions = bench_ships.compare(self.results(p50_ms=20.0, cold_seconds=2.0), baseline, 0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith("load.cold.seconds: 1 -> 2"))
+        self.assertIn("p50_ms: 10 -> 20 (+100%)", regressions[1])
@@ -0,0 +1,39 @@
+import os
+import unittest
+from unittest.mock import patch
+import httpx
+
+import importlib
+http_clients = importlib.import_module('temporals.base.http_clients')
+
+class TestHttpClients(unittest.IsolatedAsyncioTestCase):
+    async def test_pool_sizes_from_environment(self):
+        env = {"HTTP_MAX_CONNECTIONS": "8", "OPENAI_HTTP_MAX_CONNECTIONS": "2", "HTTP_KEEPALIVE_EXPIRY_SECONDS": "5", "HTTP2_ENABLED": "0"}
+        created = {}
+        client_class = httpx.AsyncClient
+        def record_client(**kwargs):
+            client = client_class(**kwargs)
+            created[client] = kwargs
+            return client
+        with patch.dict(os.environ, env), patch('httpx.AsyncClient', record_client):
+            clients = http_clients.HttpClients.from_env()
+        settings = {upstream: created[clients.get(upstream)] for upstream in http_clients.UPSTREAMS}
+        self.assertEqual(settings["openai"]["limits"], httpx.Limits(max_connections=2, max_keepalive_connections=10, keepalive_expiry=5.0))
+        self.assertEqual(settings["ais"]["limits"], httpx.Limits(max_connections=8, max_keepalive_connections=10, keepalive_expiry=5.0))
+        self.assertFalse(any(kwargs["http2"] for kwargs in settings.values()))
+        await clients.aclose()
+        self.assertTrue(all(client.is_closed for client in clients.clients.values()))
+
+    async def test_client_for_falls_back_to_a_one_off_client(self):
+        pooled = httpx.AsyncClient()
+        clients = http_clients.HttpClients({"ais": pooled})
+        async with http_clients.client_for(clients, "ais") as client:
+            self.assertIs(client, pooled)
+        self.assertFalse(pooled.is_closed)
+        async with http_clients.client_for(None, "ais") as client:
+            self.assertIsNot(client, pooled)
+        self.assertTrue(client.is_closed)
+        await clients.aclose()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts', 'ais_mock'))
+import importlib
+metrics = importlib.import_module('metrics')
+
+class TestExposition(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        registry = metrics.Registry()
+        histogram = registry.register(metrics.Histogram("query_seconds", "Query time.", ["stage"], buckets=(0.1, 1.0)))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, stage="scan")
+        lines = registry.render().decode().splitlines()
+        self.assertEqual(lines, [
+            "# HELP query_seconds Query time.",
+            "# TYPE query_seconds histogram",
+            'query_seconds_bucket{stage="scan",le="0.1"} 2',
+            'query_seconds_bucket{stage="scan",le="1"} 3',
+            'query_seconds_bucket{stage="scan",le="+Inf"} 4',
+            'query_seconds_sum{stage="scan"} 3.65',
+            'query_seconds_count{stage="scan"} 4',
+        ])
+        with self.assertRaises(ValueError):
+            histogram.observe(1.0, endpoint="/ships")
+
+    def test_counters_callbacks_and_label_escaping(self):
+        registry = metrics.Registry()
+        counter = registry.register(metrics.Counter("requests_total", "Requests.", ["path"]))
+        counter.inc(path='/a"b\\')
+        counter.inc(2, path='/a"b\\')
+        registry.register(metrics.CallbackMetric("pool_queries", "Pool occupancy.", lambda: {("running",): 1, ("queued",): None}, ["state"]))
+        text = registry.render().decode()
+        self.assertIn('requests_total{path="/a\\"b\\\\"} 3\n', text)
+        self.assertIn('pool_queries{state="running"} 1\n', text)
+        self.assertNotIn('state="queued"', text)
+
+    def test_server_timing(self):
+        trace = metrics.RequestTrace()
+        trace.stages.extend([("scan", 0.0015), ("encode", 0.0002)])
+        self.assertEqual(trace.server_timing(0.002), "scan;dur=1.500, encode;dur=0.200, total;dur=2.000")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import numpy as np
+
+# partitions.py imports its sibling modules by name, as when it is run from scripts/ais_mock
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts', 'ais_mock'))
+import importlib
+partitions = importlib.import_module('partitions')
+
+class TestPartitionStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        for name in ["AIS_2024_05_06.csv", "AIS_2024_05_05.csv", "AIS_2024_05_07.csv", "AIS_2024_13_01.csv", "notes.txt"]:
+            open(os.path.join(self.tmp.name, name), "w").close()
+        self.loads = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def loader(self, path):
+        self.loads.append(os.path.basename(path))
+        return None if path.endswith("07.csv") else object()
+
+    def test_find_day_files(self):
+        sources = partitions.find_day_files(self.tmp.name)
+        self.assertEqual([source.key for source in sources], ["2024-05-05", "2024-05-06", "2024-05-07"])
+        self.assertEqual(sources[0].end, np.datetime64("2024-05-06"))
+
+    def test_loads_only_overlapping_days(self):
+        store = partitions.PartitionStore(partitions.find_day_files(self.tmp.name), self.loader, max_loaded=3)
+        found = store.partitions_for(np.datetime64("2024-05-05T23:30"), np.datetime64("2024-05-06T00:30"))
+        self.assertEqual(len(found), 2)
+        self.assertEqual(self.loads, ["AIS_2024_05_05.csv", "AIS_2024_05_06.csv"])
+        # A window ending exactly at midnight does not touch the next day
+        store.partitions_for(np.datetime64("2024-05-05T23:00"), np.datetime64("2024-05-05T23:59:59"))
+        self.assertEqual(len(self.loads), 2)
+
+    def test_evicts_least_recently_used(self):
+        store = partitions.PartitionStore(partitions.find_day_files(self.tmp.name), self.loader, max_loaded=1)
+        first, second, _ = store.sources
+        store.get(first)
+        store.get(second)
+        self.assertEqual(store.loaded_keys(), ["2024-05-06"])
+        store.get(first)
+        self.assertEqual(self.loads, ["AIS_2024_05_05.csv", "AIS_2024_05_06.csv", "AIS_2024_05_05.csv"])
+
+    def test_failed_source_is_not_retried(self):
+        store = partitions.PartitionStore(partitions.find_day_files(self.tmp.name), self.loader, max_loaded=3)
+        self.assertIsNone(store.get(store.sources[2]))
+        self.assertIsNone(store.get(store.sources[2]))
+        self.assertEqual(self.loads, ["AIS_2024_05_07.csv"])
+        self.assertEqual(store.loaded_keys(), [])
+
+    def test_lookups_do_not_wait_for_a_load(self):
+        loading, release = threading.Event(), threading.Event()
+        def slow_loader(path):
+            if path.endswith("06.csv"):
+                loading.set()
+                release.wait(5)
+            return object()
+        store = partitions.PartitionStore(partitions.find_day_files(self.tmp.name), slow_loader, max_loaded=3)
+        first, second, _ = store.sources
+        store.get(first)
+        cold = threading.Thread(target=store.get, args=(second,))
+        cold.start()
+        try:
+            self.assertTrue(loading.wait(5))
+            # While the cold day parses, the loaded day and the key list (the /metrics gauge) stay available
+            start = time.perf_counter()
+            self.assertIsNotNone(store.get(first))
+            self.assertEqual(store.loaded_keys(), ["2024-05-05"])
+            self.assertLess(time.perf_counter() - start, 1)
+        finally:
+            release.set()
+            cold.join()
+        self.assertEqual(store.loaded_keys(), ["2024-05-05", "2024-05-06"])
+
+    def test_reload_adopts_unchanged_partitions(self):
+        live = partitions.PartitionStore(partitions.find_day_files(self.tmp.name), self.loader, max_loaded=3)
+        live.get(live.sources[0])
+        live.get(live.sources[1])
+        fingerprint = partitions.data_fingerprint(self.tmp.name)
+        # The 6th is rewritten and a new day appears
+        with open(os.path.join(self.tmp.name, "AIS_2024_05_06.csv"), "w") as f:
+            f.write("MMSI\n")
+        open(os.path.join(self.tmp.name, "AIS_2024_05_08.csv"), "w").close()
+        self.assertNotEqual(partitions.data_fingerprint(self.tmp.name), fingerprint)
+
+        replacement = partitions.PartitionStore(partitions.find_day_files(self.tmp.name), self.loader, max_loaded=3)
+        self.assertEqual(replacement.adopt_unchanged(live), ["2024-05-05"])
+        self.assertIs(replacement.get(replacement.sources[0]), live.get(live.sources[0]))
+        replacement.get(replacement.sources[1])
+        self.assertEqual(self.loads, ["AIS_2024_05_05.csv", "AIS_2024_05_06.csv", "AIS_2024_05_06.csv"])
+        self.assertEqual(len(replacement), 4)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import asyncio
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts', 'ais_mock'))
+import importlib
+query_pool = importlib.import_module('query_pool')
+
+class TestQueryPool(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def blocked(self):
+        self.release.wait(5)
+        return "done"
+
+    def test_runs_off_the_event_loop(self):
+        pool = query_pool.QueryPool(max_workers=2, max_queue=0, timeout_seconds=5)
+
+        async def scenario():
+            caller = threading.get_ident()
+            worker = await pool.run(threading.get_ident)
+            with self.assertRaises(ZeroDivisionError):
+                await pool.run(lambda: 1 / 0)
+            return caller, worker
+
+        caller, worker = asyncio.run(scenario())
+        self.assertNotEqual(caller, worker)
+        self.assertEqual(pool.stats()["running"], 0)
+        pool.shutdown()
+
+    def test_rejects_beyond_queue_depth(self):
+        pool = query_pool.QueryPool(max_workers=1, max_queue=1, timeout_seconds=5)
+
+        async def scenario():
+            running = asyncio.ensure_future(pool.run(self.blocked))
+            queued = asyncio.ensure_future(pool.run(self.blocked))
+            await asyncio.sleep(0.05)
+            stats = pool.stats()
+            with self.assertRaises(query_pool.QueryPoolFull):
+                await pool.run(self.blocked)
+            self.release.set()
+            return stats, await running, await queued
+
+        stats, first, second = asyncio.run(scenario())
+        self.assertEqual((stats["running"], stats["queued"]), (1, 1))
+        self.assertEqual((first, second), ("done", "done"))
+        self.assertEqual(pool.stats()["rejected"], 1)
+        pool.shutdown()
+
+    def test_timed_out_query_keeps_its_slot_until_it_finishes(self):
+        pool = query_pool.QueryPool(max_workers=1, max_queue=0, timeout_seconds=0.05)
+
+        async def scenario():
+            with self.assertRaises(query_pool.QueryTimeout):
+                await pool.run(self.blocked)
+            # The abandoned work still occupies the only worker
+            with self.assertRaises(query_pool.QueryPoolFull):
+                await pool.run(self.blocked)
+            self.release.set()
+            await asyncio.sleep(0.05)
+            return await pool.run(lambda: "free again")
+
+        self.assertEqual(asyncio.run(scenario()), "free again")
+        self.assertEqual(pool.stats()["timed_out"], 1)
+        pool.shutdown()
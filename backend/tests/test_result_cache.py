@@ -0,0 +1,45 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts', 'ais_mock'))
+import importlib
+result_cache = importlib.import_module('result_cache')
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_lru_eviction_by_entries_and_bytes(self):
+        cache = result_cache.ResultCache(max_entries=2, max_bytes=100, clock=self.clock)
+        cache.put("a", b"A", 10, ttl_seconds=60)
+        cache.put("b", b"B", 10, ttl_seconds=60)
+        self.assertEqual(cache.get("a"), b"A") # "b" is now the least recently used
+        cache.put("c", b"C", 10, ttl_seconds=60)
+        self.assertIsNone(cache.get("b"))
+        cache.put("d", b"D", 85, ttl_seconds=60)
+        # 10 + 10 + 85 bytes exceed the budget, so "a" goes too
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("d"), b"D")
+        cache.put("huge", b"H", 101, ttl_seconds=60)
+        self.assertIsNone(cache.get("huge"))
+        self.assertEqual(len(cache), 2)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"], stats["bytes"]), (2, 3, 2, 95))
+
+    def test_entries_expire(self):
+        cache = result_cache.ResultCache(max_entries=10, max_bytes=100, clock=self.clock)
+        cache.put("a", b"A", 1, ttl_seconds=5)
+        self.clock.now += 4.9
+        self.assertEqual(cache.get("a"), b"A")
+        self.clock.now += 0.1
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,63 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+# simplify.py imports its sibling modules by name, like main.py does when run from scripts/ais_mock
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts', 'ais_mock'))
+import importlib
+simplify = importlib.import_module('simplify')
+
+def reference_douglas_peucker(x, y, tolerance):
+    """The textbook recursion, one segment at a time."""
+    kept = {0, len(x) - 1}
+    stack = [(0, len(x) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        interior = np.arange(start + 1, end)
+        distances = simplify._segment_distances(x[interior], y[interior], x[start], y[start], x[end], y[end])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            point = int(interior[farthest])
+            kept.add(point)
+            stack += [(start, point), (point, end)]
+    return sorted(kept)
+
+class TestSimplify(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.tracks = [(np.cumsum(rng.normal(0, 50, n)), np.cumsum(rng.normal(0, 50, n))) for n in rng.integers(2, 300, 40)]
+        # A moored ship reports the same position over and over
+        self.tracks.append((np.full(50, 3.0), np.full(50, 4.0)))
+
+    def test_matches_reference_recursion(self):
+        for x, y in self.tracks:
+            for tolerance in (0.0, 10.0, 200.0):
+                self.assertEqual(simplify.simplify_track(x, y, tolerance).tolist(), reference_douglas_peucker(x, y, tolerance))
+
+    def test_max_points_keeps_the_most_significant_points(self):
+        # A straight run north, a sharp turn east, and a small wiggle near the end
+        x = np.array([0, 0, 0, 0, 100, 200, 205, 300], dtype=np.float64)
+        y = np.array([0, 100, 200, 300, 300, 300, 303, 300], dtype=np.float64)
+        self.assertEqual(simplify.simplify_track(x, y, 1.0).tolist(), [0, 3, 5, 6, 7])
+        # The wiggle (3m off the line) outranks point 5, which is only 2.9m off the line to the wiggle
+        self.assertEqual(simplify.simplify_track(x, y, 1.0, max_points=4).tolist(), [0, 3, 6, 7])
+        self.assertEqual(simplify.simplify_track(x, y, 1.0, max_points=3).tolist(), [0, 3, 7])
+        self.assertEqual(simplify.simplify_track(x, y, max_points=2).tolist(), [0, 7])
+        # Without a tolerance, even points exactly on the line are kept
+        self.assertEqual(simplify.simplify_track(x, y).tolist(), list(range(8)))
+        for x, y in self.tracks:
+            kept = simplify.simplify_track(x, y, max_points=10)
+            self.assertLessEqual(len(kept), 10)
+            self.assertEqual((kept[0], kept[-1]), (0, len(x) - 1))
+
+    def test_single_point_and_antimeridian(self):
+        self.assertEqual(simplify.simplify_track(np.array([1.0]), np.array([2.0])).tolist(), [0])
+        x, _ = simplify.project_equirectangular(np.array([0.0, 0.0, 0.0]), np.array([179.99, -179.99, -179.97]))
+        # 0.02 degrees apart across the antimeridian, not 359.98
+        self.assertAlmostEqual(x[1] - x[0], 2224, delta=5)
+
+if __name__ == "__main__":
+    unittest.main()
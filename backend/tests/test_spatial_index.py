@@ -0,0 +1,79 @@
+import unittest
+import numpy as np
+
+import importlib
+spatial_index = importlib.import_module('scripts.ais_mock.spatial_index')
+
+def brute_force_haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return spatial_index.EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(a))
+
+class TestGridIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.lat = rng.uniform(-89.9, 89.9, 20000)
+        self.lon = rng.uniform(-180.0, 179.999, 20000)
+        self.index = spatial_index.GridIndex(self.lat, self.lon, cell_deg=0.5)
+
+    def assert_superset_of_brute_force(self, lat, lon, radius_km):
+        expected = np.flatnonzero(brute_force_haversine(lat, lon, self.lat, self.lon) <= radius_km)
+        candidates = self.index.query(lat, lon, radius_km)
+        self.assertEqual(len(candidates), len(np.unique(candidates)))
+        self.assertTrue(np.isin(expected, candidates).all(), f"missed rows for query ({lat}, {lon}, {radius_km})")
+
+    def test_every_row_is_indexed_once(self):
+        self.assertEqual(len(self.index), len(self.lat))
+        self.assertEqual(sorted(self.index.positions.tolist()), list(range(len(self.lat))))
+
+    def test_query_matches_brute_force(self):
+        for lat, lon, radius_km in [(37.8, -122.4, 50), (0, 0, 300), (-45, 100, 1000), (10, 20, 1)]:
+            self.assert_superset_of_brute_force(lat, lon, radius_km)
+
+    def test_query_across_antimeridian(self):
+        self.assert_superset_of_brute_force(10, 179.9, 200)
+        self.assert_superset_of_brute_force(-10, -179.9, 200)
+
+    def test_query_near_pole(self):
+        self.assert_superset_of_brute_force(89.5, 0, 300)
+        self.assert_superset_of_brute_force(-89.0, 45, 500)
+
+    def test_query_prunes_distant_cells(self):
+        candidates = self.index.query(37.8, -122.4, 50)
+        self.assertLess(len(candidates), len(self.lat) // 100)
+
+    def test_query_with_key_window(self):
+        rng = np.random.default_rng(7)
+        keys = rng.integers(0, 86400, len(self.lat))
+        index = spatial_index.GridIndex(self.lat, self.lon, cell_deg=0.5, sort_key=keys)
+        all_candidates = index.query(37.8, -122.4, 500)
+        windowed = index.query(37.8, -122.4, 500, key_min=3600, key_max=7200)
+        expected = all_candidates[(keys[all_candidates] >= 3600) & (keys[all_candidates] <= 7200)]
+        self.assertEqual(sorted(windowed.tolist()), sorted(expected.tolist()))
+        # Rows inside each cell are ordered by key
+        for start, end in zip(index.cell_starts, index.cell_ends):
+            self.assertTrue((np.diff(index.keys[start:end]) >= 0).all())
+
+    def test_query_many_matches_single_queries(self):
+        keys = np.random.default_rng(3).integers(0, 86400, len(self.lat))
+        index = spatial_index.GridIndex(self.lat, self.lon, cell_deg=0.5, sort_key=keys)
+        circles = [(37.8, -122.4, 500), (38.0, -122.0, 300), (0, 0, 1), (10, 179.9, 200)]
+        positions, owners = index.query_many(*zip(*circles), key_min=3600, key_max=7200)
+        for i, (lat, lon, radius_km) in enumerate(circles):
+            single = index.query(lat, lon, radius_km, key_min=3600, key_max=7200)
+            self.assertEqual(positions[owners == i].tolist(), single.tolist())
+
+    def test_positions_in_cells_match_query(self):
+        keys = np.random.default_rng(5).integers(0, 86400, len(self.lat))
+        index = spatial_index.GridIndex(self.lat, self.lon, cell_deg=0.5, sort_key=keys)
+        cells = index.candidate_cells(37.8, -122.4, 500)
+        positions = index.positions_in_cells(cells, key_min=3600, key_max=7200)
+        self.assertEqual(sorted(positions.tolist()), sorted(index.query(37.8, -122.4, 500, key_min=3600, key_max=7200).tolist()))
+        self.assertEqual(index.positions_in_cells(cells[:0]).tolist(), [])
+
+    def test_concat_ranges(self):
+        result = spatial_index.concat_ranges(np.array([5, 0, 10]), np.array([7, 0, 13]))
+        self.assertEqual(result.tolist(), [5, 6, 10, 11, 12])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+# tails.py imports its sibling modules by name, like main.py does when run from scripts/ais_mock
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts', 'ais_mock'))
+import importlib
+tails = importlib.import_module('tails')
+
+def reference_tail(times, start, end, min_spacing):
+    """The original backwards walk over one ship's candidates."""
+    selected, last = [], None
+    for idx in range(end - 1, start - 1, -1):
+        if last is None or last - times[idx] >= min_spacing:
+            selected.append(idx)
+            last = times[idx]
+    return selected[::-1]
+
+class TestTails(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        lengths = rng.integers(0, 400, 50)
+        self.seg_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        self.seg_ends = self.seg_starts + lengths
+        # Second-resolution times with duplicates, sorted within each segment
+        self.times = np.concatenate([np.sort(rng.integers(0, 7200, n)) for n in lengths]).astype(np.int64)
+
+    def test_select_tail_rows_matches_reference_loop(self):
+        rows, counts = tails.select_tail_rows(self.times, self.seg_starts, self.seg_ends, 60)
+        expected = [reference_tail(self.times, s, e, 60) for s, e in zip(self.seg_starts, self.seg_ends)]
+        self.assertEqual(counts.tolist(), [len(tail) for tail in expected])
+        self.assertEqual(rows.tolist(), [row for tail in expected for row in tail])
+
+    def test_select_tail_rows_handles_empty_input(self):
+        rows, counts = tails.select_tail_rows(self.times, np.array([5, 9]), np.array([5, 9]), 60)
+        self.assertEqual(rows.tolist(), [])
+        self.assertEqual(counts.tolist(), [0, 0])
+
+    def test_segment_searchsorted_matches_numpy(self):
+        targets = np.full(len(self.seg_starts), 3600)
+        for side in ("left", "right"):
+            result = tails.segment_searchsorted(self.times, self.seg_starts, self.seg_ends, targets, side=side)
+            expected = [s + np.searchsorted(self.times[s:e], 3600, side=side) for s, e in zip(self.seg_starts, self.seg_ends)]
+            self.assertEqual(result.tolist(), expected)
+
+if __name__ == "__main__":
+    unittest.main()
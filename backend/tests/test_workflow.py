@@ -1,3 +1,4 @@
+import asyncio
 import sys
 import types
 import unittest
@@ -18,6 +19,7 @@ class EnrichedReportDetails(ReportDetails):
     trust_score: float = None
     ais_neighbours: list = None
     visibility: int = 1
+    enriched_description: str = None
 setattr(shared_mod, 'ReportDetails', ReportDetails)
 setattr(shared_mod, 'EnrichedReportDetails', EnrichedReportDetails)
 sys.modules['shared'] = shared_mod
@@ -31,6 +33,9 @@ temporalio_workflow_mod.defn = no_op_decorator
 temporalio_workflow_mod.run = no_op_decorator
 temporalio_workflow_mod.query = no_op_decorator
 sys.modules['temporalio.workflow'] = temporalio_workflow_mod
+temporalio_activity_mod = types.ModuleType('temporalio.activity')
+temporalio_activity_mod.defn = no_op_decorator
+sys.modules['temporalio.activity'] = temporalio_activity_mod
 # Add a dummy RetryPolicy to temporalio.common
 common_mod = types.ModuleType('temporalio.common')
 class RetryPolicy:
@@ -60,7 +65,31 @@ class TestReportDetailsWorkflow(unittest.TestCase):
         ) + 'foo\nbar'
         self.assertEqual(self.workflow.get_metrics(), expected)
 
-    # The run method is async and depends on many activities; we can only test it with heavy patching or integration tests
+class TestReportDetailsWorkflowRun(unittest.IsolatedAsyncioTestCase):
+    async def test_independent_activities_run_concurrently(self):
+        events = []
+        results = {
+            "assign_report_number": "AIS-12345", "calculate_visibility": 7, "find_ais_neighbours": ["ShipA"],
+            "calculate_trust_score": 0.7, "llm_enrich": "enriched", "convert_to_prometheus_metrics": "metric",
+        }
+        async def execute_activity(activity, arg, **kwargs):
+            name = next(name for name in results if getattr(workflow_mod, name) is activity)
+            events.append(("start", name))
+            if name == "find_ais_neighbours":
+                self.assertEqual(arg.visibility, 7)
+            await asyncio.sleep(0.01)
+            events.append(("end", name))
+            return results[name]
+        with patch.object(workflow_mod.workflow, 'execute_activity', execute_activity, create=True):
+            enriched = await workflow_mod.ReportDetailsWorkflow().run(ReportDetails(vessel_registry="stub"))
+        self.assertEqual((enriched.report_number, enriched.visibility, enriched.ais_neighbours, enriched.trust_score, enriched.enriched_description),
+                         ("AIS-12345", 7, ["ShipA"], 0.7, "enriched"))
+        started = [name for event, name in events[:events.index(("end", "calculate_visibility"))] if event == "start"]
+        # Report number and trust score do not wait for visibility; the AIS lookup does
+        self.assertEqual(set(started), {"convert_to_prometheus_metrics", "assign_report_number", "calculate_visibility", "calculate_trust_score"})
+        self.assertLess(events.index(("end", "calculate_visibility")), events.index(("start", "find_ais_neighbours")))
+        for name in ("assign_report_number", "find_ais_neighbours", "calculate_trust_score"):
+            self.assertLess(events.index(("end", name)), events.index(("start", "llm_enrich")))
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,159 @@
+# ais_cache.py
+"""
+Columnar on-disk cache of the cleaned, sorted and indexed AIS dataset.
+
+Each column is stored as its own `.npy` file so later starts can memory-map
+it instead of re-parsing the raw CSV. Categorical and string columns are
+stored as integer codes plus a fixed-width category array. Entries live in a directory named
+after the SHA-256 of the source file, so a changed source file never hits a
+stale cache.
+
+Memory-mapped entries are read-only and backed by the page cache, so any
+number of processes can attach to one entry without duplicating it;
+entry_lock() makes sure only one of them builds a missing entry.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError: # Not available on Windows: entry_lock() does not lock there
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+CACHE_FORMAT_VERSION = 4
+HASH_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def file_sha256(file_path: str) -> str:
+    """Streams the file through SHA-256 and returns the hex digest."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_entry_dir(cache_dir: str, source_hash: str) -> str:
+    return os.path.join(cache_dir, source_hash)
+
+
+@contextlib.contextmanager
+def entry_lock(cache_dir: str, source_hash: str) -> Iterator[bool]:
+    """
+    Holds an exclusive, cross-process lock for building the entry of source_hash, blocking until it is free.
+    Yields False (without locking) if the lock file cannot be created, e.g. on a read-only disk.
+    """
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        lock_file = open(os.path.join(cache_dir, f"{source_hash}.lock"), "w")
+    except OSError:
+        yield False
+        return
+    with lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _encode_column(series: pd.Series) -> Tuple[Dict[str, np.ndarray], str]:
+    """Returns the arrays to store for a column and the kind tag needed to decode them."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        # Keep pandas' own (smallest) code width, so from_codes can use the memory-mapped codes without converting them
+        return {"codes": series.cat.codes.to_numpy(), "categories": np.asarray(categories.astype(str), dtype=str)}, "category"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return {"values": series.to_numpy()}, "datetime"
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return {"values": series.to_numpy()}, "numeric"
+    # Strings (and anything else) become codes into a fixed-width unicode category array; NaN is code -1
+    codes, categories = pd.factorize(series, use_na_sentinel=True)
+    return {"codes": codes.astype(np.int32), "categories": np.asarray(categories.astype(str), dtype=str)}, "string"
+
+
+def _decode_column(arrays: Dict[str, np.ndarray], kind: str):
+    if kind in ("datetime", "numeric"):
+        return arrays["values"]
+    if kind == "category":
+        return pd.Categorical.from_codes(arrays["codes"], categories=arrays["categories"].astype(object))
+    codes = arrays["codes"]
+    categories = np.append(arrays["categories"].astype(object), np.nan)
+    # Code -1 indexes the trailing NaN
+    return categories[codes]
+
+
+def save_dataset(cache_dir: str, source_hash: str, df: pd.DataFrame, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> str:
+    """
+    Writes df's columns and the extra index arrays under cache_dir/source_hash.
+    The entry is written to a temporary directory and renamed into place, so readers never see a partial entry.
+    """
+    entry_dir = cache_entry_dir(cache_dir, source_hash)
+    tmp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for i, col in enumerate(df.columns):
+        col_arrays, kind = _encode_column(df[col])
+        for part, values in col_arrays.items():
+            np.save(os.path.join(tmp_dir, f"col{i}.{part}.npy"), values, allow_pickle=False)
+        columns.append({"name": col, "kind": kind})
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp_dir, f"arr.{name}.npy"), np.asarray(values), allow_pickle=False)
+
+    manifest = {
+        "format_version": CACHE_FORMAT_VERSION,
+        "source_hash": source_hash,
+        "rows": len(df),
+        "columns": columns,
+        "arrays": sorted(arrays),
+        "meta": meta,
+        "created_at": time.time(),
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    os.replace(tmp_dir, entry_dir)
+    return entry_dir
+
+
+def load_dataset(cache_dir: str, source_hash: str, meta: Dict[str, Any]) -> Optional[Tuple[pd.DataFrame, Dict[str, np.ndarray]]]:
+    """
+    Memory-maps a cached entry. Returns (df, arrays), or None if there is no entry
+    or it was written by a different format version or with different meta (e.g. grid cell size).
+    """
+    entry_dir = cache_entry_dir(cache_dir, source_hash)
+    manifest_path = os.path.join(entry_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != CACHE_FORMAT_VERSION or manifest.get("meta") != meta:
+        return None
+
+    def _load(name: str) -> np.ndarray:
+        return np.load(os.path.join(entry_dir, name), mmap_mode="r", allow_pickle=False)
+
+    data = {}
+    for i, column in enumerate(manifest["columns"]):
+        if column["kind"] in ("string", "category"):
+            col_arrays = {"codes": _load(f"col{i}.codes.npy"), "categories": np.load(os.path.join(entry_dir, f"col{i}.categories.npy"))}
+        else:
+            col_arrays = {"values": _load(f"col{i}.values.npy")}
+        data[column["name"]] = _decode_column(col_arrays, column["kind"])
+    # copy=False keeps the memory-mapped numeric columns backed by the cache files
+    df = pd.DataFrame(data, copy=False)
+    arrays = {name: _load(f"arr.{name}.npy") for name in manifest["arrays"]}
+    return df, arrays
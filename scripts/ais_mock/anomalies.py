@@ -0,0 +1,148 @@
+# anomalies.py
+"""
+Vectorized detection of AIS anomalies over an MMSI/time-sorted dataset.
+
+Every fix is compared with the few fixes just before it from the same MMSI,
+one lag at a time over the whole array. There is no per-ship
+or per-row Python loop. A leg between two fixes is impossible when covering
+its distance in its time would take more than `max_speed_knots`. Short hops
+(GPS jitter) are never impossible. Flags are bits of a uint8 mask:
+
+  speed_jump      the leg from the previous fix is impossible, over a
+                  distance shorter than `teleport_km`
+  teleport        the leg from the previous fix is impossible and at least
+                  `teleport_km` long
+  reporting_gap   the ship was silent for more than `gap_minutes` before
+                  this fix
+  duplicate_mmsi  the ship keeps jumping back to where it was a few fixes
+                  ago, as when two transmitters share one MMSI. Once it
+                  has, its impossible legs are flagged duplicate_mmsi
+                  instead of speed_jump or teleport. Earlier legs keep
+                  their flags, so no fix is labelled from later ones.
+
+ship_history() turns the flags of every fix into the flags seen on the ship
+so far. The server stores that column with the data, so a query reads a
+ship's anomalies from its latest record like any other column.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+KM_PER_NAUTICAL_MILE = 1.852
+MICROSECONDS_PER_HOUR = 3_600_000_000
+CHUNK_ROWS = 250_000 # Rows compared per step; bounds the temporaries to about 25 MB
+
+ANOMALY_KINDS = ("speed_jump", "teleport", "reporting_gap", "duplicate_mmsi") # Bit i of a mask is ANOMALY_KINDS[i]
+SPEED_JUMP, TELEPORT, REPORTING_GAP, DUPLICATE_MMSI = (np.uint8(1 << bit) for bit in range(len(ANOMALY_KINDS)))
+# The kind names of every possible mask, so decoding a column is a table lookup
+_MASK_NAMES = [[kind for bit, kind in enumerate(ANOMALY_KINDS) if mask >> bit & 1] for mask in range(1 << len(ANOMALY_KINDS))]
+
+
+def _haversine_km(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Great-circle distances in km between radian coordinates."""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def detect_anomalies(mmsi: np.ndarray, times: np.ndarray, lats: np.ndarray, lons: np.ndarray,
+                     max_speed_knots: float = 50.0, min_jump_km: float = 1.0, teleport_km: float = 50.0,
+                     gap_minutes: float = 60.0, duplicate_min_returns: int = 3, return_lags: int = 4) -> np.ndarray:
+    """
+    Returns the anomaly mask of every fix. Rows must be sorted by MMSI, then time. `times` are datetime64.
+
+    A fix "returns" when the leg from the previous fix is impossible, but the leg from one of the
+    `return_lags` fixes before is possible. From its `duplicate_min_returns`-th return on, an MMSI is
+    treated as shared by several transmitters; impossible legs before that stay jumps or teleports.
+    A single spoofed fix causes one return, so it is reported as a jump or a teleport.
+    """
+    n = len(mmsi)
+    flags = np.zeros(n, dtype=np.uint8)
+    if n < 2:
+        return flags
+    mmsi = np.asarray(mmsi)
+    times = np.asarray(times).astype("datetime64[us]").view(np.int64)
+    km_per_microsecond = max_speed_knots * KM_PER_NAUTICAL_MILE / MICROSECONDS_PER_HOUR
+    gap = int(gap_minutes * 60_000_000)
+    returns = np.zeros(n, dtype=bool)
+
+    for start in range(0, n, CHUNK_ROWS):
+        end = min(start + CHUNK_ROWS, n)
+        # Also read the return_lags rows before the chunk, so its first rows have predecessors
+        lo = max(start - return_lags, 0)
+        lat = np.radians(np.asarray(lats[lo:end], dtype=np.float64))
+        lon = np.radians(np.asarray(lons[lo:end], dtype=np.float64))
+        chunk_mmsi, chunk_times = mmsi[lo:end], times[lo:end]
+        head = start - lo # Chunk rows [head:] are rows [start:end]
+
+        def leg(lag: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+            """Compares each chunk row with the fix `lag` rows earlier: (same ship, distance, impossible leg, elapsed time)."""
+            same = np.zeros(len(chunk_mmsi), dtype=bool)
+            distance = np.zeros(len(chunk_mmsi))
+            same[lag:] = chunk_mmsi[lag:] == chunk_mmsi[:-lag]
+            distance[lag:] = _haversine_km(lat[:-lag], lon[:-lag], lat[lag:], lon[lag:])
+            elapsed = np.zeros(len(chunk_mmsi), dtype=np.int64)
+            elapsed[lag:] = chunk_times[lag:] - chunk_times[:-lag]
+            impossible = same & (distance > np.maximum(min_jump_km, elapsed * km_per_microsecond))
+            return same[head:], distance[head:], impossible[head:], elapsed[head:]
+
+        same, distance, impossible, elapsed = leg(1)
+        rows = slice(start, end)
+        flags[rows] |= np.where(same & (elapsed > gap), REPORTING_GAP, 0).astype(np.uint8)
+        flags[rows] |= np.where(impossible & (distance < teleport_km), SPEED_JUMP, 0).astype(np.uint8)
+        flags[rows] |= np.where(impossible & (distance >= teleport_km), TELEPORT, 0).astype(np.uint8)
+        came_back = np.zeros(end - start, dtype=bool)
+        for lag in range(2, return_lags + 1):
+            earlier_same, _, earlier_impossible, _ = leg(lag)
+            came_back |= earlier_same & ~earlier_impossible
+        returns[rows] = impossible & came_back
+
+    # Ships with repeated returns: their impossible legs are a second transmitter, not the ship moving.
+    # Counted up to each fix only, so a leg is never relabelled by returns recorded after it
+    ship_starts = np.flatnonzero(np.r_[True, mmsi[1:] != mmsi[:-1]])
+    returns_so_far = np.cumsum(returns, dtype=np.int64)
+    returns_before_ship = (returns_so_far - returns)[ship_starts]
+    returns_so_far -= np.repeat(returns_before_ship, np.diff(np.r_[ship_starts, n]))
+    duplicated = returns_so_far >= duplicate_min_returns
+    jumped = duplicated & ((flags & (SPEED_JUMP | TELEPORT)) != 0)
+    flags[jumped] = (flags[jumped] & ~(SPEED_JUMP | TELEPORT)) | DUPLICATE_MMSI
+    return flags
+
+
+def ship_history(mmsi: np.ndarray, flags: np.ndarray) -> np.ndarray:
+    """Returns, for each row, the OR of the flags of its ship's rows up to and including it (rows sorted by MMSI, then time)."""
+    n = len(flags)
+    history = np.zeros(n, dtype=np.uint8)
+    if n == 0:
+        return history
+    mmsi = np.asarray(mmsi)
+    ship_ends = np.r_[np.flatnonzero(mmsi[1:] != mmsi[:-1]) + 1, n]
+    for bit in range(len(ANOMALY_KINDS)):
+        flagged = np.flatnonzero(flags & (1 << bit))
+        if not flagged.size:
+            continue
+        # The first flagged row of each ship sets the bit up to the end of that ship's rows
+        first = flagged[np.r_[True, mmsi[flagged[1:]] != mmsi[flagged[:-1]]]]
+        ends = ship_ends[np.searchsorted(ship_ends, first, side="right")]
+        markers = np.zeros(n + 1, dtype=np.int8)
+        markers[first] = 1
+        markers[ends] -= 1
+        history[np.cumsum(markers[:-1], dtype=np.int8) > 0] |= np.uint8(1 << bit)
+    return history
+
+
+def anomaly_names(masks: Optional[np.ndarray], size: int) -> List[List[str]]:
+    """
+    Decodes masks to lists of kind names, in ANOMALY_KINDS order. A missing column (or a missing value)
+    has no anomalies. Do not modify the returned lists: equal masks share one list.
+    """
+    if masks is None:
+        return [_MASK_NAMES[0]] * size
+    masks = np.nan_to_num(np.asarray(masks, dtype=np.float64)).astype(np.uint8)
+    return [_MASK_NAMES[mask] for mask in masks.tolist()]
+
+
+def count_ships(history: np.ndarray, ship_ends: Sequence[int]) -> Dict[str, int]:
+    """Ships showing each anomaly kind, read from each ship's last row of a ship_history() column."""
+    last = np.asarray(history)[np.asarray(ship_ends, dtype=np.int64) - 1] if len(ship_ends) else np.zeros(0, dtype=np.uint8)
+    return {kind: int(np.count_nonzero(last & (1 << bit))) for bit, kind in enumerate(ANOMALY_KINDS)}
@@ -0,0 +1,280 @@
+# bench_ships.py
+"""
+Benchmark: load time, peak memory and /ships query latency of the AIS mock.
+
+Generates a synthetic dataset in the NOAA layout (see synthetic_ais.py), or
+uses --data, and then measures it in fresh processes:
+
+  cold   parse the CSV, build the indexes and write the columnar cache
+  warm   memory-map the cache, then run the query engine (the work /ships
+         does on its query pool: Steps 1-7) for every combination of
+         --radii, --windows and --tail-hours, at points sampled from the data
+
+Load time, peak RSS and latency percentiles are written to --output as
+JSON. The mock's memory budget is raised to --memory-budget-mb (default
+4096), so the default dataset, whose load peaks above the 384 MB a pod
+allows, is measured rather than refused. With --baseline, the run is compared against an earlier output file,
+and the exit status is 1 if anything got slower or larger by more than
+--max-regression.
+
+Usage (from scripts/ais_mock):
+    python benchmarks/bench_ships.py --ships 2000 --fixes-per-hour 60 --output bench_ships.json
+    python benchmarks/bench_ships.py --data AIS_2024_05_05.csv --replay-start 2024-05-05T23:00:00 --output real.json
+    python benchmarks/bench_ships.py --output new.json --baseline bench_ships.json --max-regression 0.25
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError: # Not available on Windows: peak RSS is reported as None there
+    resource = None
+
+AIS_MOCK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, AIS_MOCK_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_ais import DEFAULT_START, write_synthetic_ais  # noqa: E402
+
+RESULTS_SCHEMA_VERSION = 1
+# Differences below these floors are treated as noise when comparing against a baseline
+LATENCY_NOISE_FLOOR_MS = 2.0
+LOAD_NOISE_FLOOR_S = 0.2
+RSS_NOISE_FLOOR_MB = 8.0
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far."""
+    try:
+        # Linux: VmHWM starts afresh at exec, unlike ru_maxrss, which a spawned child inherits from its parent
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def open_dataset(data_path: str, cache_dir: str, replay_start: Optional[str]):
+    """
+    Imports the mock in this process, runs its startup and loads the partition holding the replay start;
+    returns (module, seconds taken).
+    """
+    import main as ais_main
+    ais_main.CSV_FILE_PATH = data_path
+    ais_main.CACHE_DIR = cache_dir
+    ais_main.REPLAY_START = replay_start
+    ais_main.REPLAY_STARTED_AT = None
+    start = time.perf_counter()
+    asyncio.run(ais_main.startup_event())
+    if ais_main.ais_store is None or ais_main.time_offset is None:
+        raise RuntimeError(f"The AIS mock failed to load {data_path}")
+    # Partitions load on first use; with an explicit replay start, startup itself does not touch the data
+    now = ais_main.replay_start_time.to_datetime64()
+    if not ais_main.ais_store.partitions_for(now, now):
+        raise RuntimeError(f"The AIS mock failed to load the data at {now} from {data_path}")
+    return ais_main, time.perf_counter() - start
+
+
+def percentiles_ms(samples: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p90_ms": round(float(np.percentile(values, 90)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+        "mean_ms": round(float(values.mean()), 3),
+    }
+
+
+def measure_load(data_path: str, cache_dir: str, replay_start: Optional[str]) -> Dict[str, Any]:
+    """Child process: opens the dataset and reports load time and peak RSS."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        ais_main, load_seconds = open_dataset(data_path, cache_dir, replay_start)
+        loaded = ais_main.ais_store.partitions_for(ais_main.replay_start_time.to_datetime64(), ais_main.replay_start_time.to_datetime64())
+    return {"seconds": round(load_seconds, 3), "peak_rss_mb": peak_rss_mb(), "rows": sum(len(partition) for partition in loaded)}
+
+
+def measure_queries(data_path: str, cache_dir: str, replay_start: Optional[str], radii: List[float], windows: List[int],
+                    tail_hours: List[float], queries: int, seed: int) -> Dict[str, Any]:
+    """Child process: opens the dataset, then times the query engine for every scenario."""
+    from fastapi import HTTPException
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        ais_main, load_seconds = open_dataset(data_path, cache_dir, replay_start)
+        rss_after_load = peak_rss_mb()
+        # Query points are sampled from fixes near the replay start, like enrichment requests near reported ships
+        now = ais_main.replay_start_time.to_datetime64()
+        partition = ais_main.ais_store.partitions_for(now, now)[0]
+        positions = partition.window_positions(now - np.timedelta64(max(windows), "m"), now)
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(positions, size=queries, replace=len(positions) < queries) if len(positions) else np.empty(0, dtype=np.int64)
+        lats = ais_main.widen_float32(partition.df[ais_main.LAT_COL].to_numpy()[sample]).tolist()
+        lons = ais_main.widen_float32(partition.df[ais_main.LON_COL].to_numpy()[sample]).tolist()
+
+        scenarios = []
+        for radius in radii:
+            for window in windows:
+                for tail in tail_hours:
+                    latencies, ship_counts, empty = [], [], 0
+                    for i, (lat, lon) in enumerate(zip([lats[0]] + lats, [lons[0]] + lons)):
+                        start = time.perf_counter()
+                        try:
+                            num_ships, _ = ais_main.encode_json(ais_main.find_ships, lat, lon, radius, tail, window)
+                        except HTTPException as e:
+                            if e.status_code != 404:
+                                raise
+                            num_ships = 0
+                        elapsed = time.perf_counter() - start
+                        if i == 0:
+                            continue # Warm-up query
+                        latencies.append(elapsed)
+                        ship_counts.append(num_ships)
+                        empty += num_ships == 0
+                    scenarios.append({
+                        "radius_km": radius, "window_minutes": window, "tail_hours": tail, "queries": len(latencies),
+                        **percentiles_ms(latencies),
+                        "mean_ships": round(float(np.mean(ship_counts)), 1), "empty": int(empty),
+                    })
+    return {"load_seconds": round(load_seconds, 3), "peak_rss_mb_after_load": rss_after_load, "peak_rss_mb": peak_rss_mb(), "scenarios": scenarios}
+
+
+def run_isolated(func, *args):
+    """Runs func in a fresh spawned process, so load time and peak RSS are not affected by earlier phases."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(func, *args).result()
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "orjson": importlib.util.find_spec("orjson") is not None,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Returns a description of every metric that regressed by more than max_regression (and its noise floor)."""
+    regressions = []
+
+    def check(name: str, new: Optional[float], old: Optional[float], floor: float):
+        if new is None or old is None:
+            return
+        if new > old * (1 + max_regression) and new - old > floor:
+            change = f"{(new / old - 1) * 100:+.0f}%" if old else "new"
+            regressions.append(f"{name}: {old:g} -> {new:g} ({change})")
+
+    for phase in ("cold", "warm"):
+        old_load, new_load = baseline.get("load", {}).get(phase, {}), results["load"][phase]
+        check(f"load.{phase}.seconds", new_load["seconds"], old_load.get("seconds"), LOAD_NOISE_FLOOR_S)
+        check(f"load.{phase}.peak_rss_mb", new_load["peak_rss_mb"], old_load.get("peak_rss_mb"), RSS_NOISE_FLOOR_MB)
+    check("queries.peak_rss_mb", results["queries"]["peak_rss_mb"], baseline.get("queries", {}).get("peak_rss_mb"), RSS_NOISE_FLOOR_MB)
+    old_scenarios = {
+        (s["radius_km"], s["window_minutes"], s["tail_hours"]): s for s in baseline.get("queries", {}).get("scenarios", [])
+    }
+    for scenario in results["queries"]["scenarios"]:
+        key = (scenario["radius_km"], scenario["window_minutes"], scenario["tail_hours"])
+        if key not in old_scenarios:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            check(f"radius={key[0]}km window={key[1]}min tail={key[2]}h {metric}", scenario[metric], old_scenarios[key][metric], LATENCY_NOISE_FLOOR_MS)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", help="CSV file or directory of daily files to benchmark instead of generating one.")
+    parser.add_argument("--replay-start", help="Historical time mapped to 'now' (default: one hour before the end of synthetic data).")
+    parser.add_argument("--ships", type=int, default=2000)
+    parser.add_argument("--fixes-per-hour", type=int, default=60)
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--radii", type=float, nargs="+", default=[5.0, 25.0, 100.0], help="Query radii in km.")
+    parser.add_argument("--windows", type=int, nargs="+", default=[15, 60, 120], help="sim_window_minutes values.")
+    parser.add_argument("--tail-hours", type=float, nargs="+", default=[0.1, 1.0, 24.0])
+    parser.add_argument("--queries", type=int, default=30, help="Timed queries per scenario.")
+    parser.add_argument("--memory-budget-mb", type=int, default=4096, help="AIS_MEMORY_BUDGET_MB for the measured processes.")
+    parser.add_argument("--workdir", help="Directory for generated data and the cache (default: a temporary directory).")
+    parser.add_argument("--output", default="bench_ships.json")
+    parser.add_argument("--baseline", help="Earlier --output file to compare against.")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed relative slowdown or growth (0.25 = 25%%).")
+    args = parser.parse_args()
+    # Read by the mock at import, in each spawned process
+    os.environ["AIS_MEMORY_BUDGET_MB"] = str(args.memory_budget_mb)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        cache_dir = os.path.join(workdir, "cache")
+        synthetic = None
+        data_path, replay_start = args.data, args.replay_start
+        if data_path is None:
+            data_path = os.path.join(workdir, "AIS_synthetic.csv")
+            synthetic = {"ships": args.ships, "fixes_per_hour": args.fixes_per_hour, "hours": args.hours, "seed": args.seed}
+            print(f"Generating {args.ships} ships x {args.fixes_per_hour} fixes/h x {args.hours}h into {data_path}...")
+            write_synthetic_ais(data_path, args.ships, args.fixes_per_hour, args.hours, seed=args.seed)
+            if replay_start is None:
+                replay_start = str(np.datetime64(DEFAULT_START, "s") + np.timedelta64(args.hours - 1, "h"))
+        data_bytes = sum(os.path.getsize(os.path.join(data_path, name)) for name in os.listdir(data_path)) if os.path.isdir(data_path) else os.path.getsize(data_path)
+
+        print("Measuring cold load (CSV parse + index build + cache write)...")
+        cold = run_isolated(measure_load, data_path, cache_dir, replay_start)
+        print(f"  {cold['rows']} rows in {cold['seconds']:.2f}s, peak RSS {cold['peak_rss_mb']} MB")
+        print("Measuring warm load (memory-mapped cache)...")
+        warm = run_isolated(measure_load, data_path, cache_dir, replay_start)
+        print(f"  {warm['seconds']:.2f}s, peak RSS {warm['peak_rss_mb']} MB")
+        num_scenarios = len(args.radii) * len(args.windows) * len(args.tail_hours)
+        print(f"Timing {num_scenarios} query scenarios x {args.queries} queries...")
+        queries = run_isolated(measure_queries, data_path, cache_dir, replay_start, args.radii, args.windows, args.tail_hours, args.queries, args.seed)
+        print(f"  {'radius km':>9} {'window min':>10} {'tail h':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'ships':>7}")
+        for s in queries["scenarios"]:
+            print(f"  {s['radius_km']:>9g} {s['window_minutes']:>10} {s['tail_hours']:>6g} {s['p50_ms']:>9.2f} {s['p90_ms']:>9.2f} {s['p99_ms']:>9.2f} {s['mean_ships']:>7g}")
+        print(f"  peak RSS {queries['peak_rss_mb']} MB ({queries['peak_rss_mb_after_load']} MB after load)")
+
+    results = {
+        "schema_version": RESULTS_SCHEMA_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "dataset": {"path": args.data, "synthetic": synthetic, "rows": cold["rows"], "bytes": data_bytes, "replay_start": replay_start},
+        "memory_budget_mb": args.memory_budget_mb,
+        "load": {"cold": cold, "warm": warm},
+        "queries": queries,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"REGRESSIONS against {args.baseline} (more than {args.max_regression:.0%}):")
+            for regression in regressions:
+                print(f"  {regression}")
+            raise SystemExit(1)
+        print(f"No regressions against {args.baseline} (threshold {args.max_regression:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# bench_tails.py
+"""
+Benchmark: legacy per-row tail loop vs. the vectorized batch selector in tails.py.
+
+Builds synthetic per-ship tracks, then times both implementations on the same
+ships, checks they select identical rows, and prints the speedup.
+
+Usage (from scripts/ais_mock):
+    python benchmarks/bench_tails.py --ships 100 --fixes-per-hour 120 --tail-hours 24
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tails import select_tail_rows  # noqa: E402
+
+
+def make_tracks(n_ships: int, fixes_per_hour: int, hours: float, seed: int = 0) -> pd.DataFrame:
+    """One time-sorted segment per ship, concatenated in ship order (like the MMSI-sorted frame)."""
+    rng = np.random.default_rng(seed)
+    n_fixes = int(fixes_per_hour * hours)
+    start = np.datetime64("2024-05-05T00:00:00", "us")
+    offsets_s = np.sort(rng.integers(0, int(hours * 3600), (n_ships, n_fixes)), axis=1)
+    return pd.DataFrame({
+        "MMSI": np.repeat(np.arange(n_ships), n_fixes).astype(str),
+        "BaseDateTime": start + offsets_s.ravel().astype("timedelta64[s]"),
+        "LAT": rng.uniform(30, 40, n_ships * n_fixes),
+        "LON": rng.uniform(-125, -115, n_ships * n_fixes),
+    })
+
+
+def legacy_tails(df: pd.DataFrame, seg_starts, seg_ends):
+    """The original per-row loop: iloc walk per ship, then DataFrame + iterrows to read the rows back."""
+    min_time_diff = pd.Timedelta(minutes=1)
+    selected = []
+    for start, end in zip(seg_starts, seg_ends):
+        tail_candidates_df = df.iloc[start:end]
+        selected_tail_rows = []
+        last_added_original_time = None
+        for idx in range(len(tail_candidates_df) - 1, -1, -1):
+            current_row = tail_candidates_df.iloc[idx]
+            current_original_time = current_row["BaseDateTime"]
+            if last_added_original_time is None or (last_added_original_time - current_original_time) >= min_time_diff:
+                selected_tail_rows.append(current_row)
+                last_added_original_time = current_original_time
+        selected_tail_rows.reverse()
+        selected.append([(row["LAT"], row["LON"]) for _, row in pd.DataFrame(selected_tail_rows).iterrows()])
+    return selected
+
+
+def vectorized_tails(df: pd.DataFrame, seg_starts, seg_ends):
+    times = df["BaseDateTime"].to_numpy()
+    unit = np.datetime_data(times.dtype)[0]
+    min_spacing = int(pd.Timedelta(minutes=1) / pd.Timedelta(1, unit=unit))
+    rows, counts = select_tail_rows(times.view(np.int64), seg_starts, seg_ends, min_spacing)
+    lats = df["LAT"].to_numpy()[rows].tolist()
+    lons = df["LON"].to_numpy()[rows].tolist()
+    selected, offset = [], 0
+    for count in counts.tolist():
+        selected.append(list(zip(lats[offset:offset + count], lons[offset:offset + count])))
+        offset += count
+    return selected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ships", type=int, default=100)
+    parser.add_argument("--fixes-per-hour", type=int, default=120)
+    parser.add_argument("--tail-hours", type=float, default=24.0)
+    args = parser.parse_args()
+
+    df = make_tracks(args.ships, args.fixes_per_hour, args.tail_hours)
+    per_ship = int(args.fixes_per_hour * args.tail_hours)
+    seg_starts = np.arange(args.ships) * per_ship
+    seg_ends = seg_starts + per_ship
+    print(f"{args.ships} ships x {per_ship} candidate fixes ({len(df)} rows), {args.tail_hours}h tails")
+
+    start = time.perf_counter()
+    new = vectorized_tails(df, seg_starts, seg_ends)
+    vectorized_s = time.perf_counter() - start
+    start = time.perf_counter()
+    old = legacy_tails(df, seg_starts, seg_ends)
+    legacy_s = time.perf_counter() - start
+
+    assert old == new, "vectorized tails differ from the legacy loop"
+    n_points = sum(len(tail) for tail in new)
+    print(f"  legacy loop : {legacy_s:8.3f}s")
+    print(f"  vectorized  : {vectorized_s:8.3f}s  ({n_points} tail points, {legacy_s / vectorized_s:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# synthetic_ais.py
+"""
+Synthetic AIS data in the NOAA MarineCadastre CSV layout.
+
+Ships start around a handful of harbours and follow smooth random-walk
+courses, reporting at a configurable rate with jitter, so the data has the
+clustering, track continuity and per-ship fix rates of the real files. The
+output is deterministic for a given seed and is written one hour at a
+time, so large datasets never have to fit in memory.
+
+Usage (from scripts/ais_mock):
+    python benchmarks/synthetic_ais.py --ships 2000 --fixes-per-hour 60 --hours 24 --out AIS_2024_05_05.csv
+    python benchmarks/synthetic_ais.py --ships 2000 --days 3 --out data/   # one AIS_YYYY_MM_DD.csv per day
+"""
+import argparse
+import os
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+NOAA_COLUMNS = [
+    "MMSI", "BaseDateTime", "LAT", "LON", "SOG", "COG", "Heading", "VesselName", "IMO", "CallSign",
+    "VesselType", "Status", "Length", "Width", "Draft", "Cargo", "TransceiverClass",
+]
+DEFAULT_START = "2024-05-05T00:00:00"
+# Harbour centres (lat, lon) the fleet is spread around: San Francisco Bay, LA/Long Beach, Seattle, Houston, New York
+DEFAULT_HARBOURS = [(37.80, -122.40), (33.74, -118.24), (47.60, -122.35), (29.73, -95.27), (40.67, -74.04)]
+KNOTS_TO_DEG_PER_S = 1.852 / 111.0 / 3600 # Nautical miles per hour to degrees of latitude per second
+
+
+def make_fleet(n_ships: int, harbours: List[tuple], spread_deg: float, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """Returns the static details and initial state of every ship."""
+    home = rng.integers(0, len(harbours), n_ships)
+    centres = np.asarray(harbours, dtype=np.float64)[home]
+    moored = rng.random(n_ships) < 0.3
+    return {
+        "mmsi": 200_000_000 + rng.choice(575_000_000, n_ships, replace=False),
+        "lat": centres[:, 0] + rng.normal(0, spread_deg, n_ships),
+        "lon": centres[:, 1] + rng.normal(0, spread_deg, n_ships),
+        "cog": rng.uniform(0, 360, n_ships),
+        "sog": np.where(moored, rng.uniform(0, 0.3, n_ships), rng.uniform(4, 22, n_ships)),
+        "status": np.where(moored, 5.0, 0.0),
+        "name": np.array([f"SYNTH {i}" if i % 9 else "" for i in range(n_ships)], dtype=object),
+        "imo": np.array([f"IMO{9_000_000 + i}" if i % 3 else "" for i in range(n_ships)], dtype=object),
+        "call_sign": np.array([f"S{i:05d}" for i in range(n_ships)], dtype=object),
+        "vessel_type": rng.choice([30.0, 31.0, 52.0, 60.0, 70.0, 80.0, np.nan], n_ships),
+        "length": np.round(rng.uniform(10, 330, n_ships)),
+        "width": np.round(rng.uniform(3, 48, n_ships)),
+        "draft": np.where(rng.random(n_ships) < 0.5, np.round(rng.uniform(2, 15, n_ships), 1), np.nan),
+        "cargo": rng.choice([70.0, 80.0, np.nan], n_ships),
+        "transceiver_class": np.where(rng.random(n_ships) < 0.8, "A", "B").astype(object),
+    }
+
+
+def hour_of_fixes(fleet: Dict[str, np.ndarray], hour_start: np.datetime64, fixes_per_hour: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Advances every ship through one hour and returns its fixes, in time order; updates the fleet state in place."""
+    n_ships = len(fleet["mmsi"])
+    # Each ship reports fixes_per_hour times on average, at irregular intervals
+    counts = rng.poisson(fixes_per_hour, n_ships)
+    ships = np.repeat(np.arange(n_ships), counts)
+    seconds = rng.uniform(0, 3600, len(ships))
+    order = np.lexsort((seconds, ships))
+    ships, seconds = ships[order], seconds[order]
+    first = np.ones(len(ships), dtype=bool)
+    first[1:] = ships[1:] != ships[:-1]
+    # Seconds since the ship's previous fix (or since the start of the hour)
+    elapsed = np.diff(seconds, prepend=0.0)
+    elapsed[first] = seconds[first]
+
+    ends = np.cumsum(counts)
+    starts = ends - counts
+
+    def running_sum(values):
+        """Cumulative sum restarting at every ship's first fix."""
+        total = np.cumsum(values)
+        return total - np.repeat(np.concatenate(([0.0], total))[starts], counts)
+
+    # Courses drift slowly; speeds jitter around the ship's cruising speed
+    cog = (fleet["cog"][ships] + running_sum(rng.normal(0, 2.0, len(ships)))) % 360
+    sog = np.clip(fleet["sog"][ships] + rng.normal(0, 0.3, len(ships)), 0, None)
+    step = sog * KNOTS_TO_DEG_PER_S * elapsed
+    dlat = step * np.cos(np.radians(cog))
+    dlon = step * np.sin(np.radians(cog)) / np.cos(np.radians(np.clip(fleet["lat"][ships], -80, 80)))
+    lat = np.clip(fleet["lat"][ships] + running_sum(dlat), -89.9, 89.9)
+    lon = (fleet["lon"][ships] + running_sum(dlon) + 180) % 360 - 180
+
+    moved = counts > 0
+    last = ends[moved] - 1
+    fleet["lat"][moved], fleet["lon"][moved], fleet["cog"][moved] = lat[last], lon[last], cog[last]
+
+    times = hour_start + (seconds * 1e6).astype("timedelta64[us]")
+    fixes = pd.DataFrame({
+        "MMSI": fleet["mmsi"][ships],
+        "BaseDateTime": np.datetime_as_string(times.astype("datetime64[s]"), unit="s"),
+        "LAT": np.round(lat, 5),
+        "LON": np.round(lon, 5),
+        "SOG": np.round(sog, 1),
+        "COG": np.round(cog, 1),
+        "Heading": np.where(sog > 0.5, np.round(cog), 511.0),
+        "VesselName": fleet["name"][ships],
+        "IMO": fleet["imo"][ships],
+        "CallSign": fleet["call_sign"][ships],
+        "VesselType": fleet["vessel_type"][ships],
+        "Status": fleet["status"][ships],
+        "Length": fleet["length"][ships],
+        "Width": fleet["width"][ships],
+        "Draft": fleet["draft"][ships],
+        "Cargo": fleet["cargo"][ships],
+        "TransceiverClass": fleet["transceiver_class"][ships],
+    }, columns=NOAA_COLUMNS)
+    # NOAA files are roughly in time order across ships
+    return fixes.iloc[np.argsort(times, kind="stable")]
+
+
+def write_synthetic_ais(out: str, ships: int, fixes_per_hour: int, hours: int, start: str = DEFAULT_START,
+                        seed: int = 0, spread_deg: float = 0.5, daily_files: bool = False) -> List[str]:
+    """
+    Writes hours of fixes for the given number of ships. With daily_files, out is a directory that receives one
+    AIS_YYYY_MM_DD.csv per UTC day (the layout the mock serves multi-day archives from); otherwise out is one CSV.
+    Returns the paths written.
+    """
+    rng = np.random.default_rng(seed)
+    fleet = make_fleet(ships, DEFAULT_HARBOURS, spread_deg, rng)
+    start_time = np.datetime64(start, "us")
+    if daily_files:
+        os.makedirs(out, exist_ok=True)
+    paths = []
+    for hour in range(hours):
+        hour_start = start_time + np.timedelta64(hour, "h")
+        if daily_files:
+            path = os.path.join(out, pd.Timestamp(hour_start).strftime("AIS_%Y_%m_%d.csv"))
+        else:
+            path = out
+        new_file = path not in paths
+        if new_file:
+            paths.append(path)
+        hour_of_fixes(fleet, hour_start, fixes_per_hour, rng).to_csv(path, mode="w" if new_file else "a", header=new_file, index=False)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ships", type=int, default=2000)
+    parser.add_argument("--fixes-per-hour", type=int, default=60, help="Average fixes per ship per hour.")
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--days", type=int, default=None, help="Write this many daily files into --out (a directory).")
+    parser.add_argument("--start", default=DEFAULT_START)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    hours = args.days * 24 if args.days else args.hours
+    paths = write_synthetic_ais(args.out, args.ships, args.fixes_per_hour, hours, start=args.start, seed=args.seed, daily_files=bool(args.days))
+    for path in paths:
+        print(f"Wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
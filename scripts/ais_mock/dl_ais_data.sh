@@ -1,5 +1,19 @@
-SLUG=AIS_2024_05_05.zip
+# Usage: dl_ais_data.sh [START_DATE [END_DATE [OUT_DIR]]]
+# Downloads one NOAA AIS file per day (dates as YYYY-MM-DD, default 2024-05-05) into OUT_DIR (default: current directory).
+# Point CSV_FILE_PATH at OUT_DIR to replay all downloaded days.
+START=${1:-2024-05-05}
+END=${2:-$START}
+OUT_DIR=${3:-.}
 
-curl https://coast.noaa.gov/htdata/CMSP/AISDataHandler/2024/$SLUG --output $SLUG
-unzip $SLUG
-rm $SLUG
\ No newline at end of file
+mkdir -p "$OUT_DIR"
+DAY=$START
+while [ "$(date -d "$DAY" +%s)" -le "$(date -d "$END" +%s)" ]; do
+  SLUG=AIS_$(date -d "$DAY" +%Y_%m_%d).zip
+  YEAR=$(date -d "$DAY" +%Y)
+
+  curl https://coast.noaa.gov/htdata/CMSP/AISDataHandler/$YEAR/$SLUG --output $SLUG
+  unzip -o $SLUG -d "$OUT_DIR"
+  rm $SLUG
+
+  DAY=$(date -I -d "$DAY + 1 day")
+done
@@ -1,31 +1,173 @@
 # main.py
+import asyncio
+import gc
+import multiprocessing
 import os
 import pandas as pd
 import numpy as np
-from fastapi import FastAPI, HTTPException, Query
-from pydantic import BaseModel, Field # Import Pydantic
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
+from pandas.api.types import union_categoricals
+from fastapi import FastAPI, Header, HTTPException, Path, Query
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field, create_model # Import Pydantic
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 import uvicorn
 import time # Import time module for timing
+from functools import partial
+
+import ais_cache
+from anomalies import ANOMALY_KINDS, anomaly_names, count_ships, detect_anomalies, ship_history
+from metrics import LOAD_BUCKETS, PROMETHEUS_MEDIA_TYPE, SIZE_BUCKETS, CallbackMetric, Counter, Histogram, Registry, RequestTrace
+from partitions import Partition, PartitionSource, PartitionStore, data_fingerprint, find_day_files
+from query_pool import QueryPool, QueryPoolFull, QueryTimeout
+from result_cache import ResultCache
+from serialization import (ARROW_STREAM_MEDIA_TYPE, JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, MSGPACK_MEDIA_TYPE_ALIASES, NDJSON_MEDIA_TYPE, SSE_MEDIA_TYPE, arrow_ipc_stream,
+                           binary_media_types, dumps, iso_timestamps, iter_ndjson, optional_floats, optional_ints, optional_strs, pack_msgpack, sse_event)
+from simplify import project_equirectangular, simplify_track
+from spatial_index import GridIndex, concat_ranges
+from tails import segment_searchsorted, select_tail_rows
 
 # --- Configuration ---
 # Updated CSV file path as requested
-CSV_FILE_PATH = 'AIS_2024_05_05.csv' # !!! IMPORTANT: Update this path if needed !!!
+CSV_FILE_PATH = 'AIS_2024_05_05.csv' # !!! IMPORTANT: Update this path if needed !!! A directory of daily AIS_YYYY_MM_DD.csv files is also accepted
 LAT_COL = "LAT"
 LON_COL = "LON"
 TIME_COL = "BaseDateTime" # Column for timestamp
 MMSI_COL = "MMSI"       # Column for ship identifier
+ANOMALY_COL = "Anomalies" # Added at load: bitmask of the anomalies seen on the ship up to each fix (see anomalies.py)
 
 EARTH_RADIUS_KM = 6371
+GRID_CELL_DEG = 0.1 # Spatial index cell size in degrees (~11km of latitude)
+ANOMALY_MAX_SPEED_KNOTS = float(os.getenv("AIS_ANOMALY_MAX_SPEED_KNOTS", "50")) # Moving faster than this between fixes is a speed jump
+ANOMALY_TELEPORT_KM = float(os.getenv("AIS_ANOMALY_TELEPORT_KM", "50")) # Impossible jumps at least this long are teleports
+ANOMALY_GAP_MINUTES = float(os.getenv("AIS_ANOMALY_GAP_MINUTES", "60")) # Longer silences between a ship's fixes are reporting gaps
+MAX_LOADED_DAYS = max(int(os.getenv("AIS_MAX_LOADED_DAYS", "3")), 2) # Daily partitions kept loaded at once; the least recently used are evicted. At least 2, so a query may cross midnight
+MAX_QUERY_SPAN_HOURS = 24 * (MAX_LOADED_DAYS - 1) # Longest time span (window + tails) one request may read: it touches at most MAX_LOADED_DAYS days
+REPLAY_START = os.getenv("AIS_REPLAY_START") # Historical time that maps to server start (default: the first file's last fix)
+REPLAY_STARTED_AT = os.getenv("AIS_REPLAY_STARTED_AT") # UTC wall-clock time REPLAY_START maps to (default: startup); pinned by the parent so all workers share one clock
+WORKERS = int(os.getenv("AIS_WORKERS", "1")) # More than 1 serves from N processes attached read-only to the memory-mapped cache
+MAX_BATCH_QUERIES = 500 # Upper bound on queries per /ships/batch request
+MAX_NEAREST_SHIPS = 1000 # Upper bound on k for /ships?k=
+QUERY_WORKERS = int(os.getenv("AIS_QUERY_WORKERS", "4")) # Queries computed at once, on threads off the event loop
+QUERY_QUEUE_DEPTH = int(os.getenv("AIS_QUERY_QUEUE_DEPTH", "16")) # Queries allowed to wait for a worker; more are rejected with 503
+QUERY_TIMEOUT_SECONDS = float(os.getenv("AIS_QUERY_TIMEOUT_SECONDS", "30")) # Per-request limit; slower queries get 504
+RESULT_CACHE_ENTRIES = int(os.getenv("AIS_RESULT_CACHE_ENTRIES", "1024")) # /ships responses kept in the result cache (0 disables it)
+RESULT_CACHE_MB = int(os.getenv("AIS_RESULT_CACHE_MB", "64")) # Upper bound for the cached response bodies (0 disables the cache)
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("AIS_RESULT_CACHE_TTL_SECONDS", "10")) # Simulated-time bucket; cached results are at most this stale (0 disables the cache)
+RESULT_CACHE_LATLON_DEG = float(os.getenv("AIS_RESULT_CACHE_LATLON_DEG", "0.001")) # Query points this close (~100m) share a cache entry (0 disables the cache)
+RESULT_CACHE_RADIUS_KM = float(os.getenv("AIS_RESULT_CACHE_RADIUS_KM", "0.1")) # Radius bucket width (0 disables the cache)
+RELOAD_POLL_SECONDS = float(os.getenv("AIS_RELOAD_POLL_SECONDS", "0")) # Poll CSV_FILE_PATH this often and hot-swap the data when it changes (0 disables)
+RELOAD_TRIGGER_POLL_SECONDS = 1.0 # With AIS_WORKERS > 1, how often each worker checks the shared trigger written by /admin/reload
+RELOAD_TRIGGER_FILE = "reload.trigger" # In CACHE_DIR; holds a token that changes on every /admin/reload
+SERVER_TIMING = os.getenv("AIS_SERVER_TIMING", "0") == "1" # Debug: add a per-stage Server-Timing header to /ships and /ships/batch responses
+STREAM_TICK_SECONDS = 1.0 # Default interval between /ships/stream updates
+MAX_STREAM_BACKFILL_MINUTES = 24 * 60 # How far back a stream may start (backfill or Last-Event-ID resume)
+MAX_TRACK_HOURS = min(MAX_STREAM_BACKFILL_MINUTES / 60, MAX_QUERY_SPAN_HOURS) # How far back /ships/{mmsi}/track may reach
+CACHE_DIR = '.ais_cache' # Columnar cache of the prepared dataset, keyed by source file hash (None disables it)
+
+# --- Ingestion ---
+MEMORY_BUDGET_MB = int(os.getenv("AIS_MEMORY_BUDGET_MB", "384")) # Upper bound for the load peak above the interpreter's ~130 MB (manifests limit pods to 512Mi)
+PARSE_BYTES_PER_ROW = 256 # Rough size of one raw parsed CSV row, used to size chunks
+INDEX_BYTES_PER_ROW = 33 # Time-ordered view + spatial index arrays (4 x int64 per row) + anomaly mask (uint8)
+BUILD_BYTES_PER_ROW = 64 # Temporaries next to the prepared data at the build peak: sort order, reordered column, index sorts (~54 measured)
+TIME_DTYPE = "datetime64[us]" # int64 epoch microseconds
+# Declared dtypes for the NOAA CSV columns; columns not listed are skipped
+AIS_CSV_DTYPES = {
+    MMSI_COL: "Int64", # Nullable while parsing, stored as int32
+    TIME_COL: "object", # Parsed to TIME_DTYPE per chunk
+    LAT_COL: "float32",
+    LON_COL: "float32",
+    "SOG": "float32",
+    "COG": "float32",
+    "Heading": "float32",
+    "VesselName": "category",
+    "IMO": "category",
+    "CallSign": "category",
+    "VesselType": "float32",
+    "Status": "float32",
+    "Length": "float32",
+    "Width": "float32",
+    "Draft": "float32",
+    "Cargo": "float32",
+    "TransceiverClass": "category",
+}
 
 # --- Global Variables ---
-ais_data_df: Optional[pd.DataFrame] = None # Main DataFrame for initial filtering
-# --- OPTIMIZATION: Dictionary to hold pre-grouped data by MMSI ---
-ais_data_grouped_by_mmsi: Dict[str, pd.DataFrame] = {}
-# --- End Optimization ---
-max_historical_time: Optional[pd.Timestamp] = None
+# Prepared datasets (sorted frame, per-MMSI offsets, time-ordered view, spatial index), one per source file, loaded on demand
+ais_store: Optional[PartitionStore] = None
+replay_start_time: Optional[pd.Timestamp] = None # Historical time that maps to the server's start time
 time_offset: Optional[pd.Timedelta] = None
+query_pool: Optional[QueryPool] = None # Runs the blocking /ships and /ships/batch work so the event loop stays responsive
+result_cache: Optional[ResultCache] = None # Encoded /ships responses keyed by quantized query and simulated-time bucket
+dataset_generation = 0 # Bumped on every hot swap of ais_store; part of the result cache key
+loaded_data_fingerprint: Optional[tuple] = None # data_fingerprint(CSV_FILE_PATH) when the live data was opened
+last_reload: Optional[Dict[str, Any]] = None # Report of the latest reload, shown by /health
+reload_lock: Optional[asyncio.Lock] = None # One reload at a time
+reload_watch_task: Optional[asyncio.Task] = None
+reload_trigger_seen: Optional[str] = None # Latest shared reload token this worker has acted on (AIS_WORKERS > 1)
+reload_trigger_task: Optional[asyncio.Task] = None
+
+# --- Metrics (served at /metrics in the Prometheus text format) ---
+metrics_registry = Registry()
+LOAD_STAGE_SECONDS = metrics_registry.register(Histogram("ais_load_stage_seconds", "Time spent in each data loading stage.", ["stage"], buckets=LOAD_BUCKETS))
+LOADED_ROWS = metrics_registry.register(Counter("ais_loaded_rows_total", "Prepared records loaded (parsed or memory-mapped)."))
+REQUEST_SECONDS = metrics_registry.register(Histogram("ais_request_seconds", "End-to-end request latency.", ["endpoint", "status"]))
+QUERY_STAGE_SECONDS = metrics_registry.register(Histogram("ais_query_stage_seconds", "Time spent in each query stage.", ["endpoint", "stage"]))
+QUERY_SIZES = {
+    name: metrics_registry.register(Histogram(f"ais_query_{name}", documentation, ["endpoint"], buckets=SIZE_BUCKETS))
+    for name, documentation in [
+        ("rows_scanned", "Records inside the simulated time window, per request."),
+        ("candidate_rows", "Records read from the spatial index cells near the query points, per request."),
+        ("ships_returned", "Ships in the response, per request."),
+        ("response_bytes", "Size of the encoded response body."),
+    ]
+}
+metrics_registry.register(CallbackMetric(
+    "ais_query_pool_queries", "Queries on the query pool, by state.",
+    lambda: {(state,): query_pool.stats()[state] for state in ("running", "queued")} if query_pool is not None else {}, ["state"]
+))
+metrics_registry.register(CallbackMetric(
+    "ais_query_pool_refused_total", "Queries refused because the queue was full, or abandoned after the timeout.",
+    lambda: {(reason,): query_pool.stats()[reason] for reason in ("rejected", "timed_out")} if query_pool is not None else {}, ["reason"], kind="counter"
+))
+metrics_registry.register(CallbackMetric(
+    "ais_result_cache_lookups_total", "Result cache lookups, by outcome.",
+    lambda: {("hit",): result_cache.hits, ("miss",): result_cache.misses} if result_cache is not None else {}, ["outcome"], kind="counter"
+))
+metrics_registry.register(CallbackMetric(
+    "ais_result_cache_bytes", "Size of the cached response bodies.",
+    lambda: {(): result_cache.stats()["bytes"]} if result_cache is not None else {}
+))
+RELOADS = metrics_registry.register(Counter("ais_dataset_reloads_total", "Dataset hot-swap attempts.", ["trigger", "outcome"]))
+metrics_registry.register(CallbackMetric(
+    "ais_dataset_generation", "Number of hot swaps of the dataset since startup.",
+    lambda: {(): dataset_generation}
+))
+metrics_registry.register(CallbackMetric(
+    "ais_partitions_loaded", "Data partitions currently loaded.",
+    lambda: {(): len(ais_store.loaded_keys())} if ais_store is not None else {}
+))
+
+def record_load_stage(stage: str, since: float) -> float:
+    """Records the time since `since` as a data loading stage; returns it in seconds."""
+    seconds = time.time() - since
+    LOAD_STAGE_SECONDS.observe(seconds, stage=stage)
+    return seconds
+
+def record_request(endpoint: str, trace: RequestTrace, status_code: int, total_seconds: float):
+    """Records a finished request's latency, stage timings and sizes."""
+    REQUEST_SECONDS.observe(total_seconds, endpoint=endpoint, status=str(status_code))
+    for stage, seconds in trace.stages:
+        QUERY_STAGE_SECONDS.observe(seconds, endpoint=endpoint, stage=stage)
+    for name, value in trace.sizes.items():
+        QUERY_SIZES[name].observe(value, endpoint=endpoint)
+
+def with_server_timing(headers: Optional[Dict[str, str]], trace: RequestTrace, total_seconds: float) -> Optional[Dict[str, str]]:
+    """Returns headers plus a Server-Timing stage breakdown when AIS_SERVER_TIMING is on; otherwise headers unchanged."""
+    if not SERVER_TIMING:
+        return headers
+    return {**(headers or {}), "Server-Timing": trace.server_timing(total_seconds)}
 
 # --- Pydantic Models for API Response ---
 
@@ -59,6 +201,7 @@ class ShipData(BaseModel):
     draft: Optional[float] = Field(None, description="Vessel Draft (meters).")
     cargo: Optional[str] = Field(None, description="Cargo Type code.")
     transceiver_class: Optional[str] = Field(None, description="AIS Transceiver Class.")
+    anomalies: List[str] = Field(default_factory=list, description=f"Anomalies seen on this ship since the start of its UTC day, up to its latest position; any of {list(ANOMALY_KINDS)}.")
 
     @classmethod
     def from_record(cls, record: pd.Series, tail_positions: List[Position], dist: float, simulated_time: datetime):
@@ -75,13 +218,13 @@ class ShipData(BaseModel):
                 return None
             try:
                 # Handle potential edge case where integer string needs float first
-                if target_type == int and isinstance(value, float):
+                if target_type == int and isinstance(value, (float, np.floating)):
                     if value.is_integer():
                         return int(value)
                     else:
                         return None
                 return target_type(value)
-            except (ValueError, TypeError) as e:
+            except (ValueError, TypeError):
                  return None
 
         # --- Populate data dictionary with safe conversions ---
@@ -110,6 +253,7 @@ class ShipData(BaseModel):
         data["call_sign"] = safe_convert(record.get("CallSign"), str)
         data["cargo"] = safe_convert(record.get("Cargo"), str)
         data["transceiver_class"] = safe_convert(record.get("TransceiverClass"), str)
+        data["anomalies"] = anomaly_names([record.get(ANOMALY_COL)], 1)[0]
 
         # Pydantic will perform final validation based on the model definition
         return cls(**data)
@@ -117,6 +261,142 @@ class ShipData(BaseModel):
     class Config:
         orm_mode = True
 
+SHIP_FIELDS = tuple(ShipData.model_fields) # Response fields in document order; /ships?fields= selects a subset
+# What /ships and /ships/batch actually send: ShipData with every field optional, since fields= leaves the others out
+ProjectedShipData = create_model(
+    "ProjectedShipData",
+    __doc__="A ship as returned by /ships: the ShipData fields selected with fields= (all of them by default).",
+    **{name: (Optional[field.annotation], Field(None, description=field.description)) for name, field in ShipData.model_fields.items()},
+)
+# Source column behind each field taken from the latest record (mmsi, distance_km and tail are handled separately)
+FIELD_COLUMNS = {
+    "latest_timestamp": TIME_COL, "latest_lat": LAT_COL, "latest_lon": LON_COL,
+    "sog": "SOG", "cog": "COG", "heading": "Heading", "vessel_name": "VesselName", "imo": "IMO", "call_sign": "CallSign",
+    "vessel_type": "VesselType", "status": "Status", "length": "Length", "width": "Width", "draft": "Draft",
+    "cargo": "Cargo", "transceiver_class": "TransceiverClass", "anomalies": ANOMALY_COL,
+}
+
+# Arrow column kind of every field (see serialization.arrow_ipc_stream)
+SHIP_ARROW_KINDS = {
+    "mmsi": "str", "latest_timestamp": "timestamp", "latest_lat": "float", "latest_lon": "float", "distance_km": "float", "tail": "tail",
+    "sog": "float", "cog": "float", "heading": "float", "vessel_name": "str", "imo": "str", "call_sign": "str", "vessel_type": "int",
+    "status": "int", "length": "float", "width": "float", "draft": "float", "cargo": "str", "transceiver_class": "str", "anomalies": "str_list",
+}
+
+class ShipTrack(BaseModel):
+    """A ship's recent fixes, optionally simplified."""
+    mmsi: str = Field(..., description="Maritime Mobile Service Identity (MMSI).")
+    total_points: int = Field(..., description="Fixes in the requested time range before simplification.")
+    points: List[Position] = Field(..., description="Kept fixes in time order, with simulated timestamps.")
+
+class ShipQuery(BaseModel):
+    """One radius query of a /ships/batch request."""
+    lat: float = Field(..., description="Latitude of the center point.", ge=-90.0, le=90.0)
+    lon: float = Field(..., description="Longitude of the center point.", ge=-180.0, le=180.0)
+    radius: float = Field(..., description="Search radius in kilometers.", gt=0)
+    tail_hours: float = Field(24.0, description="Duration of the ship's 'tail' in hours (default: 24).", gt=0)
+
+class ShipBatchRequest(BaseModel):
+    """Several radius queries answered against one simulated time window."""
+    queries: List[ShipQuery] = Field(..., description="Queries to answer, in order.", min_length=1, max_length=MAX_BATCH_QUERIES)
+    sim_window_minutes: int = Field(60, description="Simulation window size in minutes (how far back from 'now' to look).", gt=0)
+    fields: Optional[List[str]] = Field(None, description="ShipData fields to return for every ship (default: all). Tails are only computed when 'tail' is included.")
+
+class ShipBatchResult(BaseModel):
+    """Ships found for one query of a batch (empty if none matched)."""
+    query: ShipQuery
+    ships: List[ProjectedShipData]
+
+
+def build_ship_columns(
+    latest_records_df: pd.DataFrame,
+    simulated_times: np.ndarray,
+    tail_counts: np.ndarray,
+    tail_lats: List[float],
+    tail_lons: List[float],
+    tail_times: List[str],
+    fields: Sequence[str] = SHIP_FIELDS
+) -> Dict[str, Any]:
+    """
+    Converts the given fields (in SHIP_FIELDS order) of every row of latest_records_df to JSON-ready columns,
+    with the same conversions as ShipData.from_record. Each column is a list with one value per ship, except
+    'tail', which stays flat: (tail_counts, tail_lats, tail_lons, tail_times), tail_counts[i] points per ship.
+    """
+    size = len(latest_records_df)
+
+    def column(name: str) -> Optional[np.ndarray]:
+        return latest_records_df[name].to_numpy() if name in latest_records_df.columns else None
+
+    builders = {
+        "mmsi": lambda: [str(mmsi) for mmsi in latest_records_df[MMSI_COL].tolist()],
+        "latest_timestamp": lambda: iso_timestamps(simulated_times),
+        "latest_lat": lambda: optional_floats(column(LAT_COL), size),
+        "latest_lon": lambda: optional_floats(column(LON_COL), size),
+        "distance_km": lambda: optional_floats(column("distance_km"), size),
+        "tail": lambda: (tail_counts, tail_lats, tail_lons, tail_times),
+        "sog": lambda: optional_floats(column("SOG"), size),
+        "cog": lambda: optional_floats(column("COG"), size),
+        "heading": lambda: optional_floats(column("Heading"), size),
+        "vessel_name": lambda: optional_strs(column("VesselName"), size),
+        "imo": lambda: optional_strs(column("IMO"), size),
+        "call_sign": lambda: optional_strs(column("CallSign"), size),
+        "vessel_type": lambda: optional_ints(column("VesselType"), size),
+        "status": lambda: optional_ints(column("Status"), size),
+        "length": lambda: optional_floats(column("Length"), size),
+        "width": lambda: optional_floats(column("Width"), size),
+        "draft": lambda: optional_floats(column("Draft"), size),
+        "cargo": lambda: optional_strs(column("Cargo"), size),
+        "transceiver_class": lambda: optional_strs(column("TransceiverClass"), size),
+        "anomalies": lambda: anomaly_names(column(ANOMALY_COL), size),
+    }
+    return {name: builder() for name, builder in builders.items() if name in fields}
+
+
+def build_ship_payload(
+    latest_records_df: pd.DataFrame,
+    simulated_times: np.ndarray,
+    tail_counts: np.ndarray,
+    tail_lats: List[float],
+    tail_lons: List[float],
+    tail_times: List[str],
+    fields: Sequence[str] = SHIP_FIELDS
+) -> List[Dict[str, Any]]:
+    """
+    Column-wise equivalent of ShipData.from_record for every row of latest_records_df: returns
+    JSON-ready dicts with the same fields, order and conversions, without per-row pandas access
+    or pydantic validation. Tails are given as flat lists, tail_counts[i] points per ship.
+    Only the given fields (in SHIP_FIELDS order) are built; the tail arguments are unused without 'tail'.
+    """
+    columns = build_ship_columns(latest_records_df, simulated_times, tail_counts, tail_lats, tail_lons, tail_times, fields)
+    if "tail" in columns:
+        tail_points = [
+            {"lat": tail_lat, "lon": tail_lon, "timestamp": tail_time}
+            for tail_lat, tail_lon, tail_time in zip(tail_lats, tail_lons, tail_times)
+        ]
+        tail_bounds = np.concatenate(([0], np.cumsum(tail_counts))).tolist()
+        columns["tail"] = [tail_points[start:end] for start, end in zip(tail_bounds[:-1], tail_bounds[1:])]
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())] if names else [{} for _ in range(len(latest_records_df))]
+
+
+def parse_fields(fields: Optional[Sequence[str]]) -> Tuple[str, ...]:
+    """
+    Returns the requested response fields in SHIP_FIELDS order; each entry may hold several comma-separated names.
+    None selects every field. Unknown or missing names raise HTTPException(422).
+    """
+    if fields is None:
+        return SHIP_FIELDS
+    requested = {name.strip() for entry in fields for name in entry.split(",") if name.strip()}
+    unknown = sorted(requested - set(SHIP_FIELDS))
+    if unknown or not requested:
+        raise HTTPException(status_code=422, detail=f"Unknown or missing fields {unknown}; choose from {list(SHIP_FIELDS)}.")
+    return tuple(name for name in SHIP_FIELDS if name in requested)
+
+
+def columns_for_fields(fields: Sequence[str]) -> List[str]:
+    """Source columns needed to build the given fields (MMSI and time are always needed for aggregation and tails)."""
+    return [MMSI_COL, TIME_COL] + sorted({FIELD_COLUMNS[name] for name in fields if name in FIELD_COLUMNS} - {MMSI_COL, TIME_COL})
+
 
 # --- Helper Functions ---
 
@@ -130,10 +410,202 @@ def haversine(lat1: float, lon1: float, lat2: pd.Series, lon2: pd.Series) -> pd.
     distance_km = EARTH_RADIUS_KM * c
     return distance_km
 
-def load_and_prepare_ais_data(file_path: str) -> Optional[pd.DataFrame]:
-    """Loads, cleans, sorts, pre-groups, and prepares AIS data."""
-    # Make sure we modify the global variables
-    global max_historical_time, time_offset, ais_data_grouped_by_mmsi
+def widen_float32(values: np.ndarray) -> np.ndarray:
+    """
+    Widens float32 values to float64 using their shortest round-tripping decimal, so a stored 5.6f
+    is returned as 5.6 rather than 5.599999904632568. Other dtypes are simply cast to float64.
+    """
+    values = np.asarray(values)
+    if values.dtype != np.float32:
+        return values.astype(np.float64)
+    wide = values.astype(np.float64)
+    result = wide.copy()
+    pending = np.isfinite(wide) & (wide != 0)
+    magnitude = np.floor(np.log10(np.abs(wide, where=pending, out=np.ones_like(wide))))
+    # float32 needs at most 9 significant digits; anything with <= 6 is already exact at 6
+    for digits in range(6, 10):
+        idx = np.flatnonzero(pending)
+        if not idx.size:
+            break
+        decimals = digits - 1 - magnitude[idx]
+        candidates = wide[idx]
+        rounded = np.empty_like(candidates)
+        frac = decimals >= 0
+        scale = 10.0 ** decimals[frac]
+        rounded[frac] = np.round(candidates[frac] * scale) / scale
+        scale = 10.0 ** -decimals[~frac]
+        rounded[~frac] = np.round(candidates[~frac] / scale) * scale
+        round_trips = rounded.astype(np.float32) == values[idx]
+        result[idx[round_trips]] = rounded[round_trips]
+        pending[idx[round_trips]] = False
+    return result
+
+def _is_memory_mapped(values: np.ndarray) -> bool:
+    while values is not None:
+        if isinstance(values, np.memmap):
+            return True
+        values = getattr(values, "base", None)
+    return False
+
+def report_memory_footprint(df: pd.DataFrame, arrays: Dict[str, np.ndarray]):
+    """Prints the footprint of every column and index array (memory-mapped ones are backed by the cache files)."""
+    print("LOAD: Memory footprint per column:")
+    total_bytes = 0
+    for col in df.columns:
+        nbytes = int(df[col].memory_usage(index=False, deep=True))
+        total_bytes += nbytes
+        # Categoricals are backed by their codes array; everything else by its values
+        backing = df[col].array.codes if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].to_numpy()
+        mapped = " (memory-mapped)" if _is_memory_mapped(backing) else ""
+        print(f"LOAD:   {col:<18} {str(df[col].dtype):<18} {nbytes / 1e6:10.2f} MB{mapped}")
+    for name, values in arrays.items():
+        total_bytes += values.nbytes
+        mapped = " (memory-mapped)" if _is_memory_mapped(values) else ""
+        print(f"LOAD:   [{name}]{'':<{max(16 - len(name), 0)}} {str(values.dtype):<{max(18 - max(len(name) - 16, 0), 1)}} {values.nbytes / 1e6:10.2f} MB{mapped}")
+    print(f"LOAD:   {'TOTAL':<37} {total_bytes / 1e6:10.2f} MB (prepared data; the {MEMORY_BUDGET_MB} MB budget bounds the build peak)")
+
+def parse_chunk_rows() -> int:
+    """Rows parsed per CSV chunk: a tenth of the budget. Raw chunks hold unparsed time strings, so they are much wider than prepared rows."""
+    return max(10_000, int(MEMORY_BUDGET_MB * 1024 * 1024 * 0.1 // PARSE_BYTES_PER_ROW))
+
+def estimate_build_peak_bytes(prepared_bytes: int, rows: int) -> int:
+    """Peak memory of preparing `rows` rows whose columns and indexes take prepared_bytes: the data, the build temporaries and one raw chunk."""
+    return prepared_bytes + rows * BUILD_BYTES_PER_ROW + parse_chunk_rows() * PARSE_BYTES_PER_ROW
+
+def read_and_clean_ais_csv(file_path: str) -> Optional[pd.DataFrame]:
+    """
+    Streams the raw AIS CSV in chunks with declared dtypes, cleans each chunk, and sorts the result by MMSI and time.
+    Returns None if essential columns are missing, nothing valid remains, or preparing the data would peak above MEMORY_BUDGET_MB.
+    """
+    read_start = time.time()
+    header = pd.read_csv(file_path, nrows=0).columns
+    essential_cols = [MMSI_COL, TIME_COL, LAT_COL, LON_COL]
+    missing_cols = [col for col in essential_cols if col not in header]
+    if missing_cols:
+        print(f"LOAD ERROR: Missing essential columns in CSV: {missing_cols}")
+        return None
+    usecols = [col for col in header if col in AIS_CSV_DTYPES]
+    budget_bytes = MEMORY_BUDGET_MB * 1024 * 1024
+    chunk_rows = parse_chunk_rows()
+    print(f"LOAD: Streaming CSV in chunks of {chunk_rows} rows (memory budget {MEMORY_BUDGET_MB} MB)...")
+
+    chunk_columns: Dict[str, list] = {col: [] for col in usecols}
+    total_rows = 0
+    kept_rows = 0
+    kept_bytes = 0
+    peak_bytes = estimate_build_peak_bytes(0, 0)
+    reader = pd.read_csv(file_path, usecols=usecols, dtype={col: AIS_CSV_DTYPES[col] for col in usecols}, chunksize=chunk_rows)
+    for chunk in reader:
+        total_rows += len(chunk)
+        # --- Data Cleaning and Type Conversion (per chunk) ---
+        chunk[TIME_COL] = pd.to_datetime(chunk[TIME_COL], errors='coerce', format='ISO8601')
+        # MMSIs are 9 digits; anything else cannot be stored as int32 and is not a valid MMSI
+        valid = chunk[TIME_COL].notna() & chunk[LAT_COL].notna() & chunk[LON_COL].notna()
+        valid &= chunk[MMSI_COL].notna() & chunk[MMSI_COL].between(0, 999_999_999)
+        chunk = chunk[valid.to_numpy(dtype=bool)]
+        for col in usecols:
+            if col == MMSI_COL:
+                chunk_columns[col].append(chunk[col].to_numpy(dtype=np.int32))
+            elif col == TIME_COL:
+                chunk_columns[col].append(chunk[col].to_numpy().astype(TIME_DTYPE))
+            else:
+                chunk_columns[col].append(chunk[col].array if AIS_CSV_DTYPES[col] == "category" else chunk[col].to_numpy())
+        kept_rows += len(chunk)
+        kept_bytes += int(chunk.memory_usage(index=False, deep=True).sum())
+        # The budget covers the build peak, not just what is kept: sorting and indexing hold temporaries next to the columns
+        peak_bytes = estimate_build_peak_bytes(kept_bytes + kept_rows * INDEX_BYTES_PER_ROW, kept_rows)
+        if peak_bytes > budget_bytes:
+            print(f"LOAD ERROR: Preparing the dataset would exceed the {MEMORY_BUDGET_MB} MB memory budget after {kept_rows} rows (estimated peak {peak_bytes / 1e6:.0f} MB). Raise AIS_MEMORY_BUDGET_MB or use a smaller file.")
+            return None
+    read_seconds = record_load_stage("read_csv", read_start)
+    print(f"LOAD: Successfully streamed {total_rows} records. (Took {read_seconds:.2f}s; estimated build peak {peak_bytes / 1e6:.0f} MB of the {MEMORY_BUDGET_MB} MB budget)")
+    if total_rows > kept_rows:
+        print(f"LOAD: Dropped {total_rows - kept_rows} rows due to invalid '{MMSI_COL}', '{TIME_COL}' or LAT/LON values.")
+    if kept_rows == 0:
+        print("LOAD ERROR: No valid records remaining after cleaning.")
+        return None
+
+    # --- Assemble and Sort Columns ---
+    sort_start = time.time()
+    print(f"LOAD: Sorting data by '{MMSI_COL}' and '{TIME_COL}'...")
+    columns = {}
+    for col in usecols:
+        parts = chunk_columns.pop(col)
+        if AIS_CSV_DTYPES[col] == "category":
+            columns[col] = union_categoricals(parts)
+        else:
+            columns[col] = np.concatenate(parts)
+    order = np.lexsort((columns[TIME_COL], columns[MMSI_COL]))
+    # Reorder one column at a time so peak memory stays near one extra column
+    for col in usecols:
+        columns[col] = columns[col][order]
+    df = pd.DataFrame(columns, copy=False)
+    sort_seconds = record_load_stage("sort", sort_start)
+    print(f"LOAD: Sorting complete. (Took {sort_seconds:.2f}s)")
+    return df
+
+def build_mmsi_offsets(mmsi_values: np.ndarray):
+    """Returns (keys, starts, ends): each distinct MMSI of the sorted column and its [start, end) row range."""
+    if len(mmsi_values) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return mmsi_values[:0], empty, empty
+    starts = np.flatnonzero(np.r_[True, mmsi_values[1:] != mmsi_values[:-1]])
+    ends = np.append(starts[1:], len(mmsi_values))
+    return mmsi_values[starts], starts, ends
+
+def build_partition(df: pd.DataFrame) -> Partition:
+    """Pre-groups, time-orders and spatially indexes a cleaned, MMSI/time-sorted frame."""
+    # --- OPTIMIZATION: Pre-group data by MMSI as offsets into the sorted frame ---
+    group_start = time.time()
+    print(f"LOAD: Pre-grouping data by {MMSI_COL} (offset arrays)...")
+    mmsi_keys, mmsi_starts, mmsi_ends = build_mmsi_offsets(df[MMSI_COL].to_numpy())
+    group_seconds = record_load_stage("mmsi_offsets", group_start)
+    print(f"LOAD: Pre-grouping complete. Indexed {len(mmsi_keys)} ships. (Took {group_seconds:.2f}s)")
+    # --- End Optimization ---
+
+    # --- Build Time-Ordered View ---
+    time_index_start = time.time()
+    print(f"LOAD: Building time-ordered view on '{TIME_COL}'...")
+    times = df[TIME_COL].to_numpy()
+    time_order = np.argsort(times, kind="stable")
+    sorted_times = times[time_order]
+    time_index_seconds = record_load_stage("time_index", time_index_start)
+    print(f"LOAD: Time-ordered view complete. (Took {time_index_seconds:.2f}s)")
+
+    # --- Build Spatial Index ---
+    index_start = time.time()
+    print(f"LOAD: Building spatial grid index ({GRID_CELL_DEG} deg cells, time-ordered within cells)...")
+    spatial_index = GridIndex(df[LAT_COL].to_numpy(), df[LON_COL].to_numpy(), cell_deg=GRID_CELL_DEG, sort_key=times)
+    index_seconds = record_load_stage("spatial_index", index_start)
+    print(f"LOAD: Spatial index complete. {len(spatial_index.cells)} occupied cells. (Took {index_seconds:.2f}s)")
+
+    # --- Detect Anomalies ---
+    anomaly_start = time.time()
+    print(f"LOAD: Detecting anomalies (speed above {ANOMALY_MAX_SPEED_KNOTS} kn, teleports from {ANOMALY_TELEPORT_KM} km, gaps over {ANOMALY_GAP_MINUTES} min, shared MMSIs)...")
+    mmsi_values = df[MMSI_COL].to_numpy()
+    flags = detect_anomalies(mmsi_values, times, df[LAT_COL].to_numpy(), df[LON_COL].to_numpy(), max_speed_knots=ANOMALY_MAX_SPEED_KNOTS,
+                             teleport_km=ANOMALY_TELEPORT_KM, gap_minutes=ANOMALY_GAP_MINUTES)
+    df[ANOMALY_COL] = ship_history(mmsi_values, flags)
+    anomaly_seconds = record_load_stage("anomalies", anomaly_start)
+    print(f"LOAD: Anomaly detection complete. Flagged {int(np.count_nonzero(flags))} fixes. (Took {anomaly_seconds:.2f}s)")
+    return Partition(df, mmsi_keys, mmsi_starts, mmsi_ends, time_order, sorted_times, spatial_index)
+
+def load_cached_partition(source_hash: str, cache_meta: Dict[str, Any]) -> Optional[Partition]:
+    """Memory-maps the cache entry of source_hash read-only, or returns None if there is no valid entry."""
+    cache_start = time.time()
+    cached = ais_cache.load_dataset(CACHE_DIR, source_hash, cache_meta)
+    if cached is None:
+        return None
+    df, cached_arrays = cached
+    cache_seconds = record_load_stage("cache_load", cache_start)
+    print(f"LOAD: Memory-mapped {len(df)} prepared records and indexes from cache {ais_cache.cache_entry_dir(CACHE_DIR, source_hash)}. (Took {cache_seconds:.2f}s)")
+    return Partition.from_arrays(df, cached_arrays, cell_deg=GRID_CELL_DEG)
+
+def load_and_prepare_ais_data(file_path: str) -> Optional[Partition]:
+    """
+    Loads (from the columnar cache when possible), cleans, sorts, pre-groups and indexes one AIS CSV file.
+    With the cache enabled, the result is always the memory-mapped cache entry, so processes loading the same file share its pages.
+    """
     print(f"LOAD: Attempting to load AIS data from: {file_path}")
     load_start = time.time()
     if not os.path.exists(file_path):
@@ -141,93 +613,51 @@ def load_and_prepare_ais_data(file_path: str) -> Optional[pd.DataFrame]:
         return None
 
     try:
-        # Read CSV
-        df = pd.read_csv(file_path, low_memory=False)
-        print(f"LOAD: Successfully loaded {len(df)} records. (Took {time.time() - load_start:.2f}s)")
-        prep_start = time.time()
-
-        # --- Data Cleaning and Type Conversion ---
-        print("LOAD: Starting data cleaning and type conversion...")
-        essential_cols = [MMSI_COL, TIME_COL, LAT_COL, LON_COL]
-        missing_cols = [col for col in essential_cols if col not in df.columns]
-        if missing_cols:
-            print(f"LOAD ERROR: Missing essential columns in CSV: {missing_cols}")
-            return None
-
-        # Convert Time Column
-        df[TIME_COL] = pd.to_datetime(df[TIME_COL], errors='coerce')
-        initial_rows = len(df)
-        df.dropna(subset=[TIME_COL], inplace=True)
-        if len(df) < initial_rows:
-             print(f"LOAD: Dropped {initial_rows - len(df)} rows due to invalid '{TIME_COL}' values.")
-
-        # Convert Lat/Lon Columns
-        df[LAT_COL] = pd.to_numeric(df[LAT_COL], errors='coerce')
-        df[LON_COL] = pd.to_numeric(df[LON_COL], errors='coerce')
-        initial_rows = len(df)
-        df.dropna(subset=[LAT_COL, LON_COL], inplace=True)
-        if len(df) < initial_rows:
-             print(f"LOAD: Dropped {initial_rows - len(df)} rows due to invalid LAT/LON values.")
-
-        # Convert MMSI to string
-        df[MMSI_COL] = df[MMSI_COL].astype(str)
-
-        # Convert known numeric columns to numeric, coercing errors.
-        numeric_cols = ["SOG", "COG", "Heading", "Length", "Width", "Draft", "VesselType", "Status"]
-        for col in numeric_cols:
-             if col in df.columns:
-                 df[col] = pd.to_numeric(df[col], errors='coerce')
-
-        # Convert known string columns to string type in DataFrame.
-        string_cols = ["IMO", "CallSign", "VesselName", "TransceiverClass", "Cargo"]
-        for col in string_cols:
-            if col in df.columns:
-                df[col] = df[col].fillna('').astype(str).replace('', np.nan)
-
-        if df.empty:
-            print("LOAD ERROR: No valid records remaining after cleaning.")
-            return None
-        print(f"LOAD: Cleaning and type conversion finished. (Took {time.time() - prep_start:.2f}s)")
-
-        # --- Sort Data ---
-        sort_start = time.time()
-        print(f"LOAD: Sorting data by '{MMSI_COL}' and '{TIME_COL}'...")
-        df.sort_values(by=[MMSI_COL, TIME_COL], inplace=True, ascending=True)
-        # No need to reset index here if we group right after
-        print(f"LOAD: Sorting complete. (Took {time.time() - sort_start:.2f}s)")
-
-        # --- OPTIMIZATION: Pre-group data by MMSI ---
-        group_start = time.time()
-        print(f"LOAD: Pre-grouping data by {MMSI_COL}...")
-        # Use a dictionary comprehension for potentially better performance
-        ais_data_grouped_by_mmsi = {
-            mmsi: group_df.reset_index(drop=True) # Reset index within each group
-            for mmsi, group_df in df.groupby(MMSI_COL, sort=False) # sort=False since df is already sorted
-        }
-        num_groups = len(ais_data_grouped_by_mmsi)
-        print(f"LOAD: Pre-grouping complete. Created {num_groups} groups. (Took {time.time() - group_start:.2f}s)")
-        # --- End Optimization ---
-
-        # --- Calculate Time Offset ---
-        offset_start = time.time()
-        # Calculate max time from the original df before it's potentially modified/discarded
-        max_historical_time = df[TIME_COL].max()
-        if pd.isna(max_historical_time):
-             print("LOAD ERROR: Could not determine maximum historical timestamp after cleaning.")
-             # Clean up potentially large intermediate df before returning None
-             del df
-             ais_data_grouped_by_mmsi = {}
-             return None
-
-        current_utc_time = pd.Timestamp.utcnow().tz_localize(None)
-        time_offset = current_utc_time - max_historical_time
-        print(f"LOAD: Max historical timestamp: {max_historical_time}")
-        print(f"LOAD: Current UTC time: {current_utc_time}")
-        print(f"LOAD: Calculated time offset: {time_offset}. (Took {time.time() - offset_start:.2f}s)")
-
-        print(f"LOAD: Data loading and preparation complete. Total time: {time.time() - load_start:.2f}s")
-        # Return the main DataFrame as it's still needed for initial filtering
-        return df
+        if not CACHE_DIR:
+            df = read_and_clean_ais_csv(file_path)
+            if df is None:
+                return None
+            partition = build_partition(df)
+        else:
+            # --- Check Columnar Cache ---
+            hash_start = time.time()
+            source_hash = ais_cache.file_sha256(file_path)
+            # Entries built with other settings hold a different index or anomaly column
+            cache_meta = {"grid_cell_deg": GRID_CELL_DEG, "anomaly_max_speed_knots": ANOMALY_MAX_SPEED_KNOTS,
+                          "anomaly_teleport_km": ANOMALY_TELEPORT_KM, "anomaly_gap_minutes": ANOMALY_GAP_MINUTES}
+            hash_seconds = record_load_stage("source_hash", hash_start)
+            print(f"LOAD: Source file hash {source_hash[:12]}... (Took {hash_seconds:.2f}s)")
+            partition = load_cached_partition(source_hash, cache_meta)
+            if partition is None:
+                with ais_cache.entry_lock(CACHE_DIR, source_hash) as locked:
+                    # Sibling worker processes may have built the entry while we waited for the lock
+                    partition = load_cached_partition(source_hash, cache_meta) if locked else None
+                    if partition is None:
+                        df = read_and_clean_ais_csv(file_path)
+                        if df is None:
+                            return None
+                        partition = build_partition(df)
+
+                        # --- Write Columnar Cache ---
+                        cache_start = time.time()
+                        try:
+                            entry_dir = ais_cache.save_dataset(CACHE_DIR, source_hash, df, partition.to_arrays(), cache_meta)
+                            cache_seconds = record_load_stage("cache_save", cache_start)
+                            print(f"LOAD: Wrote columnar cache to {entry_dir}. (Took {cache_seconds:.2f}s)")
+                            # Serve from the shared mapping rather than this process's private copy
+                            partition = load_cached_partition(source_hash, cache_meta) or partition
+                        except OSError as e:
+                            # A read-only or full disk should not stop the API from serving
+                            print(f"LOAD WARNING: Could not write columnar cache: {e}")
+
+        print(f"LOAD: Records span {partition.min_time} to {partition.max_time}.")
+        report_memory_footprint(partition.df, partition.to_arrays())
+        ships_flagged = count_ships(partition.df[ANOMALY_COL].to_numpy(), partition.mmsi_ends)
+        print(f"LOAD: Ships with anomalies: {', '.join(f'{kind} {count}' for kind, count in ships_flagged.items())} (of {len(partition.mmsi_keys)}).")
+        LOADED_ROWS.inc(len(partition))
+        load_seconds = record_load_stage("total", load_start)
+        print(f"LOAD: Data loading and preparation complete. Total time: {load_seconds:.2f}s")
+        return partition
 
     except FileNotFoundError:
         print(f"LOAD ERROR: File not found at {file_path}")
@@ -241,6 +671,386 @@ def load_and_prepare_ais_data(file_path: str) -> Optional[pd.DataFrame]:
         traceback.print_exc()
         return None
 
+def open_ais_store(data_path: str) -> Optional[PartitionStore]:
+    """
+    Opens a single CSV file, or a directory of daily AIS_YYYY_MM_DD.csv partitions. Nothing is loaded yet:
+    partitions are loaded when a query's time range first touches them.
+    """
+    if os.path.isdir(data_path):
+        sources = find_day_files(data_path)
+        if not sources:
+            print(f"LOAD ERROR: No AIS_YYYY_MM_DD.csv files found in {data_path}")
+            return None
+        print(f"LOAD: Found {len(sources)} daily partitions in {data_path} ({sources[0].key} to {sources[-1].key}). Keeping at most {MAX_LOADED_DAYS} loaded.")
+        return PartitionStore(sources, load_and_prepare_ais_data, max_loaded=MAX_LOADED_DAYS)
+    if not os.path.exists(data_path):
+        print(f"LOAD ERROR: CSV file not found at {data_path}")
+        return None
+    return PartitionStore([PartitionSource("all", data_path)], load_and_prepare_ais_data, max_loaded=1)
+
+def find_replay_start(store: PartitionStore) -> Optional[pd.Timestamp]:
+    """Returns AIS_REPLAY_START if set, else the last fix of the first partition (the whole file for a single CSV)."""
+    if REPLAY_START:
+        return pd.Timestamp(REPLAY_START)
+    first_partition = store.get(store.sources[0])
+    if first_partition is None:
+        return None
+    return pd.Timestamp(first_partition.max_time)
+
+
+def _warm_shared_cache() -> Optional[str]:
+    """Loads the startup partition (building its cache entry if needed) and returns the replay start as ISO text."""
+    store = open_ais_store(CSV_FILE_PATH)
+    replay_start = find_replay_start(store) if store is not None else None
+    return replay_start.isoformat() if replay_start is not None else None
+
+def prepare_shared_dataset() -> bool:
+    """
+    Runs in the parent process before workers start: builds the cache entry of the startup partition once,
+    and pins the replay clock in the environment so every worker computes the same time offset.
+    """
+    # Parse in a short-lived child so the supervising parent does not keep the parser's heap for its lifetime
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        replay_start = pool.submit(_warm_shared_cache).result()
+    if replay_start is None:
+        return False
+    os.environ["AIS_REPLAY_START"] = replay_start
+    os.environ["AIS_REPLAY_STARTED_AT"] = pd.Timestamp.utcnow().tz_localize(None).isoformat()
+    return True
+
+# --- Query Stages (shared by /ships and /ships/batch) ---
+# Rows are addressed as (partition id, row position) pairs: part_ids index the request's list of partitions
+
+def check_query_span(sim_window_minutes: int, tail_hours: float, fields: Sequence[str]):
+    """
+    Raises HTTPException(422) when the window plus the tails (if requested) span more than MAX_QUERY_SPAN_HOURS.
+    A request holds every daily partition it reads until it finishes, so this bounds memory however long the archive is.
+    """
+    span_hours = sim_window_minutes / 60 + (tail_hours if "tail" in fields else 0)
+    if span_hours > MAX_QUERY_SPAN_HOURS:
+        raise HTTPException(status_code=422, detail=f"sim_window_minutes and tail_hours together span {span_hours:g} hours; at most {MAX_QUERY_SPAN_HOURS} are allowed.")
+
+def simulated_time_window(sim_window_minutes: int):
+    """Returns the (start, end) historical timestamps matching the last sim_window_minutes of simulated time."""
+    current_utc_time = pd.Timestamp.utcnow().tz_localize(None)
+    simulated_window_end = current_utc_time
+    simulated_window_start = simulated_window_end - pd.Timedelta(minutes=sim_window_minutes)
+    return simulated_window_start - time_offset, simulated_window_end - time_offset
+
+def gather_column(partitions: List[Partition], part_ids: np.ndarray, positions: np.ndarray, col: str) -> np.ndarray:
+    """Returns partitions[part_ids[i]].df[col] at positions[i] for every i (numeric and datetime columns)."""
+    if len(partitions) == 1:
+        return partitions[0].df[col].to_numpy()[positions]
+    values = np.empty(len(positions), dtype=partitions[0].df[col].dtype)
+    for part_id, partition in enumerate(partitions):
+        in_partition = part_ids == part_id
+        values[in_partition] = partition.df[col].to_numpy()[positions[in_partition]]
+    return values
+
+def gather_rows(partitions: List[Partition], part_ids: np.ndarray, positions: np.ndarray, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Returns the given rows (and columns, default all; absent ones are skipped) of all partitions as one frame, in the given order."""
+    by_partition = np.argsort(part_ids, kind="stable")
+
+    def column_indexer(df: pd.DataFrame):
+        return slice(None) if columns is None else [df.columns.get_loc(col) for col in columns if col in df.columns]
+
+    frames = [
+        partition.df.iloc[positions[by_partition][part_ids[by_partition] == part_id], column_indexer(partition.df)]
+        for part_id, partition in enumerate(partitions)
+    ]
+    frames = [frame for frame in frames if len(frame)] or frames[:1]
+    rows = frames[0].reset_index(drop=True) if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    return rows.iloc[np.argsort(by_partition)].reset_index(drop=True)
+
+def find_records_within_radius(partitions: List[Partition], lats: np.ndarray, lons: np.ndarray, radii: np.ndarray, target_start_time: pd.Timestamp, target_end_time: pd.Timestamp):
+    """
+    Probes each partition's spatial index once for all query circles, restricted to the time window, and keeps the rows within each radius.
+    Returns (part_ids, positions, query_ids, distances, candidate_count).
+    """
+    hits = []
+    candidate_count = 0
+    for part_id, partition in enumerate(partitions):
+        # Each nearby cell is time-ordered, so the index binary-searches it down to the time window
+        candidate_positions, candidate_queries = partition.spatial_index.query_many(
+            lats, lons, radii,
+            key_min=target_start_time.to_datetime64(),
+            key_max=target_end_time.to_datetime64()
+        )
+        candidate_count += len(candidate_positions)
+        distances = haversine(
+            lats[candidate_queries], lons[candidate_queries],
+            widen_float32(partition.df[LAT_COL].to_numpy()[candidate_positions]),
+            widen_float32(partition.df[LON_COL].to_numpy()[candidate_positions])
+        )
+        within_radius_idx = distances <= radii[candidate_queries]
+        hits.append((
+            np.full(int(within_radius_idx.sum()), part_id), candidate_positions[within_radius_idx],
+            candidate_queries[within_radius_idx], distances[within_radius_idx]
+        ))
+    if not hits:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, np.empty(0), 0
+    part_ids, positions, query_ids, distances = (np.concatenate(parts) for parts in zip(*hits))
+    return part_ids, positions, query_ids, distances, candidate_count
+
+def latest_fix_until(partitions: List[Partition], mmsis: np.ndarray, until: np.datetime64):
+    """
+    Looks up every given ship's latest fix at or before `until` (equal times keep the earliest row, like idxmax).
+    Each ship's rows are one time-sorted slice of its partition, so this is a binary search per ship rather than a scan.
+    Returns (part_ids, positions); ships without such a fix get -1 for both.
+    """
+    part_ids = np.full(len(mmsis), -1, dtype=np.int64)
+    positions = np.full(len(mmsis), -1, dtype=np.int64)
+    latest_times = np.full(len(mmsis), np.iinfo(np.int64).min, dtype=np.int64)
+    until = np.full(len(mmsis), np.datetime64(until, "us").astype(np.int64))
+    for part_id, partition in enumerate(partitions):
+        time_values = partition.df[TIME_COL].to_numpy().view(np.int64)
+        ship_starts, ship_ends = partition.lookup_mmsi_rows(mmsis)
+        last = segment_searchsorted(time_values, ship_starts, ship_ends, until, side="right") - 1
+        # Partitions are in time order; a later partition only wins with a strictly later fix
+        newer = last >= ship_starts
+        newer[newer] = time_values[last[newer]] > latest_times[newer]
+        latest_times[newer] = time_values[last[newer]]
+        part_ids[newer] = part_id
+        positions[newer] = segment_searchsorted(time_values, ship_starts[newer], ship_ends[newer], latest_times[newer], side="left")
+    return part_ids, positions
+
+def latest_record_per_ship(partitions: List[Partition], part_ids: np.ndarray, positions: np.ndarray, query_ids: np.ndarray, distances: np.ndarray, target_end_time: pd.Timestamp, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    Returns the latest record of every ship for every query, sorted by query then MMSI, with
+    'distance_km' and 'query_id' columns added and float32 columns widened for the response.
+    The matched rows must be every row within the query radii between the window start and target_end_time.
+    Only the given source columns are gathered (default all).
+    """
+    mmsis = gather_column(partitions, part_ids, positions, MMSI_COL)
+    ship_codes, ship_mmsis = pd.factorize(mmsis)
+    # Usually a ship's latest fix of the whole window is also its latest matched one: look it up instead of sorting
+    latest_parts, latest_positions = latest_fix_until(partitions, ship_mmsis, target_end_time.to_datetime64())
+    is_latest_fix = (part_ids == latest_parts[ship_codes]) & (positions == latest_positions[ship_codes])
+    group_keys = query_ids * len(ship_mmsis) + ship_codes
+    resolved = np.zeros((int(query_ids.max()) + 1 if len(query_ids) else 0) * len(ship_mmsis), dtype=bool)
+    resolved[group_keys[is_latest_fix]] = True
+
+    # Ships whose latest fix lies outside the radius (they left the area) fall back to sorting their matched rows:
+    # newest first within each (query, MMSI) group; equal times keep the earliest row, like idxmax
+    unresolved = np.flatnonzero(~resolved[group_keys])
+    order = unresolved[np.lexsort((positions[unresolved], part_ids[unresolved], -gather_column(partitions, part_ids[unresolved], positions[unresolved], TIME_COL).view(np.int64), ship_codes[unresolved], query_ids[unresolved]))]
+    group_first = np.ones(len(order), dtype=bool)
+    group_first[1:] = (query_ids[order][1:] != query_ids[order][:-1]) | (ship_codes[order][1:] != ship_codes[order][:-1])
+
+    latest = np.concatenate((np.flatnonzero(is_latest_fix), order[group_first]))
+    latest = latest[np.lexsort((mmsis[latest], query_ids[latest]))]
+    return gather_latest_records(partitions, part_ids[latest], positions[latest], query_ids[latest], distances[latest], columns)
+
+def gather_latest_records(partitions: List[Partition], part_ids: np.ndarray, positions: np.ndarray, query_ids: np.ndarray, distances: np.ndarray, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Gathers the given latest records in order, widens float32 columns for the response and adds 'distance_km' and 'query_id'."""
+    latest_records_df = gather_rows(partitions, part_ids, positions, columns)
+    # Columns are stored as float32; widen them to the decimals they were read from before building the response
+    for col in latest_records_df.columns:
+        if latest_records_df[col].dtype == np.float32:
+            latest_records_df[col] = widen_float32(latest_records_df[col].to_numpy())
+    latest_records_df["distance_km"] = distances
+    latest_records_df["query_id"] = query_ids
+    return latest_records_df
+
+def find_nearest_ships(partitions: List[Partition], lat: float, lon: float, k: int, max_radius: Optional[float], target_start_time: pd.Timestamp, target_end_time: pd.Timestamp, columns: Optional[Sequence[str]] = None):
+    """
+    Finds the k ships whose latest fix in the time window is nearest to (lat, lon), no farther than max_radius (None: anywhere).
+    The search radius starts at one grid cell and doubles until k ships have their latest fix inside it. Each step reads only
+    the time-window rows of index cells it has not read yet, so a dense area is answered from a few cells and the whole
+    window is only read when fewer than k ships are in it.
+    Returns (latest_records_df sorted by distance, then MMSI; candidate_count; searched radius in km).
+    """
+    limit = np.pi * EARTH_RADIUS_KM if max_radius is None else min(float(max_radius), np.pi * EARTH_RADIUS_KM) # Beyond the antipode is everywhere
+    key_min, key_max = target_start_time.to_datetime64(), target_end_time.to_datetime64()
+    visited = [np.empty(0, dtype=np.int64) for _ in partitions] # Index cells read so far, per partition
+    found_mmsis = np.empty(0, dtype=np.int32)
+    found_parts = found_positions = np.empty(0, dtype=np.int64)
+    found_distances = np.empty(0)
+    candidate_count = 0
+    radius = min(GRID_CELL_DEG * np.pi / 180 * EARTH_RADIUS_KM, limit)
+    while True:
+        # Ships with a fix in the newly covered cells; a ship's latest fix may lie elsewhere, so it is looked up separately
+        new_mmsis = []
+        for part_id, partition in enumerate(partitions):
+            cells = partition.spatial_index.candidate_cells(lat, lon, radius)
+            cells = cells[~np.isin(cells, visited[part_id])]
+            visited[part_id] = np.concatenate((visited[part_id], cells))
+            cell_positions = partition.spatial_index.positions_in_cells(cells, key_min=key_min, key_max=key_max)
+            candidate_count += len(cell_positions)
+            new_mmsis.append(partition.df[MMSI_COL].to_numpy()[cell_positions])
+        new_mmsis = np.setdiff1d(np.concatenate(new_mmsis), found_mmsis) if new_mmsis else found_mmsis[:0]
+        if len(new_mmsis):
+            # A ship with any fix in the window has its latest fix up to the window end inside the window too
+            latest_parts, latest_positions = latest_fix_until(partitions, new_mmsis, key_max)
+            distances = haversine(
+                lat, lon,
+                widen_float32(gather_column(partitions, latest_parts, latest_positions, LAT_COL)),
+                widen_float32(gather_column(partitions, latest_parts, latest_positions, LON_COL))
+            )
+            found_mmsis = np.concatenate((found_mmsis, new_mmsis))
+            found_parts = np.concatenate((found_parts, latest_parts))
+            found_positions = np.concatenate((found_positions, latest_positions))
+            found_distances = np.concatenate((found_distances, distances))
+        # Every fix within `radius` has been read, so the ships found that close are all the ships that close
+        if np.count_nonzero(found_distances <= radius) >= k or radius >= limit:
+            break
+        radius = min(radius * 2, limit)
+
+    within = np.flatnonzero(found_distances <= radius)
+    nearest = within[np.lexsort((found_mmsis[within], found_distances[within]))][:k]
+    latest_records_df = gather_latest_records(
+        partitions, found_parts[nearest], found_positions[nearest], np.zeros(len(nearest), dtype=np.int64), found_distances[nearest], columns
+    )
+    return latest_records_df, candidate_count, radius
+
+def select_ship_tails(latest_records_df: pd.DataFrame, tail_hours: np.ndarray, store: PartitionStore):
+    """
+    Selects the tail of every row of latest_records_df in one vectorized batch; tail_hours holds one duration per row.
+    Tails may reach back into earlier partitions of store (the one the request started on), which are loaded as needed.
+    Returns (tail_counts, tail_lats, tail_lons, tail_sim_times, candidate_count).
+    """
+    num_ships = len(latest_records_df)
+    min_time_diff = int(pd.Timedelta(minutes=1) / pd.Timedelta(1, unit=np.datetime_data(TIME_DTYPE)[0])) # Minimum time difference for tail points
+    latest_original_times = latest_records_df[TIME_COL].to_numpy().astype(TIME_DTYPE)
+    tail_durations = pd.to_timedelta(np.asarray(tail_hours, dtype=np.float64), unit="h").to_numpy()
+    tail_start_times = (latest_original_times - tail_durations).astype(TIME_DTYPE)
+    partitions = store.partitions_for(tail_start_times.min(), latest_original_times.max()) if num_ships else []
+
+    # Candidate rows of each partition: every ship's rows are one contiguous, time-ordered slice
+    mmsis = latest_records_df[MMSI_COL].to_numpy()
+    candidates = []
+    for part_id, partition in enumerate(partitions):
+        time_values = partition.df[TIME_COL].to_numpy().view(np.int64)
+        ship_starts, ship_ends = partition.lookup_mmsi_rows(mmsis)
+        tail_starts = segment_searchsorted(time_values, ship_starts, ship_ends, tail_start_times.view(np.int64), side="left")
+        tail_ends = segment_searchsorted(time_values, ship_starts, ship_ends, latest_original_times.view(np.int64), side="right")
+        candidates.append((
+            np.full(int((tail_ends - tail_starts).sum()), part_id), concat_ranges(tail_starts, tail_ends),
+            np.repeat(np.arange(num_ships), tail_ends - tail_starts)
+        ))
+    if candidates:
+        cand_parts, cand_positions, cand_ships = (np.concatenate(parts) for parts in zip(*candidates))
+    else:
+        cand_parts = cand_positions = cand_ships = np.empty(0, dtype=np.int64)
+    # Group by ship; partitions are in time order and lexsort is stable, so each ship's candidates stay time-ordered
+    order = np.lexsort((cand_parts, cand_ships))
+    cand_parts, cand_positions, cand_ships = cand_parts[order], cand_positions[order], cand_ships[order]
+    cand_times = gather_column(partitions, cand_parts, cand_positions, TIME_COL) if partitions else np.empty(0, dtype=TIME_DTYPE)
+    seg_ends = np.cumsum(np.bincount(cand_ships, minlength=num_ships))
+    seg_starts = seg_ends - np.bincount(cand_ships, minlength=num_ships)
+
+    # Select points at least 1 minute apart, walking back from each ship's latest point
+    tail_rows, tail_counts = select_tail_rows(cand_times.view(np.int64), seg_starts, seg_ends, min_time_diff)
+    if not len(tail_rows):
+        return tail_counts, [], [], [], len(cand_positions)
+    tail_parts, tail_positions = cand_parts[tail_rows], cand_positions[tail_rows]
+    tail_lats = widen_float32(gather_column(partitions, tail_parts, tail_positions, LAT_COL)).tolist()
+    tail_lons = widen_float32(gather_column(partitions, tail_parts, tail_positions, LON_COL)).tolist()
+    tail_sim_times = iso_timestamps(cand_times[tail_rows] + time_offset.to_timedelta64())
+    return tail_counts, tail_lats, tail_lons, tail_sim_times, len(cand_positions)
+
+def build_ships_for_queries(store: PartitionStore, partitions: List[Partition], part_ids: np.ndarray, positions: np.ndarray, query_ids: np.ndarray, distances: np.ndarray, target_end_time: pd.Timestamp, tail_hours: np.ndarray, num_queries: int, fields: Sequence[str] = SHIP_FIELDS):
+    """Runs aggregation, tail selection and payload building for all queries at once; returns one list of ship dicts per query."""
+    latest_records_df = latest_record_per_ship(partitions, part_ids, positions, query_ids, distances, target_end_time, columns_for_fields(fields))
+    row_queries = latest_records_df["query_id"].to_numpy()
+    if "tail" in fields:
+        tail_counts, tail_lats, tail_lons, tail_sim_times, _ = select_ship_tails(latest_records_df, tail_hours[row_queries], store)
+    else:
+        tail_counts, tail_lats, tail_lons, tail_sim_times = np.zeros(len(latest_records_df), dtype=np.int64), [], [], []
+    ships = build_ship_payload(
+        latest_records_df,
+        simulated_times=latest_records_df[TIME_COL].to_numpy() + time_offset.to_timedelta64(),
+        tail_counts=tail_counts,
+        tail_lats=tail_lats,
+        tail_lons=tail_lons,
+        tail_times=tail_sim_times,
+        fields=fields
+    )
+    # Rows are sorted by query, so each query's ships are one contiguous run
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(row_queries, minlength=num_queries)))).tolist()
+    return [ships[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+def fixes_in_box(after: np.datetime64, until: np.datetime64, min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> List[Dict[str, Any]]:
+    """
+    Returns every fix with after < time <= until inside the box, in time order, as JSON-ready dicts with simulated
+    timestamps. A box with min_lon > max_lon crosses the antimeridian.
+    """
+    partitions = ais_store.partitions_for(after, until)
+    hits = []
+    for part_id, partition in enumerate(partitions):
+        # The time-ordered view yields just the new rows, so a tick costs O(new fixes) rather than O(box)
+        positions = partition.window_positions(after, until)
+        lats = widen_float32(partition.df[LAT_COL].to_numpy()[positions])
+        lons = widen_float32(partition.df[LON_COL].to_numpy()[positions])
+        in_lon = (lons >= min_lon) & (lons <= max_lon) if min_lon <= max_lon else (lons >= min_lon) | (lons <= max_lon)
+        inside = (lats >= min_lat) & (lats <= max_lat) & in_lon
+        hits.append((np.full(int(inside.sum()), part_id), positions[inside]))
+    if not hits or not sum(len(positions) for _, positions in hits):
+        return []
+    part_ids, positions = (np.concatenate(parts) for parts in zip(*hits))
+    size = len(positions)
+
+    def column(name: str) -> Optional[np.ndarray]:
+        if name not in partitions[0].df.columns:
+            return None
+        return widen_float32(gather_column(partitions, part_ids, positions, name))
+
+    fields = {
+        "mmsi": [str(mmsi) for mmsi in gather_column(partitions, part_ids, positions, MMSI_COL).tolist()],
+        "timestamp": iso_timestamps(gather_column(partitions, part_ids, positions, TIME_COL) + time_offset.to_timedelta64()),
+        "lat": optional_floats(column(LAT_COL), size),
+        "lon": optional_floats(column(LON_COL), size),
+        "sog": optional_floats(column("SOG"), size),
+        "cog": optional_floats(column("COG"), size),
+        "heading": optional_floats(column("Heading"), size),
+    }
+    names = list(fields)
+    return [dict(zip(names, values)) for values in zip(*fields.values())]
+
+def simulated_now_historical() -> np.datetime64:
+    """Returns the historical timestamp that the simulated clock currently shows."""
+    return (pd.Timestamp.utcnow().tz_localize(None) - time_offset).to_datetime64().astype(TIME_DTYPE)
+
+def parse_last_event_id(last_event_id: str, earliest: np.datetime64, now: np.datetime64) -> Optional[np.datetime64]:
+    """Returns the time a Last-Event-ID (microseconds since the epoch) resumes after, clamped to [earliest, now]; None if it is not a valid time."""
+    try:
+        resumed = np.datetime64(int(last_event_id.strip()), "us")
+    except (ValueError, OverflowError):
+        return None
+    if np.isnat(resumed):
+        return None
+    return min(max(resumed, earliest), now)
+
+async def ship_position_events(box, after: np.datetime64, tick_seconds: float, max_ticks: Optional[int]):
+    """
+    Yields one 'positions' server-sent event per tick with the fixes recorded in the box since the previous tick
+    (a keepalive comment when there are none). Event ids are the tick's historical time in microseconds, for resuming.
+    """
+    ticks = 0
+    try:
+        while True:
+            until = simulated_now_historical()
+            try:
+                # The gathers, and loading a day the tick reaches, run on the query pool rather than the event loop
+                fixes = await query_pool.run(fixes_in_box, after, until, *box)
+            except (QueryPoolFull, QueryTimeout) as e:
+                # Headers are sent, so the stream cannot fail with 503/504; the next tick picks up these fixes
+                print(f"STREAM: Tick skipped for box {box}: {e}")
+                fixes, until = None, after
+            if fixes:
+                payload = {"simulated_time": iso_timestamps(np.array([until + time_offset.to_timedelta64()]))[0], "fixes": fixes}
+                yield sse_event("positions", payload, event_id=str(until.astype(np.int64)))
+            else:
+                yield b": keepalive\n\n"
+            after = max(after, until)
+            ticks += 1
+            if max_ticks is not None and ticks >= max_ticks:
+                return
+            await asyncio.sleep(tick_seconds)
+    finally:
+        print(f"--- Stream Closed: sent {ticks} ticks for box {box} ---")
+
 
 # --- FastAPI Application Setup ---
 app = FastAPI(
@@ -250,193 +1060,740 @@ app = FastAPI(
 )
 
 # --- Load Data on Application Startup ---
+# --- Hot Swap of the Dataset ---
+
+def process_memory_mb() -> Dict[str, Optional[float]]:
+    """Resident (VmRSS) and peak resident (VmHWM) memory of this process in MB, from /proc/self/status; None elsewhere."""
+    memory = {"rss_mb": None, "peak_rss_mb": None}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    memory["rss_mb" if line.startswith("VmRSS:") else "peak_rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return memory
+
+def reset_peak_memory() -> bool:
+    """Resets VmHWM to the current RSS (Linux), so the next reading is the peak from now on; False if that is not possible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def anchor_replay_clock(replay_start: pd.Timestamp):
+    """Maps replay_start to the current (or pinned) UTC time, which fixes the simulated clock."""
+    global replay_start_time, time_offset
+    current_utc_time = pd.Timestamp(REPLAY_STARTED_AT) if REPLAY_STARTED_AT else pd.Timestamp.utcnow().tz_localize(None)
+    replay_start_time = replay_start
+    time_offset = current_utc_time - replay_start
+    print(f"STARTUP: Replay start (historical time mapped to now): {replay_start_time}")
+    print(f"STARTUP: Current UTC time: {current_utc_time}")
+    print(f"STARTUP: Calculated time offset: {time_offset}")
+
+def build_replacement_store(live_store: Optional[PartitionStore]):
+    """
+    Opens CSV_FILE_PATH again next to the live store, which keeps serving meanwhile. Partitions whose files are
+    unchanged are adopted from the live store; the rest of what it had loaded, and the partitions holding the
+    current simulated time, are loaded now so the swap itself is instant.
+    Returns (store, replay_start, fingerprint, report): store is None if the new data cannot be served, replay_start is only
+    set when the clock still has to be anchored, and fingerprint is data_fingerprint(CSV_FILE_PATH) from before the files were read.
+    """
+    reload_start = time.time()
+    memory_before = process_memory_mb()
+    peak_from_reload_start = reset_peak_memory()
+    fingerprint = data_fingerprint(CSV_FILE_PATH)
+    store = open_ais_store(CSV_FILE_PATH)
+    adopted, replay_start = [], None
+    if store is not None:
+        adopted = store.adopt_unchanged(live_store) if live_store is not None else []
+        wanted = set(live_store.loaded_keys()) if live_store is not None else set()
+        failed = [source.key for source in store.sources if source.key in wanted and store.get(source) is None]
+        if time_offset is None:
+            # Startup found no data; the first good reload anchors the clock as startup would have
+            replay_start = find_replay_start(store)
+            ready = replay_start is not None
+        else:
+            now = simulated_now_historical()
+            ready = not failed and (bool(store.partitions_for(now, now)) or not any(source.overlaps(now, now) for source in store.sources))
+        if not ready:
+            print(f"RELOAD ERROR: New data could not be loaded (failed partitions: {failed or 'startup partition'}).")
+            store = None
+    memory_after = process_memory_mb()
+    report = {
+        "status": "swapped" if store is not None else "failed",
+        "partitions": len(store) if store is not None else 0,
+        "adopted": adopted,
+        "loaded": [key for key in store.loaded_keys() if key not in adopted] if store is not None else [],
+        "seconds": round(record_load_stage("reload", reload_start), 3),
+        "rss_before_mb": memory_before["rss_mb"],
+        "rss_after_build_mb": memory_after["rss_mb"],
+        # With the reset, the peak covers just the build, while both datasets were held
+        "peak_rss_mb": memory_after["peak_rss_mb"],
+        "peak_rss_scope": "reload" if peak_from_reload_start else "process",
+    }
+    return store, replay_start, fingerprint, report
+
+async def reload_dataset(trigger: str) -> Dict[str, Any]:
+    """
+    Builds a replacement dataset off the event loop and swaps it in with a single assignment. New requests see the new
+    store; requests already running finish on the store they started with, whose partitions stay alive until then.
+    The simulated clock is not moved. Returns the reload report (also kept for /health).
+    """
+    global ais_store, dataset_generation, loaded_data_fingerprint, last_reload
+    async with reload_lock:
+        print(f"RELOAD: Building a replacement for the live dataset from {CSV_FILE_PATH} (trigger: {trigger})...")
+        store, replay_start, fingerprint, report = await asyncio.to_thread(build_replacement_store, ais_store)
+        # Not retried until the files change again, even if this attempt failed
+        loaded_data_fingerprint = fingerprint
+        if store is not None:
+            if time_offset is None:
+                anchor_replay_clock(replay_start)
+            ais_store = store
+            dataset_generation += 1
+            # Pandas frames hold reference cycles: collect now so the old partitions go once the last request using them ends,
+            # not at some later reload that would then hold three datasets
+            await asyncio.to_thread(gc.collect)
+        report.update(trigger=trigger, generation=dataset_generation, finished_at=pd.Timestamp.utcnow().tz_localize(None).isoformat(),
+                      rss_after_swap_mb=process_memory_mb()["rss_mb"])
+        last_reload = report
+        RELOADS.inc(trigger=trigger, outcome=report["status"])
+        print(f"RELOAD: {report['status']} in {report['seconds']:.2f}s (generation {dataset_generation}; adopted {report['adopted']}, loaded {report['loaded']}). "
+              f"RSS {report['rss_before_mb']} MB before, {report['rss_after_build_mb']} MB with both datasets, {report['rss_after_swap_mb']} MB after the swap; "
+              f"peak {report['peak_rss_mb']} MB (since {'reload start' if report['peak_rss_scope'] == 'reload' else 'process start'}).")
+        return report
+
+async def watch_data_path(poll_seconds: float):
+    """
+    Polls CSV_FILE_PATH and hot-swaps the data when it changes. A change must look the same on two polls in a row,
+    so files still being written are not loaded.
+    """
+    previous = loaded_data_fingerprint
+    while True:
+        await asyncio.sleep(poll_seconds)
+        try:
+            current = await asyncio.to_thread(data_fingerprint, CSV_FILE_PATH)
+            if current != loaded_data_fingerprint and current == previous and not reload_lock.locked():
+                await reload_dataset("file-watch")
+            previous = current
+        except Exception as e:
+            print(f"RELOAD ERROR: File watch failed: {e}")
+
+def read_reload_trigger() -> Optional[str]:
+    """Returns the current shared reload token, or None if no reload has been requested."""
+    try:
+        with open(os.path.join(CACHE_DIR, RELOAD_TRIGGER_FILE)) as f:
+            return f.read()
+    except OSError:
+        return None
+
+def write_reload_trigger() -> str:
+    """Writes a new shared reload token (atomically, so no worker reads half of it) and returns it."""
+    token = f"{os.getpid()}-{time.time_ns()}"
+    path = os.path.join(CACHE_DIR, RELOAD_TRIGGER_FILE)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(f"{path}.tmp-{os.getpid()}", "w") as f:
+        f.write(token)
+    os.replace(f"{path}.tmp-{os.getpid()}", path)
+    return token
+
+async def watch_reload_trigger(poll_seconds: float):
+    """
+    With several workers, /admin/reload reaches only the one that accepts the request. That worker writes a new token
+    to the shared trigger file, and every other worker reloads when it sees the token change.
+    """
+    global reload_trigger_seen
+    while True:
+        await asyncio.sleep(poll_seconds)
+        try:
+            token = await asyncio.to_thread(read_reload_trigger)
+            if token is not None and token != reload_trigger_seen:
+                reload_trigger_seen = token
+                # Waits for a reload already running here, so the request is not lost
+                await reload_dataset("admin")
+        except Exception as e:
+            print(f"RELOAD ERROR: Reload trigger watch failed: {e}")
+
 @app.on_event("startup")
 async def startup_event():
-    """Load and prepare the AIS data when the FastAPI application starts."""
-    # Make sure we assign to the global df variable
-    global ais_data_df
+    """Open the AIS data (loading the first partition) and anchor the simulated clock when the FastAPI application starts."""
+    # Make sure we assign to the global variables
+    global ais_store, query_pool, result_cache, loaded_data_fingerprint, reload_lock, reload_watch_task, reload_trigger_seen, reload_trigger_task
     print("="*20 + " Application Startup " + "="*20)
     startup_start = time.time()
-    # Load data and perform pre-grouping
-    ais_data_df = load_and_prepare_ais_data(CSV_FILE_PATH)
-    if ais_data_df is None or not ais_data_grouped_by_mmsi:
+    query_pool = QueryPool(QUERY_WORKERS, QUERY_QUEUE_DEPTH, QUERY_TIMEOUT_SECONDS)
+    print(f"STARTUP: Query pool: {QUERY_WORKERS} workers, queue depth {QUERY_QUEUE_DEPTH}, timeout {QUERY_TIMEOUT_SECONDS:g}s")
+    result_cache = create_result_cache()
+    reload_lock = asyncio.Lock()
+    loaded_data_fingerprint = data_fingerprint(CSV_FILE_PATH)
+    ais_store = open_ais_store(CSV_FILE_PATH)
+    replay_start = find_replay_start(ais_store) if ais_store is not None else None
+    if replay_start is None:
         print("STARTUP FATAL: Failed to load or pre-group AIS data. API endpoints will likely fail.")
-        # Ensure ais_data_df is None if loading failed
-        ais_data_df = None
+        # Ensure the store is None if loading failed
+        ais_store = None
     else:
-        print(f"STARTUP SUCCESS: AIS data ({len(ais_data_df)} records) loaded and pre-grouped ({len(ais_data_grouped_by_mmsi)} ships). (Took {time.time() - startup_start:.2f}s)")
+        # --- Calculate Time Offset ---
+        anchor_replay_clock(replay_start)
+        print(f"STARTUP SUCCESS: AIS data opened ({len(ais_store)} partitions, loaded: {ais_store.loaded_keys()}). (Took {time.time() - startup_start:.2f}s)")
+    if RELOAD_POLL_SECONDS > 0:
+        reload_watch_task = asyncio.create_task(watch_data_path(RELOAD_POLL_SECONDS))
+        print(f"STARTUP: Watching {CSV_FILE_PATH} for changes every {RELOAD_POLL_SECONDS:g}s")
+    if WORKERS > 1 and CACHE_DIR:
+        # Requests made before this worker started are already reflected in the data it just opened
+        reload_trigger_seen = read_reload_trigger()
+        reload_trigger_task = asyncio.create_task(watch_reload_trigger(RELOAD_TRIGGER_POLL_SECONDS))
+        print(f"STARTUP: Watching {os.path.join(CACHE_DIR, RELOAD_TRIGGER_FILE)} for reloads requested through other workers")
     print("="*20 + " Startup Complete " + "="*20)
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stops the file and trigger watches and the query pool; queued queries are cancelled."""
+    for task in (reload_watch_task, reload_trigger_task):
+        if task is not None:
+            task.cancel()
+    if query_pool is not None:
+        query_pool.shutdown()
+
+
+# --- Query Engine (blocking; runs on the query pool) ---
+def find_ships(lat: float, lon: float, radius: Optional[float], tail_hours: float, sim_window_minutes: int, fields: Sequence[str] = SHIP_FIELDS, trace: Optional[RequestTrace] = None, k: Optional[int] = None, columnar: bool = False):
+    """
+    Runs the /ships query (Steps 1-6) and returns the ship records with the given fields; raises HTTPException(404) when
+    nothing matches. Tails are only selected when 'tail' is among the fields. Stage timings and sizes are recorded into trace, if given.
+    With k, returns the k ships nearest to the point (within radius, if given) by their latest fix, nearest first.
+    With columnar, returns the fields as columns (see build_ship_columns) instead of one record per ship.
+    """
+    trace = trace if trace is not None else RequestTrace()
+    store = ais_store # The whole request runs on this snapshot, even if a reload swaps in a new one meanwhile
+    # --- Time Simulation Filter (on main DataFrame) ---
+    step_start_time = time.time()
+    target_start_time, target_end_time = simulated_time_window(sim_window_minutes)
+    step_seconds = trace.stage("time_window", step_start_time)
+    print(f"Step 1: Calculated time window ({target_start_time} to {target_end_time}). (Took {step_seconds:.4f}s)")
+
+    step_start_time = time.time()
+    # Only the partitions the window touches are loaded
+    partitions = store.partitions_for(target_start_time.to_datetime64(), target_end_time.to_datetime64())
+    window_record_count = sum(partition.count_window_records(target_start_time.to_datetime64(), target_end_time.to_datetime64()) for partition in partitions)
+    step_seconds = trace.stage("window_slice", step_start_time)
+    trace.size("rows_scanned", window_record_count)
+    print(f"Step 2: Sliced time-ordered view of {len(partitions)} partition(s) to the time window. Found {window_record_count} potential records. (Took {step_seconds:.4f}s)")
+
+    if window_record_count == 0:
+         print("REQUEST INFO: No records found within the time window in main DF.")
+         raise HTTPException(status_code=404, detail=f"No ship data found within the simulated time window ({sim_window_minutes} mins).")
+
+    if k is not None:
+        # --- Nearest Ships (widening index search over latest fixes; replaces Steps 3-4) ---
+        step_start_time = time.time()
+        latest_records_df, candidate_count, searched_km = find_nearest_ships(
+            partitions, lat, lon, k, radius, target_start_time, target_end_time, columns_for_fields(fields)
+        )
+        num_unique_ships = len(latest_records_df)
+        step_seconds = trace.stage("nearest", step_start_time)
+        trace.size("candidate_rows", candidate_count)
+        print(f"Step 3-4: Found the {num_unique_ships} nearest ships (k={k}) within {searched_km:.1f}km, reading {candidate_count} records from the spatial index. (Took {step_seconds:.4f}s)")
+        if num_unique_ships == 0:
+            print("REQUEST INFO: No ships found within the search radius and time window.")
+            raise HTTPException(status_code=404, detail="No ships found within the specified radius and time window.")
+    else:
+        # --- Geographic Filter (spatial index probe + exact distance on candidates) ---
+        step_start_time = time.time()
+        part_ids, positions, query_ids, distances, candidate_count = find_records_within_radius(
+            partitions, np.array([lat]), np.array([lon]), np.array([radius]), target_start_time, target_end_time
+        )
+        step_seconds = trace.stage("radius_filter", step_start_time)
+        trace.size("candidate_rows", candidate_count)
+        print(f"Step 3: Probed spatial index and filtered {candidate_count} candidate records by radius ({radius}km). Found {len(positions)} records in area/time. (Took {step_seconds:.4f}s)")
+
+        if len(positions) == 0:
+            print("REQUEST INFO: No records found within the radius after time filtering.")
+            raise HTTPException(status_code=404, detail="No ships found within the specified radius and time window.")
+
+        # --- Aggregation: Find Latest Record per Ship (from geo/time filtered data) ---
+        step_start_time = time.time()
+        latest_records_df = latest_record_per_ship(partitions, part_ids, positions, query_ids, distances, target_end_time, columns_for_fields(fields))
+        num_unique_ships = len(latest_records_df)
+        step_seconds = trace.stage("latest_per_ship", step_start_time)
+        print(f"Step 4: Found latest records for {num_unique_ships} unique ships in area/time. (Took {step_seconds:.4f}s)")
+
+    # --- Prepare Response ---
+    if "tail" in fields:
+        step_start_time = time.time()
+        print(f"Step 5: Selecting tails for {num_unique_ships} ships in one vectorized batch...")
+        tail_counts, tail_lats, tail_lons, tail_sim_times, tail_candidates = select_ship_tails(
+            latest_records_df, np.full(num_unique_ships, tail_hours), store
+        )
+        step_seconds = trace.stage("tails", step_start_time)
+        print(f"Step 5: Selected {len(tail_lats)} tail points from {tail_candidates} candidates. (Took {step_seconds:.4f}s)")
+    else:
+        tail_counts, tail_lats, tail_lons, tail_sim_times = np.zeros(num_unique_ships, dtype=np.int64), [], [], []
+        print("Step 5: Skipped tails (not among the requested fields).")
+
+    # --- Build Response Payload (column-wise, same schema as ShipData) ---
+    step_start_time = time.time()
+    result_ships = (build_ship_columns if columnar else build_ship_payload)(
+        latest_records_df,
+        simulated_times=latest_records_df[TIME_COL].to_numpy() + time_offset.to_timedelta64(),
+        tail_counts=tail_counts,
+        tail_lats=tail_lats,
+        tail_lons=tail_lons,
+        tail_times=tail_sim_times,
+        fields=fields
+    )
+    step_seconds = trace.stage("payload", step_start_time)
+    trace.size("ships_returned", num_unique_ships)
+    print(f"Step 6: Built {num_unique_ships} ship records{' as columns' if columnar else ''}. (Took {step_seconds:.4f}s)")
+
+    if num_unique_ships == 0:
+         print("REQUEST INFO: No ships found after final processing.")
+         raise HTTPException(status_code=404, detail="No ships found after processing.")
+    return result_ships
+
+def find_ships_batch(request: ShipBatchRequest, trace: Optional[RequestTrace] = None) -> List[Dict[str, Any]]:
+    """Runs all /ships/batch queries against one time-window slice and index pass; returns one result per query."""
+    trace = trace if trace is not None else RequestTrace()
+    fields = parse_fields(request.fields)
+    store = ais_store # The whole request runs on this snapshot, even if a reload swaps in a new one meanwhile
+    num_queries = len(request.queries)
+    step_start_time = time.time()
+    target_start_time, target_end_time = simulated_time_window(request.sim_window_minutes)
+    partitions = store.partitions_for(target_start_time.to_datetime64(), target_end_time.to_datetime64())
+    window_record_count = sum(partition.count_window_records(target_start_time.to_datetime64(), target_end_time.to_datetime64()) for partition in partitions)
+    step_seconds = trace.stage("time_window", step_start_time)
+    trace.size("rows_scanned", window_record_count)
+    print(f"Batch Step 1: Time window {target_start_time} to {target_end_time} holds {window_record_count} records in {len(partitions)} partition(s). (Took {step_seconds:.4f}s)")
+
+    ships_per_query = [[] for _ in range(num_queries)]
+    if window_record_count > 0:
+        step_start_time = time.time()
+        lats = np.array([query.lat for query in request.queries])
+        lons = np.array([query.lon for query in request.queries])
+        radii = np.array([query.radius for query in request.queries])
+        tail_hours = np.array([query.tail_hours for query in request.queries])
+        part_ids, positions, query_ids, distances, candidate_count = find_records_within_radius(partitions, lats, lons, radii, target_start_time, target_end_time)
+        step_seconds = trace.stage("radius_filter", step_start_time)
+        trace.size("candidate_rows", candidate_count)
+        print(f"Batch Step 2: Probed spatial index once for all queries; {len(positions)} of {candidate_count} candidate records are within radius. (Took {step_seconds:.4f}s)")
+
+        if len(positions):
+            step_start_time = time.time()
+            ships_per_query = build_ships_for_queries(store, partitions, part_ids, positions, query_ids, distances, target_end_time, tail_hours, num_queries, fields)
+            step_seconds = trace.stage("build", step_start_time)
+            print(f"Batch Step 3: Built {sum(len(ships) for ships in ships_per_query)} ship records across {num_queries} queries. (Took {step_seconds:.4f}s)")
+
+    trace.size("ships_returned", sum(len(ships) for ships in ships_per_query))
+    return [
+        {"query": query.model_dump(), "ships": ships}
+        for query, ships in zip(request.queries, ships_per_query)
+    ]
+
+def find_ship_track(mmsi: int, hours: float, tolerance_m: Optional[float], max_points: Optional[int], trace: Optional[RequestTrace] = None) -> Dict[str, Any]:
+    """
+    Returns the ship's fixes from the last `hours` of simulated time, simplified with Douglas-Peucker to within
+    tolerance_m metres (if given) and to at most max_points points; raises HTTPException(404) when the ship has no fixes then.
+    """
+    trace = trace if trace is not None else RequestTrace()
+    step_start_time = time.time()
+    track_end = simulated_now_historical()
+    track_start = (track_end - pd.Timedelta(hours=hours).to_timedelta64()).astype(TIME_DTYPE)
+    partitions = ais_store.partitions_for(track_start, track_end)
+    # Every ship's rows are one contiguous, time-ordered slice per partition
+    slices = []
+    for part_id, partition in enumerate(partitions):
+        ship_starts, ship_ends = partition.lookup_mmsi_rows(np.array([mmsi]))
+        ship_times = partition.df[TIME_COL].to_numpy()[ship_starts[0]:ship_ends[0]]
+        first = ship_starts[0] + np.searchsorted(ship_times, track_start, side="left")
+        last = ship_starts[0] + np.searchsorted(ship_times, track_end, side="right")
+        slices.append((np.full(last - first, part_id), np.arange(first, last)))
+    part_ids, positions = (np.concatenate(parts) for parts in zip(*slices)) if slices else (np.empty(0, dtype=np.int64),) * 2
+    step_seconds = trace.stage("track_rows", step_start_time)
+    trace.size("rows_scanned", len(positions))
+    print(f"Track Step 1: Found {len(positions)} fixes of MMSI {mmsi} in {len(partitions)} partition(s). (Took {step_seconds:.4f}s)")
+
+    if len(positions) == 0:
+        print("REQUEST INFO: No fixes found for the ship within the time range.")
+        raise HTTPException(status_code=404, detail=f"No fixes found for MMSI {mmsi} within the last {hours:g} simulated hours.")
+
+    step_start_time = time.time()
+    lats = widen_float32(gather_column(partitions, part_ids, positions, LAT_COL))
+    lons = widen_float32(gather_column(partitions, part_ids, positions, LON_COL))
+    kept = simplify_track(*project_equirectangular(lats, lons), tolerance=tolerance_m, max_points=max_points)
+    step_seconds = trace.stage("simplify", step_start_time)
+    print(f"Track Step 2: Kept {len(kept)} of {len(positions)} fixes (tolerance {tolerance_m}m, max points {max_points}). (Took {step_seconds:.4f}s)")
+
+    step_start_time = time.time()
+    sim_times = iso_timestamps(gather_column(partitions, part_ids[kept], positions[kept], TIME_COL) + time_offset.to_timedelta64())
+    track = {
+        "mmsi": str(mmsi),
+        "total_points": len(positions),
+        "points": [
+            {"lat": lat, "lon": lon, "timestamp": sim_time}
+            for lat, lon, sim_time in zip(lats[kept].tolist(), lons[kept].tolist(), sim_times)
+        ],
+    }
+    trace.stage("payload", step_start_time)
+    return track
+
+def encode_json(func, *args, trace: Optional[RequestTrace] = None, **kwargs):
+    """Runs func(*args, trace=trace, **kwargs) and encodes the resulting document as JSON on the same pool thread; returns (item count, body)."""
+    trace = trace if trace is not None else RequestTrace()
+    items = func(*args, trace=trace, **kwargs)
+    step_start_time = time.time()
+    body = dumps(items)
+    step_seconds = trace.stage("encode", step_start_time)
+    trace.size("response_bytes", len(body))
+    print(f"Step 7: Encoded {len(body)} bytes of JSON. (Took {step_seconds:.4f}s)")
+    return len(items), body
+
+def encode_ships(media_type: str, *args, trace: Optional[RequestTrace] = None, k: Optional[int] = None):
+    """
+    Runs find_ships(*args) and encodes the ships as JSON, MessagePack or Arrow IPC on the same pool thread; returns (ship count, body).
+    Arrow is built from the columns directly, so tails are never expanded into one object per point.
+    """
+    trace = trace if trace is not None else RequestTrace()
+    if media_type == ARROW_STREAM_MEDIA_TYPE:
+        columns = find_ships(*args, trace=trace, k=k, columnar=True)
+        encode = partial(arrow_ipc_stream, columns, {name: SHIP_ARROW_KINDS[name] for name in columns})
+    else:
+        ships = find_ships(*args, trace=trace, k=k)
+        encode = partial(pack_msgpack if media_type == MSGPACK_MEDIA_TYPE else dumps, ships)
+    step_start_time = time.time()
+    body = encode()
+    step_seconds = trace.stage("encode", step_start_time)
+    trace.size("response_bytes", len(body))
+    print(f"Step 7: Encoded {len(body)} bytes of {media_type}. (Took {step_seconds:.4f}s)")
+    return trace.sizes["ships_returned"], body
+
+def negotiate_ships_media_type(accept: Optional[str]) -> str:
+    """
+    Picks the /ships encoding from the Accept header: the supported type with the highest q (the first listed on ties).
+    JSON is the default, also for */* and for types the server does not produce. Raises HTTPException(406) when the
+    client only accepts binary types whose optional library is not installed.
+    """
+    offered = []
+    for entry in (accept or "").split(","):
+        media_type, *params = [part.strip() for part in entry.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.replace(" ", "").startswith("q="):
+                try:
+                    quality = float(param.split("=", 1)[1])
+                except ValueError:
+                    pass
+        if media_type and quality > 0:
+            offered.append((quality, media_type.lower()))
+    offered.sort(key=lambda item: -item[0]) # Stable, so ties keep the client's order
+    available = binary_media_types()
+    unavailable = []
+    for _, media_type in offered:
+        if media_type in (JSON_MEDIA_TYPE, NDJSON_MEDIA_TYPE):
+            return media_type
+        if media_type in ("*/*", "application/*"):
+            return JSON_MEDIA_TYPE
+        canonical = MSGPACK_MEDIA_TYPE if media_type in MSGPACK_MEDIA_TYPE_ALIASES else media_type
+        if canonical in (ARROW_STREAM_MEDIA_TYPE, MSGPACK_MEDIA_TYPE):
+            if canonical in available:
+                return canonical
+            unavailable.append(canonical)
+    if unavailable:
+        raise HTTPException(status_code=406, detail=f"{unavailable} not available on this server; choose from {[JSON_MEDIA_TYPE, NDJSON_MEDIA_TYPE] + available}.")
+    return JSON_MEDIA_TYPE
+
+def ships_cache_key(lat: float, lon: float, radius: Optional[float], tail_hours: float, sim_window_minutes: int, fields: Sequence[str], k: Optional[int] = None, media_type: str = JSON_MEDIA_TYPE):
+    """
+    Returns the result cache key of a /ships query and the seconds until the entry expires. The point and radius are
+    quantized, and the key includes the current simulated-time bucket. Simulated time advances at wall-clock speed,
+    so an entry expires after the real seconds left in its bucket.
+    """
+    bucket_us = int(RESULT_CACHE_TTL_SECONDS * 1_000_000)
+    now_us = int(simulated_now_historical().astype(np.int64))
+    time_bucket = now_us // bucket_us
+    key = (
+        round(lat / RESULT_CACHE_LATLON_DEG), round(lon / RESULT_CACHE_LATLON_DEG), None if radius is None else round(radius / RESULT_CACHE_RADIUS_KM), k,
+        tail_hours if "tail" in fields else None, sim_window_minutes, tuple(fields), media_type, time_bucket, dataset_generation
+    )
+    return key, ((time_bucket + 1) * bucket_us - now_us) / 1_000_000
+
+def create_result_cache() -> Optional[ResultCache]:
+    """Returns the /ships result cache, or None if any of its size or bucket settings is 0 or less (the keys divide by the buckets)."""
+    settings = {
+        "AIS_RESULT_CACHE_ENTRIES": RESULT_CACHE_ENTRIES, "AIS_RESULT_CACHE_MB": RESULT_CACHE_MB, "AIS_RESULT_CACHE_TTL_SECONDS": RESULT_CACHE_TTL_SECONDS,
+        "AIS_RESULT_CACHE_LATLON_DEG": RESULT_CACHE_LATLON_DEG, "AIS_RESULT_CACHE_RADIUS_KM": RESULT_CACHE_RADIUS_KM,
+    }
+    disabled_by = [name for name, value in settings.items() if not value > 0]
+    if disabled_by:
+        print(f"STARTUP: Result cache disabled ({', '.join(f'{name}={settings[name]:g}' for name in disabled_by)})")
+        return None
+    return ResultCache(RESULT_CACHE_ENTRIES, RESULT_CACHE_MB * 1024 * 1024)
+
+async def run_query(func, *args):
+    """Runs a blocking query function on the query pool; a full queue becomes 503 and a timeout 504."""
+    try:
+        return await query_pool.run(func, *args)
+    except QueryPoolFull as e:
+        print(f"REQUEST REJECTED: {e}")
+        raise HTTPException(status_code=503, detail="Too many queries in progress; retry shortly.", headers={"Retry-After": "1"})
+    except QueryTimeout as e:
+        print(f"REQUEST TIMEOUT: {e}")
+        raise HTTPException(status_code=504, detail=f"Query did not finish within {query_pool.timeout_seconds:g}s.")
+
 
 # --- API Endpoint Definition ---
+@app.get("/health",
+         summary="Liveness and readiness",
+         description="Answered on the event loop without touching the query pool, so it stays fast while queries run.")
+async def health():
+    """Reports whether the AIS data is open, plus query pool occupancy; 503 until the data is available."""
+    ready = ais_store is not None and time_offset is not None
+    payload = {
+        "status": "ok" if ready else "unavailable",
+        "partitions": len(ais_store) if ais_store is not None else 0,
+        "query_pool": query_pool.stats() if query_pool is not None else None,
+        "result_cache": result_cache.stats() if result_cache is not None else None,
+        "dataset": {"generation": dataset_generation, "last_reload": last_reload},
+    }
+    return Response(content=dumps(payload), media_type=JSON_MEDIA_TYPE, status_code=200 if ready else 503)
+
+@app.post("/admin/reload",
+          summary="Hot-swap the AIS data",
+          description="Reopens CSV_FILE_PATH next to the live dataset and swaps it in atomically; queries keep being answered throughout. Returns the reload report, including peak memory while both datasets were held. With AIS_WORKERS > 1 the report is this worker's; the others reload within a second through a shared trigger file. 409 if a reload is already running.")
+async def reload_data():
+    global reload_trigger_seen
+    if reload_lock is None or reload_lock.locked():
+        raise HTTPException(status_code=409, detail="A reload is already in progress.")
+    if WORKERS > 1 and CACHE_DIR:
+        # Marked as seen first, so this worker's own trigger watch does not reload a second time
+        reload_trigger_seen = await asyncio.to_thread(write_reload_trigger)
+    report = await reload_dataset("admin")
+    return Response(content=dumps(report), media_type=JSON_MEDIA_TYPE, status_code=200 if report["status"] == "swapped" else 500)
+
+@app.get("/metrics",
+         summary="Prometheus metrics",
+         description="Per-stage query latency, scan and result sizes, load timings, query pool and result cache counters of this worker process, in the Prometheus text format.")
+async def metrics():
+    return Response(content=metrics_registry.render(), media_type=PROMETHEUS_MEDIA_TYPE)
+
 @app.get("/ships",
-         response_model=List[ShipData],
-         summary="Find ships with tails within a radius",
-         description="Returns a list of ships, each with its latest simulated position and a 'tail' of previous positions.")
+         response_model=List[ProjectedShipData],
+         responses={200: {
+             "description": "Ships found, with only the fields selected by fields=. The Accept header picks the encoding: a JSON array, "
+                            "one JSON object per line (NDJSON), the same array as MessagePack, or an Arrow IPC stream with one column per field.",
+             "content": {
+                 NDJSON_MEDIA_TYPE: {"schema": {"$ref": "#/components/schemas/ProjectedShipData"}},
+                 MSGPACK_MEDIA_TYPE: {"schema": {"type": "array", "items": {"$ref": "#/components/schemas/ProjectedShipData"}}},
+                 ARROW_STREAM_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+             },
+         }},
+         summary="Find ships with tails within a radius, or the k nearest ships",
+         description="Returns a list of ships, each with its latest simulated position and a 'tail' of previous positions. With k, returns the k ships nearest to the point, nearest first.")
 async def get_ships_with_tails(
     lat: float = Query(..., description="Latitude of the center point.", ge=-90.0, le=90.0),
     lon: float = Query(..., description="Longitude of the center point.", ge=-180.0, le=180.0),
-    radius: float = Query(..., description="Search radius in kilometers.", gt=0),
+    radius: Optional[float] = Query(None, description="Search radius in kilometers. Required unless k is given; with k, the farthest a ship may be.", gt=0),
+    k: Optional[int] = Query(None, description=f"Return the k ships whose latest position is nearest to the point, nearest first (at most {MAX_NEAREST_SHIPS}).", ge=1, le=MAX_NEAREST_SHIPS),
     tail_hours: float = Query(24.0, description="Duration of the ship's 'tail' in hours (default: 24).", gt=0),
-    sim_window_minutes: int = Query(60, description="Simulation window size in minutes (how far back from 'now' to look).", gt=0)
+    sim_window_minutes: int = Query(60, description="Simulation window size in minutes (how far back from 'now' to look).", gt=0),
+    fields: Optional[List[str]] = Query(None, description="Comma-separated ShipData fields to return (default: all), e.g. 'mmsi,vessel_name'. Tails are only computed when 'tail' is included."),
+    accept: Optional[str] = Header(None, description=f"Send '{NDJSON_MEDIA_TYPE}' to stream one ship per line instead of a JSON array, '{MSGPACK_MEDIA_TYPE}' for the same array as MessagePack, or '{ARROW_STREAM_MEDIA_TYPE}' for an Arrow IPC stream with one column per field.")
 ):
     """API endpoint to retrieve aggregated ship data with position tails."""
-    global ais_data_df, time_offset, ais_data_grouped_by_mmsi # Include grouped data
     request_start_time = time.time()
-    print(f"\n--- Request Received: /ships?lat={lat}&lon={lon}&radius={radius}&tail_hours={tail_hours}&sim_window={sim_window_minutes} ---")
+    print(f"\n--- Request Received: /ships?lat={lat}&lon={lon}&radius={radius}{f'&k={k}' if k is not None else ''}&tail_hours={tail_hours}&sim_window={sim_window_minutes}{'&fields=' + ','.join(fields) if fields else ''} ---")
 
     # Check if both main df and grouped data are available
-    if ais_data_df is None or ais_data_df.empty or not ais_data_grouped_by_mmsi or time_offset is None:
+    if ais_store is None or time_offset is None:
         print("REQUEST ERROR: AIS data not available or not pre-grouped.")
         raise HTTPException(status_code=503, detail="AIS data is not available or not properly loaded/pre-grouped.")
-
+    if radius is None and k is None:
+        raise HTTPException(status_code=422, detail="Give a radius, k, or both.")
+    fields = parse_fields(fields)
+    check_query_span(sim_window_minutes, tail_hours, fields)
+    media_type = negotiate_ships_media_type(accept)
+    headers = {"Vary": "Accept"} # Caches must not serve one encoding to a client that asked for another
+
+    trace = RequestTrace()
+    status_code = 500
     try:
-        # --- Time Simulation Filter (on main DataFrame) ---
-        step_start_time = time.time()
-        current_utc_time = pd.Timestamp.utcnow().tz_localize(None)
-        simulated_window_end = current_utc_time
-        simulated_window_start = simulated_window_end - pd.Timedelta(minutes=sim_window_minutes)
-        target_start_time = simulated_window_start - time_offset
-        target_end_time = simulated_window_end - time_offset
-        print(f"Step 1: Calculated time window ({target_start_time} to {target_end_time}). (Took {time.time() - step_start_time:.4f}s)")
-
-        step_start_time = time.time()
-        # Filter the main DataFrame
-        time_filtered_df = ais_data_df[
-            (ais_data_df[TIME_COL] >= target_start_time) &
-            (ais_data_df[TIME_COL] <= target_end_time)
-        ].copy() # Copy might not be strictly needed if only used for filtering indices
-        print(f"Step 2: Filtered main DF by time window. Found {len(time_filtered_df)} potential records. (Took {time.time() - step_start_time:.4f}s)")
-
-        if time_filtered_df.empty:
-             print("REQUEST INFO: No records found within the time window in main DF.")
-             raise HTTPException(status_code=404, detail=f"No ship data found within the simulated time window ({sim_window_minutes} mins).")
-
-        # --- Geographic Filter (on time-filtered DataFrame) ---
-        step_start_time = time.time()
-        distances = haversine(lat, lon, time_filtered_df[LAT_COL], time_filtered_df[LON_COL])
-        print(f"Step 3: Calculated distances for {len(time_filtered_df)} records. (Took {time.time() - step_start_time:.4f}s)")
-
-        step_start_time = time.time()
-        within_radius_idx = distances <= radius
-        # Get the DataFrame of records within the radius and time window
-        geo_time_filtered_df = time_filtered_df[within_radius_idx].copy() # Copy needed before adding column
-        geo_time_filtered_df['distance_km'] = distances[within_radius_idx]
-        print(f"Step 4: Filtered by radius ({radius}km). Found {len(geo_time_filtered_df)} records in area/time. (Took {time.time() - step_start_time:.4f}s)")
-
-
-        if geo_time_filtered_df.empty:
-            print("REQUEST INFO: No records found within the radius after time filtering.")
-            raise HTTPException(status_code=404, detail="No ships found within the specified radius and time window.")
-
-        # --- Aggregation: Find Latest Record per Ship (from geo/time filtered data) ---
-        step_start_time = time.time()
-        # Group the filtered data and find the index of the latest time for each MMSI
-        latest_indices = geo_time_filtered_df.groupby(MMSI_COL)[TIME_COL].idxmax()
-        # Select the full rows for these latest records
-        latest_records_df = geo_time_filtered_df.loc[latest_indices]
-        num_unique_ships = len(latest_records_df)
-        print(f"Step 5: Found latest records for {num_unique_ships} unique ships in area/time. (Took {time.time() - step_start_time:.4f}s)")
-
-
-        # --- Prepare Response ---
-        step_start_time = time.time()
-        print(f"Step 6: Preparing response and calculating tails for {num_unique_ships} ships using pre-grouped data...")
-        result_ships: List[ShipData] = []
-        tail_duration = pd.Timedelta(hours=tail_hours)
-        min_time_diff = timedelta(minutes=1) # Minimum time difference for tail points
-        ship_process_times = []
-
-        for i, (index, latest_record) in enumerate(latest_records_df.iterrows()):
-            ship_start_time = time.time()
-            mmsi = latest_record[MMSI_COL]
-            latest_original_time = latest_record[TIME_COL]
-            latest_simulated_time = latest_original_time + time_offset
-            distance = latest_record['distance_km']
-
-            # --- Calculate Tail using Pre-Grouped Data ---
-            tail_positions: List[Position] = []
-            # --- OPTIMIZATION: Get the pre-grouped DataFrame for this MMSI ---
-            ship_df = ais_data_grouped_by_mmsi.get(mmsi)
-            # --- End Optimization ---
-
-            if ship_df is not None and not ship_df.empty:
-                tail_start_original_time = latest_original_time - tail_duration
-                # --- OPTIMIZATION: Filter the smaller ship_df ---
-                tail_candidates_df = ship_df[
-                    (ship_df[TIME_COL] >= tail_start_original_time) &
-                    (ship_df[TIME_COL] <= latest_original_time)
-                ]
-                # --- End Optimization ---
-
-                # --- Select points at least 1 minute apart (from candidates) ---
-                selected_tail_rows = []
-                last_added_original_time = None
-
-                if not tail_candidates_df.empty:
-                    # Iterate backwards through the candidates (from newest to oldest)
-                    for idx in range(len(tail_candidates_df) - 1, -1, -1):
-                        current_row = tail_candidates_df.iloc[idx]
-                        current_original_time = current_row[TIME_COL]
-
-                        if last_added_original_time is None:
-                            selected_tail_rows.append(current_row)
-                            last_added_original_time = current_original_time
-                        elif (last_added_original_time - current_original_time) >= min_time_diff:
-                            selected_tail_rows.append(current_row)
-                            last_added_original_time = current_original_time
-
-                    selected_tail_rows.reverse() # Restore chronological order
-
-                # Iterate over the selected tail rows to create Position objects
-                for _, tail_row in pd.DataFrame(selected_tail_rows).iterrows():
-                     simulated_tail_time = tail_row[TIME_COL] + time_offset
-                     tail_positions.append(
-                         Position(
-                             lat=tail_row[LAT_COL],
-                             lon=tail_row[LON_COL],
-                             timestamp=simulated_tail_time
-                         )
-                     )
-            else:
-                print(f"  - Warning: No pre-grouped data found for MMSI {mmsi}. Tail will be empty.")
-
+        # Steps 1-7 run on the query pool; the event loop keeps serving other requests meanwhile
+        if media_type == NDJSON_MEDIA_TYPE:
+            result_ships = await run_query(partial(find_ships, lat, lon, radius, tail_hours, sim_window_minutes, fields, trace=trace, k=k))
+            # Records are encoded batch by batch as the client reads them
+            total_request_time = time.time() - request_start_time
+            print(f"--- Request Completed: Streaming {len(result_ships)} ships as NDJSON. Total time: {total_request_time:.4f}s ---")
+            status_code = 200
+            return StreamingResponse(iter_ndjson(result_ships), media_type=NDJSON_MEDIA_TYPE, headers=with_server_timing(headers, trace, total_request_time))
+
+        # Repeated lookups around the same point within one simulated-time bucket are answered from the result cache
+        cache_key, cache_ttl = ships_cache_key(lat, lon, radius, tail_hours, sim_window_minutes, fields, k, media_type) if result_cache is not None else (None, 0)
+        cached = result_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            status_code, body_media_type, body = cached
+            total_request_time = trace.stage("result_cache", request_start_time)
+            trace.size("response_bytes", len(body))
+            print(f"--- Request Completed: Served {len(body)} bytes (status {status_code}) from the result cache. Total time: {total_request_time:.4f}s ---")
+            return Response(content=body, media_type=body_media_type, status_code=status_code, headers=with_server_timing(headers, trace, total_request_time))
+        try:
+            num_ships, body = await run_query(partial(encode_ships, media_type, lat, lon, radius, tail_hours, sim_window_minutes, fields, trace=trace, k=k))
+        except HTTPException as e:
+            if e.status_code == 404 and cache_key is not None:
+                # Empty areas are looked up repeatedly too; cache the same body FastAPI sends for the exception
+                not_found_body = dumps({"detail": e.detail})
+                result_cache.put(cache_key, (404, JSON_MEDIA_TYPE, not_found_body), len(not_found_body), cache_ttl)
+            raise
+        if cache_key is not None:
+            result_cache.put(cache_key, (200, media_type, body), len(body), cache_ttl)
+        total_request_time = time.time() - request_start_time
+        print(f"--- Request Completed: Found {num_ships} ships ({media_type}). Total time: {total_request_time:.4f}s ---")
+        status_code = 200
+        return Response(content=body, media_type=media_type, headers=with_server_timing(headers, trace, total_request_time))
 
-            # --- Construct ShipData Object ---
-            ship_object = ShipData.from_record(
-                record=latest_record,
-                tail_positions=tail_positions,
-                dist=distance,
-                simulated_time=latest_simulated_time
-            )
-            result_ships.append(ship_object)
-            ship_process_time = time.time() - ship_start_time
-            ship_process_times.append(ship_process_time)
+    except HTTPException as e:
+         total_request_time = time.time() - request_start_time
+         print(f"--- Request Failed (HTTPException): Status={e.status_code}, Detail='{e.detail}'. Total time: {total_request_time:.4f}s ---")
+         status_code = e.status_code
+         e.headers = with_server_timing(e.headers, trace, total_request_time)
+         raise e
+    except Exception as e:
+        total_request_time = time.time() - request_start_time
+        print(f"--- Request Failed (Unexpected Error): {e}. Total time: {total_request_time:.4f}s ---")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Internal server error: {e}", headers=with_server_timing(None, trace, total_request_time))
+    finally:
+        record_request("/ships", trace, status_code, time.time() - request_start_time)
+
+@app.post("/ships/batch",
+          response_model=List[ShipBatchResult],
+          responses={200: {
+              "description": "One result per query, in request order, as a JSON array or, with Accept: NDJSON, one result per line.",
+              "content": {NDJSON_MEDIA_TYPE: {"schema": {"$ref": "#/components/schemas/ShipBatchResult"}}},
+          }},
+          summary="Find ships with tails for many query points at once",
+          description="Answers every query against one simulated time window and one spatial index pass. Returns one result per query, in request order; queries with no ships get an empty list.")
+async def get_ships_batch(
+    request: ShipBatchRequest,
+    accept: Optional[str] = Header(None, description=f"Send '{NDJSON_MEDIA_TYPE}' to stream one query result per line instead of a JSON array.")
+):
+    """Batch variant of /ships: all queries share the time-window slice, index probe, aggregation and tail selection."""
+    request_start_time = time.time()
+    num_queries = len(request.queries)
+    print(f"\n--- Request Received: /ships/batch with {num_queries} queries, sim_window={request.sim_window_minutes} ---")
 
+    if ais_store is None or time_offset is None:
+        print("REQUEST ERROR: AIS data not available or not pre-grouped.")
+        raise HTTPException(status_code=503, detail="AIS data is not available or not properly loaded/pre-grouped.")
+    check_query_span(request.sim_window_minutes, max(query.tail_hours for query in request.queries), parse_fields(request.fields))
 
-        avg_ship_time = np.mean(ship_process_times) if ship_process_times else 0
-        max_ship_time = np.max(ship_process_times) if ship_process_times else 0
-        print(f"Step 7: Finished processing tails (min 1 min interval using pre-grouped data). Avg time/ship: {avg_ship_time:.4f}s, Max time/ship: {max_ship_time:.4f}s. (Total Step 6/7 Took {time.time() - step_start_time:.4f}s)")
+    trace = RequestTrace()
+    status_code = 500
+    try:
+        if accept and NDJSON_MEDIA_TYPE in accept:
+            results = await run_query(partial(find_ships_batch, request, trace=trace))
+            total_request_time = time.time() - request_start_time
+            print(f"--- Request Completed: /ships/batch answered {num_queries} queries. Total time: {total_request_time:.4f}s ---")
+            status_code = 200
+            return StreamingResponse(iter_ndjson(results), media_type=NDJSON_MEDIA_TYPE, headers=with_server_timing(None, trace, total_request_time))
+        _, body = await run_query(partial(encode_json, find_ships_batch, request, trace=trace))
+        total_request_time = time.time() - request_start_time
+        print(f"--- Request Completed: /ships/batch answered {num_queries} queries. Total time: {total_request_time:.4f}s ---")
+        status_code = 200
+        return Response(content=body, media_type=JSON_MEDIA_TYPE, headers=with_server_timing(None, trace, total_request_time))
 
+    except HTTPException as e:
+         total_request_time = time.time() - request_start_time
+         print(f"--- Request Failed (HTTPException): Status={e.status_code}, Detail='{e.detail}'. Total time: {total_request_time:.4f}s ---")
+         status_code = e.status_code
+         e.headers = with_server_timing(e.headers, trace, total_request_time)
+         raise e
+    except Exception as e:
+        total_request_time = time.time() - request_start_time
+        print(f"--- Request Failed (Unexpected Error): {e}. Total time: {total_request_time:.4f}s ---")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Internal server error: {e}", headers=with_server_timing(None, trace, total_request_time))
+    finally:
+        record_request("/ships/batch", trace, status_code, time.time() - request_start_time)
+
+@app.get("/ships/{mmsi}/track",
+         response_model=ShipTrack,
+         summary="Recent track of one ship, optionally simplified",
+         description="Returns every fix of the ship from the last `hours` of simulated time. With `tolerance_m`, the track is simplified with Douglas-Peucker to within that many metres; with `max_points`, it is cut to at most that many fixes. The first and last fixes and the largest course changes are kept first.")
+async def get_ship_track(
+    mmsi: int = Path(..., description="Maritime Mobile Service Identity (MMSI).", ge=0, le=999_999_999),
+    hours: float = Query(24.0, description=f"How far back from the simulated 'now' the track reaches (default: 24, at most {MAX_TRACK_HOURS:g}).", gt=0, le=MAX_TRACK_HOURS),
+    tolerance_m: Optional[float] = Query(None, description="Drop fixes within this many metres of the simplified line (default: keep every fix).", ge=0),
+    max_points: Optional[int] = Query(None, description="Keep at most this many fixes, the most significant first (default: no limit).", ge=2)
+):
+    """API endpoint returning one ship's track from the per-MMSI slices of the loaded partitions."""
+    request_start_time = time.time()
+    print(f"\n--- Request Received: /ships/{mmsi}/track?hours={hours}&tolerance_m={tolerance_m}&max_points={max_points} ---")
 
-        if not result_ships:
-             print("REQUEST INFO: No ships found after final processing.")
-             raise HTTPException(status_code=404, detail="No ships found after processing.")
+    if ais_store is None or time_offset is None:
+        print("REQUEST ERROR: AIS data not available or not pre-grouped.")
+        raise HTTPException(status_code=503, detail="AIS data is not available or not properly loaded/pre-grouped.")
 
+    trace = RequestTrace()
+    status_code = 500
+    try:
+        _, body = await run_query(partial(encode_json, find_ship_track, mmsi, hours, tolerance_m, max_points, trace=trace))
         total_request_time = time.time() - request_start_time
-        print(f"--- Request Completed: Found {len(result_ships)} ships. Total time: {total_request_time:.4f}s ---")
-        return result_ships
+        print(f"--- Request Completed: /ships/{mmsi}/track returned {len(body)} bytes. Total time: {total_request_time:.4f}s ---")
+        status_code = 200
+        return Response(content=body, media_type=JSON_MEDIA_TYPE, headers=with_server_timing(None, trace, total_request_time))
 
     except HTTPException as e:
          total_request_time = time.time() - request_start_time
          print(f"--- Request Failed (HTTPException): Status={e.status_code}, Detail='{e.detail}'. Total time: {total_request_time:.4f}s ---")
+         status_code = e.status_code
+         e.headers = with_server_timing(e.headers, trace, total_request_time)
          raise e
     except Exception as e:
         total_request_time = time.time() - request_start_time
         print(f"--- Request Failed (Unexpected Error): {e}. Total time: {total_request_time:.4f}s ---")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {e}", headers=with_server_timing(None, trace, total_request_time))
+    finally:
+        record_request("/ships/{mmsi}/track", trace, status_code, time.time() - request_start_time)
+
+@app.get("/ships/stream",
+         summary="Stream new ship positions inside a bounding box",
+         description="Server-sent events: every tick sends the fixes recorded inside the box since the previous tick, as simulated time advances.")
+async def stream_ship_positions(
+    min_lat: float = Query(..., description="Southern edge of the box.", ge=-90.0, le=90.0),
+    max_lat: float = Query(..., description="Northern edge of the box.", ge=-90.0, le=90.0),
+    min_lon: float = Query(..., description="Western edge of the box (greater than max_lon if the box crosses the antimeridian).", ge=-180.0, le=180.0),
+    max_lon: float = Query(..., description="Eastern edge of the box.", ge=-180.0, le=180.0),
+    tick_seconds: float = Query(STREAM_TICK_SECONDS, description="Seconds between updates.", ge=0.1, le=60),
+    backfill_minutes: int = Query(0, description="Minutes of simulated history to include in the first update.", ge=0, le=MAX_STREAM_BACKFILL_MINUTES),
+    max_ticks: Optional[int] = Query(None, description="Stop after this many ticks (default: until the client disconnects).", gt=0),
+    last_event_id: Optional[str] = Header(None, description="Resume after this event id; EventSource clients send it when reconnecting.")
+):
+    """Push endpoint for map clients: only fixes not sent before are transmitted."""
+    print(f"\n--- Stream Opened: /ships/stream box=({min_lat}, {min_lon}) to ({max_lat}, {max_lon}), tick={tick_seconds}s, backfill={backfill_minutes}min ---")
+    if ais_store is None or time_offset is None:
+        print("REQUEST ERROR: AIS data not available or not pre-grouped.")
+        raise HTTPException(status_code=503, detail="AIS data is not available or not properly loaded/pre-grouped.")
+    if min_lat > max_lat:
+        raise HTTPException(status_code=422, detail="min_lat must not be greater than max_lat.")
+
+    now = simulated_now_historical()
+    earliest = now - np.timedelta64(MAX_STREAM_BACKFILL_MINUTES, "m")
+    after = now - np.timedelta64(backfill_minutes, "m")
+    resumed = parse_last_event_id(last_event_id, earliest, now) if last_event_id is not None else None
+    if resumed is not None:
+        after = resumed
+    elif last_event_id is not None:
+        print(f"STREAM: Ignoring invalid Last-Event-ID {last_event_id!r}; starting from the backfill.")
+    return StreamingResponse(
+        ship_position_events((min_lat, max_lat, min_lon, max_lon), after, tick_seconds, max_ticks),
+        media_type=SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 # --- Main Execution Block ---
@@ -448,4 +1805,15 @@ if __name__ == "__main__":
          print("Ensure the file exists and the path is correct in the script.")
          print("-" * 50)
 
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    if WORKERS > 1:
+        # --- Production: N worker processes attached read-only to the shared memory-mapped cache ---
+        if not CACHE_DIR:
+            print("ERROR: AIS_WORKERS > 1 requires CACHE_DIR; workers share the dataset through its memory-mapped files.")
+            raise SystemExit(1)
+        print(f"Preparing the shared dataset cache for {WORKERS} worker processes...")
+        if not prepare_shared_dataset():
+            print("ERROR: Failed to prepare the AIS dataset; not starting workers.")
+            raise SystemExit(1)
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=WORKERS)
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
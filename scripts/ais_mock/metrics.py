@@ -0,0 +1,162 @@
+# metrics.py
+"""
+Prometheus metrics in the text exposition format, without a client library.
+
+Counters, histograms and callback metrics are thread-safe, since queries
+record into them from the query pool threads. A RequestTrace collects the
+stage durations and sizes of one request; the server turns it into
+histogram observations and, when enabled, a Server-Timing header.
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LOAD_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+SIZE_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], le: Optional[float] = None) -> str:
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{_format_value(le)}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], List[float]] = {} # key -> per-bucket counts, then sum
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 1)
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        lines = self.header()
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le=bound)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(cumulative)}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """
+    A gauge (or a counter kept elsewhere) whose samples are read when metrics are scraped;
+    the callback returns {label values: value}.
+    """
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Dict[Tuple[str, ...], float]],
+                 labelnames: Sequence[str] = (), kind: str = "gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def collect(self) -> List[str]:
+        samples = self.callback() or {}
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(samples.items()) if value is not None
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class RequestTrace:
+    """Stage durations (in order) and sizes recorded while answering one request."""
+
+    def __init__(self):
+        self.stages: List[Tuple[str, float]] = []
+        self.sizes: Dict[str, int] = {}
+
+    def stage(self, name: str, since: float) -> float:
+        """Records the time from `since` (a time.time() value) to now as stage `name`; returns it in seconds."""
+        seconds = time.time() - since
+        self.stages.append((name, seconds))
+        return seconds
+
+    def size(self, name: str, value: int):
+        self.sizes[name] = int(value)
+
+    def server_timing(self, total_seconds: Optional[float] = None) -> str:
+        """Formats the stages (and the total) as a Server-Timing header value, in milliseconds."""
+        entries = list(self.stages)
+        if total_seconds is not None:
+            entries.append(("total", total_seconds))
+        return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in entries)
@@ -0,0 +1,231 @@
+# partitions.py
+"""
+Prepared AIS datasets, and a lazily loaded store of daily partitions.
+
+A Partition is one prepared dataset: the MMSI/time-sorted frame plus the
+per-MMSI offsets, the time-ordered view and the spatial index built over it.
+A PartitionStore knows the time range each source file covers (NOAA
+publishes one file per UTC day) and only loads the partitions a query's time
+range touches. Beyond `max_loaded` partitions, the least recently used one is
+dropped. A request keeps the partitions it was given until it finishes, so
+memory only stays bounded if no request spans more than `max_loaded` days;
+the server enforces that on query spans. When the data
+is reloaded, a new store can adopt the partitions of the old one whose
+source files did not change.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from spatial_index import GridIndex
+
+# NOAA daily file names, e.g. AIS_2024_05_05.csv
+DAY_FILE_PATTERN = re.compile(r"^AIS_(\d{4})_(\d{2})_(\d{2})\.csv$")
+ONE_DAY = np.timedelta64(1, "D")
+
+
+class Partition:
+    """One prepared dataset. Rows of ship mmsi_keys[i] are df.iloc[mmsi_starts[i]:mmsi_ends[i]], in time order."""
+
+    def __init__(self, df: pd.DataFrame, mmsi_keys: np.ndarray, mmsi_starts: np.ndarray, mmsi_ends: np.ndarray,
+                 time_order: np.ndarray, sorted_times: np.ndarray, spatial_index: GridIndex):
+        self.df = df
+        self.mmsi_keys = mmsi_keys
+        self.mmsi_starts = mmsi_starts
+        self.mmsi_ends = mmsi_ends
+        # Row positions sorted by time, and the matching sorted timestamps
+        self.time_order = time_order
+        self.sorted_times = sorted_times
+        self.spatial_index = spatial_index
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    @property
+    def min_time(self) -> np.datetime64:
+        return self.sorted_times[0]
+
+    @property
+    def max_time(self) -> np.datetime64:
+        return self.sorted_times[-1]
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Returns every array besides df (e.g. for the on-disk cache); spatial index arrays are prefixed 'index_'."""
+        arrays = {
+            "time_order": self.time_order, "sorted_times": self.sorted_times,
+            "mmsi_keys": self.mmsi_keys, "mmsi_starts": self.mmsi_starts, "mmsi_ends": self.mmsi_ends
+        }
+        arrays.update({f"index_{name}": values for name, values in self.spatial_index.to_arrays().items()})
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, df: pd.DataFrame, arrays: Dict[str, np.ndarray], cell_deg: float) -> "Partition":
+        """Rebuilds a partition from df and to_arrays() output without re-sorting (arrays may be memory-mapped)."""
+        spatial_index = GridIndex.from_arrays(
+            {name[len("index_"):]: values for name, values in arrays.items() if name.startswith("index_")},
+            cell_deg=cell_deg
+        )
+        return cls(df, arrays["mmsi_keys"], arrays["mmsi_starts"], arrays["mmsi_ends"],
+                   arrays["time_order"], arrays["sorted_times"], spatial_index)
+
+    def lookup_mmsi_rows(self, mmsis: np.ndarray):
+        """Returns the [start, end) row ranges of the given MMSIs; unknown MMSIs get empty ranges."""
+        slots = np.minimum(np.searchsorted(self.mmsi_keys, mmsis), max(len(self.mmsi_keys) - 1, 0))
+        found = self.mmsi_keys[slots] == mmsis
+        starts = np.where(found, self.mmsi_starts[slots], 0)
+        ends = np.where(found, self.mmsi_ends[slots], 0)
+        return starts, ends
+
+    def window_positions(self, after: np.datetime64, until: np.datetime64) -> np.ndarray:
+        """Returns the row positions with after < time <= until, in time order."""
+        window_start_idx = np.searchsorted(self.sorted_times, after, side="right")
+        window_end_idx = np.searchsorted(self.sorted_times, until, side="right")
+        return self.time_order[window_start_idx:max(window_end_idx, window_start_idx)]
+
+    def count_window_records(self, start: np.datetime64, end: np.datetime64) -> int:
+        """Binary-searches the time-ordered view for the number of rows with start <= time <= end."""
+        window_start_idx = np.searchsorted(self.sorted_times, start, side="left")
+        window_end_idx = np.searchsorted(self.sorted_times, end, side="right")
+        return max(int(window_end_idx - window_start_idx), 0)
+
+
+class PartitionSource:
+    """A source file and the [start, end) time range it covers; None bounds are open."""
+
+    def __init__(self, key: str, path: str, start: Optional[np.datetime64] = None, end: Optional[np.datetime64] = None):
+        self.key = key
+        self.path = path
+        self.start = start
+        self.end = end
+
+    def overlaps(self, start: np.datetime64, end: np.datetime64) -> bool:
+        """True if the source may hold rows with start <= time <= end."""
+        return (self.start is None or end >= self.start) and (self.end is None or start < self.end)
+
+
+def find_day_files(directory: str) -> List[PartitionSource]:
+    """Returns one source per AIS_YYYY_MM_DD.csv file in directory, in day order, each covering that UTC day."""
+    sources = []
+    for name in os.listdir(directory):
+        match = DAY_FILE_PATTERN.match(name)
+        if not match:
+            continue
+        try:
+            day = np.datetime64(datetime(*map(int, match.groups())), "D")
+        except ValueError:
+            continue
+        sources.append(PartitionSource(str(day), os.path.join(directory, name), start=day, end=day + ONE_DAY))
+    return sorted(sources, key=lambda source: source.start)
+
+
+def file_fingerprint(path: str) -> Optional[Tuple[int, int]]:
+    """Returns (size, mtime in ns) of path, or None if it cannot be read; a rewritten file changes it."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def data_fingerprint(data_path: str) -> Tuple:
+    """Fingerprint of a single CSV file or of every daily file in a directory: changes when files change, appear or go."""
+    if os.path.isdir(data_path):
+        return tuple((source.key, file_fingerprint(source.path)) for source in find_day_files(data_path))
+    return (("all", file_fingerprint(data_path)),)
+
+
+class PartitionStore:
+    """
+    Loads partitions on first use with `loader(path)` and keeps at most `max_loaded` of them,
+    evicting the least recently used. A source that fails to load is not retried. Loads run one
+    at a time, without holding the store lock, so lookups of loaded partitions never wait for them.
+    """
+
+    def __init__(self, sources: List[PartitionSource], loader: Callable[[str], Optional[Partition]], max_loaded: int):
+        self.sources = list(sources)
+        self.loader = loader
+        self.max_loaded = max(int(max_loaded), 1)
+        self._loaded: "OrderedDict[str, Partition]" = OrderedDict()
+        self._fingerprints: Dict[str, Tuple[str, Optional[Tuple[int, int]]]] = {} # key -> (path, file fingerprint) at load time
+        self._failed = set()
+        self._lock = threading.Lock() # Guards the fields above; only held briefly
+        self._load_lock = threading.Lock() # One load at a time: a build peaks at several times the partition's size
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def loaded_keys(self) -> List[str]:
+        """Keys of the partitions currently held, least recently used first."""
+        with self._lock:
+            return list(self._loaded)
+
+    def get(self, source: PartitionSource) -> Optional[Partition]:
+        """Returns the loaded partition for source, loading it (and evicting the coldest partitions) if needed."""
+        with self._lock:
+            if source.key in self._loaded:
+                self._loaded.move_to_end(source.key)
+                return self._loaded[source.key]
+            if source.key in self._failed:
+                return None
+        with self._load_lock:
+            with self._lock:
+                # Another request may have loaded (or failed to load) it while this one waited
+                if source.key in self._loaded:
+                    self._loaded.move_to_end(source.key)
+                    return self._loaded[source.key]
+                if source.key in self._failed:
+                    return None
+            # Taken before reading, so a file rewritten during the load looks changed to the next reload
+            fingerprint = (source.path, file_fingerprint(source.path))
+            partition = self.loader(source.path)
+            with self._lock:
+                if partition is None:
+                    self._failed.add(source.key)
+                    return None
+                self._loaded[source.key] = partition
+                self._fingerprints[source.key] = fingerprint
+                self._evict()
+                return partition
+
+    def _evict(self):
+        while len(self._loaded) > self.max_loaded:
+            # Requests still holding an evicted partition keep it alive until they finish
+            key, _ = self._loaded.popitem(last=False)
+            self._fingerprints.pop(key, None)
+
+    def adopt_unchanged(self, previous: "PartitionStore") -> List[str]:
+        """
+        Takes over the partitions loaded in previous whose source (key, path and file size/mtime) is unchanged,
+        so a reload does not read them again; returns their keys. Both stores can serve queries meanwhile.
+        """
+        with previous._lock:
+            loaded = list(previous._loaded.items())
+            fingerprints = dict(previous._fingerprints)
+        sources = {source.key: source for source in self.sources}
+        adopted = []
+        with self._lock:
+            for key, partition in loaded:
+                source = sources.get(key)
+                if source is None or key in self._loaded or fingerprints.get(key) != (source.path, file_fingerprint(source.path)):
+                    continue
+                self._loaded[key] = partition
+                self._fingerprints[key] = fingerprints[key]
+                adopted.append(key)
+            self._evict()
+        return [key for key in adopted if key in self._loaded]
+
+    def partitions_for(self, start: np.datetime64, end: np.datetime64) -> List[Partition]:
+        """Returns the partitions that may hold rows with start <= time <= end, in time order."""
+        partitions = []
+        for source in self.sources:
+            if source.overlaps(start, end):
+                partition = self.get(source)
+                if partition is not None:
+                    partitions.append(partition)
+        return partitions
@@ -0,0 +1,71 @@
+# query_pool.py
+"""
+Bounded thread pool for running blocking query work off the event loop.
+
+At most `max_workers` queries run at once and at most `max_queue` more wait
+for a slot; beyond that, run() fails fast with QueryPoolFull instead of
+letting latency grow without bound. A query that takes longer than
+`timeout_seconds` raises QueryTimeout to its caller. Threads cannot be
+interrupted, so the timed-out work still finishes in the background and
+keeps its slot until it does.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class QueryPoolFull(Exception):
+    """Raised when every worker is busy and the queue is at its depth limit."""
+
+
+class QueryTimeout(Exception):
+    """Raised when a query does not finish within the pool's timeout."""
+
+
+class QueryPool:
+    def __init__(self, max_workers: int, max_queue: int, timeout_seconds: Optional[float]):
+        self.max_workers = max(int(max_workers), 1)
+        self.max_queue = max(int(max_queue), 0)
+        self.timeout_seconds = timeout_seconds
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ais-query")
+        self._lock = threading.Lock()
+        self._pending = 0 # Submitted and not yet finished (running or queued)
+        self._rejected = 0
+        self._timed_out = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._pending
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": min(pending, self.max_workers),
+                "queued": max(pending - self.max_workers, 0),
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+            }
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Runs func(*args) on a worker thread and returns its result (or raises its exception)."""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise QueryPoolFull(f"{self._pending} queries in progress (limit {self.max_workers} running + {self.max_queue} queued)")
+            self._pending += 1
+        future = self._executor.submit(func, *args)
+        # The slot is freed when the work really ends, not when a caller stops waiting for it
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout_seconds)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            raise QueryTimeout(f"Query did not finish within {self.timeout_seconds}s")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,70 @@
+# result_cache.py
+"""
+Bounded LRU cache of encoded API responses with per-entry expiry.
+
+Entries are evicted least recently used first once either `max_entries` or
+`max_bytes` is exceeded, and are dropped when read after their expiry time.
+Hit, miss, eviction and expiry counters are kept for monitoring. The cache
+is meant to be used from the event loop only, so it does no locking.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class ResultCache:
+    def __init__(self, max_entries: int, max_bytes: int, clock: Callable[[], float] = time.time):
+        self.max_entries = max(int(max_entries), 0)
+        self.max_bytes = max(int(max_bytes), 0)
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict() # key -> (value, size, expires_at)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the cached value, or None (counted as a miss) if it is absent or expired."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] <= self.clock():
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int, ttl_seconds: float):
+        """Stores value for ttl_seconds. Values larger than the whole byte budget are not cached."""
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes or self.max_entries == 0 or ttl_seconds <= 0:
+            return
+        self._entries[key] = (value, size, self.clock() + ttl_seconds)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
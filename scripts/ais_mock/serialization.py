@@ -0,0 +1,163 @@
+# serialization.py
+"""
+Fast JSON encoding of API responses built straight from NumPy columns.
+
+Pydantic validation and per-row pandas access dominate the cost of large
+responses, so columns are converted to JSON-ready Python lists in bulk and the
+documents are encoded with orjson when it is installed (stdlib json
+otherwise). The helpers reproduce pydantic's JSON rendering of the same
+values, so clients see the documents the response models describe.
+
+Machine clients can ask for the same documents as MessagePack (when msgpack
+is installed), or for the columns as one Arrow IPC record batch (when
+pyarrow is installed). Both skip JSON text parsing on the client side.
+"""
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError: # Optional: stdlib json encodes the same documents, only slower
+    orjson = None
+
+try:
+    import msgpack
+except ImportError: # Optional: without it, MessagePack is not offered
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError: # Optional: without it, Arrow IPC is not offered
+    pyarrow = None
+
+JSON_MEDIA_TYPE = "application/json"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPE_ALIASES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+NDJSON_BATCH_SIZE = 256 # Records encoded per streamed NDJSON chunk
+
+
+def dumps(obj: Any) -> bytes:
+    """Encodes obj (plain dicts, lists, str, int, float, None) as compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, allow_nan=False).encode("utf-8")
+
+
+def binary_media_types() -> List[str]:
+    """Binary media types this process can encode, depending on the optional libraries installed."""
+    return ([ARROW_STREAM_MEDIA_TYPE] if pyarrow is not None else []) + ([MSGPACK_MEDIA_TYPE] if msgpack is not None else [])
+
+
+def pack_msgpack(obj: Any) -> bytes:
+    """Encodes obj (the same plain values dumps() takes) as MessagePack; msgpack must be installed."""
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def _arrow_column(values: Any, kind: str):
+    if kind == "str":
+        return pyarrow.array(values, type=pyarrow.string())
+    if kind == "float":
+        return pyarrow.array(values, type=pyarrow.float64())
+    if kind == "int":
+        return pyarrow.array(values, type=pyarrow.int64())
+    if kind == "timestamp":
+        # The ISO strings of iso_timestamps(); Arrow parses them in bulk
+        return pyarrow.array(values, type=pyarrow.string()).cast(pyarrow.timestamp("us"))
+    if kind == "str_list":
+        return pyarrow.array(values, type=pyarrow.list_(pyarrow.string()))
+    if kind == "tail":
+        counts, lats, lons, times = values
+        points = pyarrow.StructArray.from_arrays(
+            [_arrow_column(lats, "float"), _arrow_column(lons, "float"), _arrow_column(times, "timestamp")],
+            names=["lat", "lon", "timestamp"]
+        )
+        offsets = pyarrow.array(np.concatenate(([0], np.cumsum(counts))).astype(np.int32))
+        return pyarrow.ListArray.from_arrays(offsets, points)
+    raise ValueError(f"Unknown Arrow column kind {kind!r}")
+
+
+def arrow_ipc_stream(columns: Dict[str, Any], kinds: Dict[str, str]) -> bytes:
+    """
+    Encodes JSON-ready columns as an Arrow IPC stream of one record batch; pyarrow must be installed.
+    kinds maps each column to "str", "float", "int", "timestamp" (ISO strings), "str_list" or "tail".
+    A "tail" column is flat, (counts, lats, lons, ISO times), and becomes list<struct<lat, lon, timestamp>>,
+    so the points of all tails are three contiguous arrays.
+    """
+    batch = pyarrow.RecordBatch.from_arrays([_arrow_column(values, kinds[name]) for name, values in columns.items()], names=list(columns))
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def iter_ndjson(records: Iterable[Any], batch_size: int = NDJSON_BATCH_SIZE) -> Iterator[bytes]:
+    """Yields records as newline-delimited JSON, batch_size records per chunk."""
+    batch = []
+    for record in records:
+        batch.append(dumps(record))
+        if len(batch) >= batch_size:
+            yield b"\n".join(batch) + b"\n"
+            batch = []
+    if batch:
+        yield b"\n".join(batch) + b"\n"
+
+
+def sse_event(event: str, data: Any, event_id: Optional[str] = None) -> bytes:
+    """Formats one server-sent event; data is encoded as a single line of JSON."""
+    lines = [f"event: {event}".encode("utf-8")]
+    if event_id is not None:
+        lines.append(f"id: {event_id}".encode("utf-8"))
+    lines.append(b"data: " + dumps(data))
+    return b"\n".join(lines) + b"\n\n"
+
+
+def iso_timestamps(values: np.ndarray) -> List[str]:
+    """
+    Formats naive datetime64 values as ISO 8601 strings the way pydantic does: microsecond precision,
+    with the fraction omitted for whole seconds.
+    """
+    values = np.asarray(values).astype("datetime64[us]")
+    formatted = np.datetime_as_string(values, unit="us").astype(object)
+    whole_seconds = values.view(np.int64) % 1_000_000 == 0
+    if whole_seconds.any():
+        formatted[whole_seconds] = np.datetime_as_string(values[whole_seconds], unit="s")
+    return formatted.tolist()
+
+
+def optional_floats(values: Optional[np.ndarray], size: int) -> List[Optional[float]]:
+    """Returns values as floats, with NaN as None. A missing column is all None."""
+    if values is None:
+        return [None] * size
+    values = np.asarray(values, dtype=np.float64)
+    result = np.asarray(values.tolist(), dtype=object)
+    result[np.isnan(values)] = None
+    return result.tolist()
+
+
+def optional_ints(values: Optional[np.ndarray], size: int) -> List[Optional[int]]:
+    """Returns whole-numbered values as ints; NaN and fractional values become None."""
+    if values is None:
+        return [None] * size
+    values = np.asarray(values, dtype=np.float64)
+    whole = np.isfinite(values) & (values == np.floor(values))
+    result = np.full(len(values), None, dtype=object)
+    result[whole] = [int(value) for value in values[whole].tolist()]
+    return result.tolist()
+
+
+def optional_strs(values: Optional[Any], size: int) -> List[Optional[str]]:
+    """Returns values as str, with NaN/None as None."""
+    if values is None:
+        return [None] * size
+    values = pd.Series(values)
+    missing = values.isna().to_numpy()
+    result = np.asarray([str(value) for value in values.tolist()], dtype=object)
+    result[missing] = None
+    return result.tolist()
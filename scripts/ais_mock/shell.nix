@@ -17,6 +17,9 @@ let
     ps.numpy        # For numerical operations (Haversine calculation)
     ps.fastapi      # The web framework used for the API
     ps.uvicorn      # ASGI server to run FastAPI (with standard features)
+    ps.orjson       # Optional: faster JSON encoding of /ships responses
+    ps.msgpack      # Optional: MessagePack encoding of /ships responses
+    ps.pyarrow      # Optional: Arrow IPC encoding of /ships responses
     # Add any other Python dependencies here if needed
   ]);
 
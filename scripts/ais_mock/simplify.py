@@ -0,0 +1,98 @@
+# simplify.py
+"""
+Vectorized Douglas-Peucker simplification of ship tracks.
+
+The recursion is run breadth-first: every iteration finds the farthest
+interior point of all open segments at once and splits the segments whose
+farthest point lies beyond the tolerance, so the Python loop runs once per
+recursion level rather than once per segment. Each kept point is ranked by
+the distance at which it was split, capped by the rank of the split that
+created its segment. Ranks therefore never increase down the recursion, and
+the top-k points by rank are the first k points Douglas-Peucker would add,
+which is how a max-points budget is met without losing course changes.
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+
+from spatial_index import concat_ranges
+
+EARTH_RADIUS_M = 6_371_000
+
+
+def project_equirectangular(lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Projects a track to local planar metres around its mean latitude. Longitudes are unwrapped first,
+    so tracks crossing the antimeridian stay continuous. Accurate enough for distances within one track.
+    """
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.unwrap(np.radians(np.asarray(lons, dtype=np.float64)))
+    scale = np.cos(lats.mean()) if len(lats) else 1.0
+    return EARTH_RADIUS_M * lons * scale, EARTH_RADIUS_M * lats
+
+
+def _segment_distances(px: np.ndarray, py: np.ndarray, ax: np.ndarray, ay: np.ndarray, bx: np.ndarray, by: np.ndarray) -> np.ndarray:
+    """Distance from each point p to the segment a-b (to a itself when a and b coincide)."""
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.where(length_sq > 0, ((px - ax) * dx + (py - ay) * dy) / length_sq, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def douglas_peucker_ranks(x: np.ndarray, y: np.ndarray, tolerance: float = 0.0) -> np.ndarray:
+    """
+    Returns the Douglas-Peucker rank of every point of the polyline (x, y): the first and last points rank +inf,
+    points split off rank by their (capped) split distance, and points of segments that were not split further
+    because they lie within `tolerance` rank 0.
+    """
+    n = len(x)
+    ranks = np.zeros(n, dtype=np.float64)
+    if n == 0:
+        return ranks
+    ranks[[0, -1]] = np.inf
+    seg_starts = np.array([0], dtype=np.int64)
+    seg_ends = np.array([n - 1], dtype=np.int64)
+    seg_caps = np.array([np.inf])
+    while True:
+        open_segments = seg_ends - seg_starts > 1
+        seg_starts, seg_ends, seg_caps = seg_starts[open_segments], seg_ends[open_segments], seg_caps[open_segments]
+        if not len(seg_starts):
+            return ranks
+        interior = concat_ranges(seg_starts + 1, seg_ends)
+        lengths = seg_ends - seg_starts - 1
+        point_segment = np.repeat(np.arange(len(seg_starts)), lengths)
+        a, b = seg_starts[point_segment], seg_ends[point_segment]
+        distances = _segment_distances(x[interior], y[interior], x[a], y[a], x[b], y[b])
+
+        # Farthest interior point of every segment (the first one on ties)
+        first = np.cumsum(lengths) - lengths
+        seg_max = np.maximum.reduceat(distances, first)
+        at_max = np.flatnonzero(distances == seg_max[point_segment])
+        _, first_at_max = np.unique(point_segment[at_max], return_index=True)
+        farthest = interior[at_max[first_at_max]]
+
+        split = seg_max > tolerance
+        points = farthest[split]
+        ranks[points] = np.minimum(seg_max[split], seg_caps[split])
+        seg_starts = np.concatenate((seg_starts[split], points))
+        seg_ends = np.concatenate((points, seg_ends[split]))
+        seg_caps = np.concatenate((ranks[points], ranks[points]))
+
+
+def simplify_track(x: np.ndarray, y: np.ndarray, tolerance: Optional[float] = None, max_points: Optional[int] = None) -> np.ndarray:
+    """
+    Returns the ascending indices of the points kept: every point Douglas-Peucker keeps at `tolerance`
+    (the same units as x and y; None keeps every point), reduced to the `max_points` highest ranked when there
+    are more. The first and last points are always kept, so max_points should be at least 2.
+    """
+    if tolerance is None and (max_points is None or len(x) <= max_points):
+        return np.arange(len(x))
+    tolerance = -np.inf if tolerance is None else tolerance
+    ranks = douglas_peucker_ranks(x, y, tolerance)
+    kept = np.flatnonzero(ranks > tolerance)
+    if max_points is not None and len(kept) > max_points:
+        by_rank = np.argsort(-ranks[kept], kind="stable")[:max(int(max_points), 0)]
+        kept = np.sort(kept[by_rank])
+    return kept
@@ -0,0 +1,183 @@
+# spatial_index.py
+"""
+Uniform lat/lon grid index over AIS row positions.
+
+Rows are bucketed into fixed-size grid cells at startup. A radius query only
+visits the cells overlapping the query circle's bounding box, so the number of
+rows that need an exact haversine check depends on local traffic density,
+not on the size of the whole dataset. When built with a sort key (e.g. the
+timestamp column), rows inside each cell are ordered by that key so a query
+can narrow every cell to a key window with a binary search.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+
+def concat_ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Returns the concatenation of arange(start, end) for every (start, end) pair, without a Python loop."""
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(ends, dtype=np.int64) - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    # Offset of each range's first element within the output array
+    range_offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - range_offsets, lengths) + np.arange(total, dtype=np.int64)
+
+
+class GridIndex:
+    """Buckets row positions into `cell_deg` x `cell_deg` degree cells, optionally ordered by `sort_key` within each cell."""
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, cell_deg: float = 0.1, sort_key: Optional[np.ndarray] = None):
+        self.cell_deg = float(cell_deg)
+        self.n_rows = int(np.ceil(180.0 / self.cell_deg))
+        self.n_cols = int(np.ceil(360.0 / self.cell_deg))
+
+        cell_ids = self._cell_ids(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64))
+        if sort_key is None:
+            # Row positions grouped by cell; stable so rows keep their original order within a cell
+            self.positions = np.argsort(cell_ids, kind="stable")
+            self.keys = None
+        else:
+            # Row positions grouped by cell, then ordered by key within each cell
+            self.positions = np.lexsort((sort_key, cell_ids))
+            self.keys = np.asarray(sort_key)[self.positions]
+        sorted_ids = cell_ids[self.positions]
+        del cell_ids
+        # Occupied cells only: ids, and [start, end) slices into self.positions. The ids are already sorted,
+        # so the boundaries are found directly rather than with np.unique, which would sort a copy again
+        self.cell_starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]]) if len(sorted_ids) else np.empty(0, dtype=np.int64)
+        self.cells = sorted_ids[self.cell_starts]
+        self.cell_ends = np.append(self.cell_starts[1:], len(sorted_ids))
+        self.cell_rows = self.cells // self.n_cols
+        self.cell_cols = self.cells % self.n_cols
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Returns the arrays needed to rebuild this index with from_arrays (e.g. for an on-disk cache)."""
+        arrays = {"positions": self.positions, "cells": self.cells, "cell_starts": self.cell_starts}
+        if self.keys is not None:
+            arrays["keys"] = self.keys
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], cell_deg: float) -> "GridIndex":
+        """Rebuilds an index from to_arrays() output without re-sorting (arrays may be memory-mapped)."""
+        index = cls.__new__(cls)
+        index.cell_deg = float(cell_deg)
+        index.n_rows = int(np.ceil(180.0 / index.cell_deg))
+        index.n_cols = int(np.ceil(360.0 / index.cell_deg))
+        index.positions = arrays["positions"]
+        index.keys = arrays.get("keys")
+        index.cells = arrays["cells"]
+        index.cell_starts = arrays["cell_starts"]
+        index.cell_ends = np.append(index.cell_starts[1:], len(index.positions))
+        index.cell_rows = index.cells // index.n_cols
+        index.cell_cols = index.cells % index.n_cols
+        return index
+
+    def _cell_row(self, lat):
+        return np.clip(np.floor((lat + 90.0) / self.cell_deg), 0, self.n_rows - 1).astype(np.int64)
+
+    def _cell_col(self, lon):
+        return (np.floor((lon + 180.0) / self.cell_deg).astype(np.int64)) % self.n_cols
+
+    def _cell_ids(self, lat, lon):
+        return self._cell_row(lat) * self.n_cols + self._cell_col(lon)
+
+    def _bounding_box(self, lat: float, lon: float, radius_km: float):
+        """Returns (row_lo, row_hi, col_ranges) covering the spherical cap around (lat, lon)."""
+        ang = radius_km / EARTH_RADIUS_KM
+        dlat = np.degrees(ang)
+        row_lo = int(self._cell_row(lat - dlat))
+        row_hi = int(self._cell_row(lat + dlat))
+
+        # A cap that reaches a pole (or covers half the globe) spans every longitude
+        if ang >= np.pi / 2 or np.radians(abs(lat)) + ang >= np.pi / 2:
+            return row_lo, row_hi, [(0, self.n_cols - 1)]
+
+        dlon = np.degrees(np.arcsin(np.sin(ang) / np.cos(np.radians(lat))))
+        col_lo = int(np.floor((lon - dlon + 180.0) / self.cell_deg))
+        col_hi = int(np.floor((lon + dlon + 180.0) / self.cell_deg))
+        if col_hi - col_lo + 1 >= self.n_cols:
+            return row_lo, row_hi, [(0, self.n_cols - 1)]
+        col_lo %= self.n_cols
+        col_hi %= self.n_cols
+        if col_lo <= col_hi:
+            return row_lo, row_hi, [(col_lo, col_hi)]
+        # Box crosses the antimeridian
+        return row_lo, row_hi, [(col_lo, self.n_cols - 1), (0, col_hi)]
+
+    def candidate_cells(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Returns indices (into self.cells) of occupied cells that may hold rows within radius_km."""
+        row_lo, row_hi, col_ranges = self._bounding_box(lat, lon, radius_km)
+        n_box_cells = (row_hi - row_lo + 1) * sum(hi - lo + 1 for lo, hi in col_ranges)
+
+        if n_box_cells > len(self.cells):
+            # Wide query: cheaper to test every occupied cell than to enumerate the box
+            in_rows = (self.cell_rows >= row_lo) & (self.cell_rows <= row_hi)
+            in_cols = np.zeros(len(self.cells), dtype=bool)
+            for lo, hi in col_ranges:
+                in_cols |= (self.cell_cols >= lo) & (self.cell_cols <= hi)
+            return np.flatnonzero(in_rows & in_cols)
+
+        cols = np.concatenate([np.arange(lo, hi + 1) for lo, hi in col_ranges])
+        rows = np.arange(row_lo, row_hi + 1)
+        box_ids = (rows[:, None] * self.n_cols + cols[None, :]).ravel()
+        hits = np.searchsorted(self.cells, box_ids)
+        valid = hits < len(self.cells)
+        hits, box_ids = hits[valid], box_ids[valid]
+        return hits[self.cells[hits] == box_ids]
+
+    def query(self, lat: float, lon: float, radius_km: float, key_min=None, key_max=None) -> np.ndarray:
+        """
+        Returns row positions of every row in a cell overlapping the query circle (a superset of the exact result).
+        If the index was built with a sort key, rows can be restricted to key_min <= key <= key_max.
+        """
+        positions, _ = self.query_many([lat], [lon], [radius_km], key_min=key_min, key_max=key_max)
+        return positions
+
+    def query_many(self, lats, lons, radii_km, key_min=None, key_max=None):
+        """
+        Runs query() for several circles sharing one key window. Each distinct cell is narrowed to the
+        key window once, however many circles overlap it. Returns (positions, owners): the candidate row
+        positions of all circles, grouped by circle, and the index of the circle each one belongs to.
+        """
+        cells_per_query = [self.candidate_cells(lat, lon, radius_km) for lat, lon, radius_km in zip(lats, lons, radii_km)]
+        cell_counts = np.array([len(cells) for cells in cells_per_query], dtype=np.int64)
+        if not cell_counts.sum():
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        unique_cells, inverse = np.unique(np.concatenate(cells_per_query), return_inverse=True)
+        starts, ends = self._cell_slices(unique_cells, key_min, key_max)
+        starts, ends = starts[inverse], ends[inverse]
+        cell_owners = np.repeat(np.arange(len(cells_per_query)), cell_counts)
+        return self.positions[concat_ranges(starts, ends)], np.repeat(cell_owners, ends - starts)
+
+    def positions_in_cells(self, cells: np.ndarray, key_min=None, key_max=None) -> np.ndarray:
+        """Returns the row positions of the given occupied cells (indices into self.cells), optionally restricted to a key window."""
+        starts, ends = self._cell_slices(np.asarray(cells, dtype=np.int64), key_min, key_max)
+        return self.positions[concat_ranges(starts, ends)]
+
+    def _cell_slices(self, cells: np.ndarray, key_min, key_max):
+        """Returns the [start, end) slices of self.positions holding the given cells, narrowed to the key window if there is one."""
+        starts, ends = self.cell_starts[cells], self.cell_ends[cells]
+        if self.keys is not None and (key_min is not None or key_max is not None):
+            starts, ends = self._narrow_to_key_window(starts, ends, key_min, key_max)
+        return starts, ends
+
+    def _narrow_to_key_window(self, starts: np.ndarray, ends: np.ndarray, key_min, key_max):
+        """Binary-searches each cell's key-sorted slice for the [key_min, key_max] window."""
+        new_starts = starts.copy()
+        new_ends = ends.copy()
+        for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+            cell_keys = self.keys[start:end]
+            if key_min is not None:
+                new_starts[i] = start + np.searchsorted(cell_keys, key_min, side="left")
+            if key_max is not None:
+                new_ends[i] = start + np.searchsorted(cell_keys, key_max, side="right")
+        return new_starts, np.maximum(new_ends, new_starts)
@@ -0,0 +1,98 @@
+# tails.py
+"""
+Vectorized tail selection for many ships at once.
+
+Each ship's tail candidates are a contiguous, time-sorted segment of one
+int64 timestamp array. Starting from the newest fix, a tail keeps every fix
+that is at least `min_spacing` older than the previously kept one. That
+greedy walk is done for all segments together: a single searchsorted finds
+each candidate's predecessor, then the walk advances every ship one step per
+NumPy operation instead of one row per Python iteration.
+"""
+from typing import Tuple
+
+import numpy as np
+
+from spatial_index import concat_ranges
+
+# Keep composite (segment, time) keys comfortably inside int64
+_MAX_COMPOSITE_KEY = 2**62
+
+
+def segment_searchsorted(values: np.ndarray, seg_starts: np.ndarray, seg_ends: np.ndarray, targets: np.ndarray, side: str = "left") -> np.ndarray:
+    """
+    Batched np.searchsorted: for each i, returns the absolute index in values[seg_starts[i]:seg_ends[i]]
+    (ascending) at which targets[i] would be inserted. Runs one bisection step for all segments at a time.
+    """
+    lo = np.asarray(seg_starts, dtype=np.int64).copy()
+    hi = np.asarray(seg_ends, dtype=np.int64).copy()
+    targets = np.asarray(targets)
+    last = max(len(values) - 1, 0)
+    while True:
+        active = lo < hi
+        if not active.any():
+            return lo
+        mid = (lo + hi) // 2
+        probe = values[np.minimum(mid, last)]
+        go_right = active & ((probe < targets) if side == "left" else (probe <= targets))
+        lo = np.where(go_right, mid + 1, lo)
+        hi = np.where(active & ~go_right, mid, hi)
+
+
+def select_tail_rows(times: np.ndarray, seg_starts: np.ndarray, seg_ends: np.ndarray, min_spacing: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Selects tail rows for every [seg_starts[i], seg_ends[i]) segment of `times`.
+
+    `times` must be int64 and ascending within each segment; `min_spacing` is in the same unit.
+    Returns (rows, counts): the selected positions into `times`, grouped by segment and
+    chronological within each segment, and the number of rows selected for each segment.
+    """
+    seg_starts = np.asarray(seg_starts, dtype=np.int64)
+    seg_ends = np.maximum(np.asarray(seg_ends, dtype=np.int64), seg_starts)
+    n_segments = len(seg_starts)
+    lengths = seg_ends - seg_starts
+    if n_segments == 0 or lengths.sum() == 0:
+        return np.empty(0, dtype=np.int64), np.zeros(n_segments, dtype=np.int64)
+
+    candidates = concat_ranges(seg_starts, seg_ends)
+    cand_times = np.asarray(times[candidates], dtype=np.int64)
+    cand_segment = np.repeat(np.arange(n_segments), lengths)
+    # Index (into candidates) of each segment's first and last row
+    seg_first = np.cumsum(lengths) - lengths
+    seg_last = seg_first + lengths - 1
+
+    predecessor = _predecessors(cand_times, cand_segment, seg_first, lengths, min_spacing)
+
+    # Walk every non-empty segment back from its newest row, one hop per iteration
+    selected = np.zeros(len(candidates), dtype=bool)
+    current = seg_last[lengths > 0]
+    while current.size:
+        selected[current] = True
+        previous = predecessor[current]
+        current = previous[previous >= 0]
+
+    return candidates[selected], np.bincount(cand_segment[selected], minlength=n_segments)
+
+
+def _predecessors(cand_times: np.ndarray, cand_segment: np.ndarray, seg_first: np.ndarray, lengths: np.ndarray, min_spacing: int) -> np.ndarray:
+    """
+    For each candidate, returns the index of the newest candidate in the same segment that is
+    at least min_spacing older, or -1 if there is none.
+    """
+    # Times relative to each segment's first row, laid out as segment * stride + offset so
+    # one searchsorted over the whole candidate array never crosses a segment boundary
+    relative = cand_times - cand_times[seg_first][cand_segment]
+    stride = int(relative.max()) + int(min_spacing) + 1
+    segments_per_chunk = max(_MAX_COMPOSITE_KEY // stride, 1)
+
+    predecessor = np.empty(len(cand_times), dtype=np.int64)
+    for chunk_start in range(0, len(seg_first), segments_per_chunk):
+        chunk_end = min(chunk_start + segments_per_chunk, len(seg_first))
+        lo = seg_first[chunk_start]
+        hi = seg_first[chunk_end - 1] + lengths[chunk_end - 1]
+        key = (cand_segment[lo:hi] - chunk_start) * stride + relative[lo:hi]
+        found = np.searchsorted(key, key - min_spacing, side="right") - 1 + lo
+        # A hit before the segment's first row belongs to the previous segment: no predecessor
+        found[found < seg_first[cand_segment[lo:hi]]] = -1
+        predecessor[lo:hi] = found
+    return predecessor
@@ -6,11 +6,21 @@ import json
 from db_utils import get_trust_score, store_user_metadata, get_or_create_report_number, get_visibility_for_location
 import uuid
 from datetime import datetime
+from typing import Optional
 
+from http_clients import HttpClients, client_for
 from shared import ReportDetails, EnrichedReportDetails
 
 logging.info("activities.py loaded: registering activities...")
 
+# Pooled clients the worker injects with use_http_clients(); None opens a client per call
+_http_clients: Optional[HttpClients] = None
+
+def use_http_clients(clients: Optional[HttpClients]):
+    """Sends the activities' HTTP requests through the given pools (see http_clients.py), or through one-off clients with None."""
+    global _http_clients
+    _http_clients = clients
+
 @activity.defn
 async def calculate_trust_score(source_account_id: str, ip: str = None, user_agent: str = None, is_logged_in: bool = False) -> float:
     try:
@@ -64,7 +74,7 @@ async def calculate_visibility(report: EnrichedReportDetails) -> int:
         Calculate visibility using real backend/API data instead of random placeholder.
         """
         logging.info(f"Calculating visibility at coordinates: {report.latitude}, {report.longitude}")
-        visibility = get_visibility_for_location(report.latitude, report.longitude)
+        visibility = await get_visibility_for_location(report.latitude, report.longitude, http_clients=_http_clients)
         logging.info(f"Calculated visibility: {visibility}")
         return visibility
     except Exception as e:
@@ -74,16 +84,13 @@ async def calculate_visibility(report: EnrichedReportDetails) -> int:
 @activity.defn
 async def find_ais_neighbours(report: EnrichedReportDetails) -> list[str]:
     try:
-        import requests
+        import httpx # Async client, so a slow mock does not block the other activities on the worker's event loop
         logging.info(f"Fetching AIS data for ships around coordinates: {report.latitude}, {report.longitude}")
-        url = f"http://0.0.0.0:8000/ships?lat={report.latitude}&lon={report.longitude}&radius={report.visibility}&tail_hours=0.1&sim_window_minutes=120"
+        url = f"http://0.0.0.0:8000/ships?lat={report.latitude}&lon={report.longitude}&radius={report.visibility}&sim_window_minutes=120&fields=vessel_name" # Only names are used, so the mock skips tails and other fields
         logging.info(f"Making GET request to {url}")
         try:
-            response = requests.request(
-                method="GET",
-                url=url,
-                timeout=15 # Example timeout for the request itself
-            )
+            async with client_for(_http_clients, "ais") as client:
+                response = await client.get(url, timeout=15) # Example timeout for the request itself
             # Raise an exception for bad status codes (4xx or 5xx)
             response.raise_for_status()
 
@@ -97,7 +104,7 @@ async def find_ais_neighbours(report: EnrichedReportDetails) -> list[str]:
             logging.info(f"Found ships around location at this time: {neighbours}")
             return neighbours
 
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             activity.logger.error(f"HTTP request failed: {e}")
             # Re-raise the exception so Temporal knows the activity failed
             raise e
@@ -116,8 +123,9 @@ async def llm_enrich(report: EnrichedReportDetails) -> str:
         """
         logging.info(f"Starting LLM enrichment for ship at coordinates: {report.latitude}, {report.longitude}")
         
-        # Import requests inside the activity to avoid sandbox restrictions
-        import requests
+        # Import httpx inside the activity to avoid sandbox restrictions. It is async, so waiting
+        # for the LLM does not block the other activities on the worker's event loop
+        import httpx
         import json
         
         # Prepare system prompt and user message
@@ -180,12 +188,13 @@ async def llm_enrich(report: EnrichedReportDetails) -> str:
             logging.info("Making OpenAI API request...")
             logging.info(f"Request data: {json.dumps(data, indent=2)}")
             
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=30
-            )
+            async with client_for(_http_clients, "openai") as client:
+                response = await client.post(
+                    "https://api.openai.com/v1/chat/completions",
+                    headers=headers,
+                    json=data,
+                    timeout=30
+                )
             
             # Log the response status and headers
             logging.info(f"OpenAI API response status: {response.status_code}")
@@ -213,10 +222,10 @@ async def llm_enrich(report: EnrichedReportDetails) -> str:
             logging.info(f"Generated enriched description: {enriched_description}")
             return enriched_description
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             error_msg = f"HTTP request failed: {str(e)}"
             logging.error(error_msg)
-            if hasattr(e.response, 'text'):
+            if isinstance(e, httpx.HTTPStatusError):
                 logging.error(f"Response text: {e.response.text}")
             raise ValueError(error_msg)
         except Exception as e:
@@ -8,6 +8,8 @@ from typing import Optional
 import random
 import os
 
+from http_clients import HttpClients, client_for
+
 # Example: Replace with your ORM or DB client
 # from your_orm import Session, TrustScore, UserMetadata
 
@@ -49,18 +51,20 @@ def get_or_create_report_number(latitude: float, longitude: float) -> str:
     logging.info(f"Stub: Generate report number for ({latitude}, {longitude})")
     return f"AIS-{random.randint(10000, 99999)}"
 
-def get_visibility_for_location(latitude: float, longitude: float) -> int:
+async def get_visibility_for_location(latitude: float, longitude: float, http_clients: Optional[HttpClients] = None) -> int:
     """
     Retrieve visibility for the given coordinates using OpenWeatherMap Current Weather API.
     Returns visibility in metres (0-10000). Requires OPENWEATHERMAP_API_KEY in environment.
+    Async, so the worker's event loop keeps running other activities while the API answers.
+    Uses the pooled OpenWeatherMap client of http_clients when given.
     """
-    import requests  # Only import here to avoid workflow sandbox issues
     api_key = os.getenv("OPENWEATHERMAP_API_KEY")
     if not api_key:
         raise ValueError("OPENWEATHERMAP_API_KEY not set in environment.")
     url = f"https://api.openweathermap.org/data/2.5/weather?lat={latitude}&lon={longitude}&appid={api_key}"
     try:
-        resp = requests.get(url, timeout=10)
+        async with client_for(http_clients, "openweathermap") as client:
+            resp = await client.get(url, timeout=10)
         resp.raise_for_status()
         data = resp.json()
         visibility = data.get("visibility")
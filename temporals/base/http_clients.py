@@ -0,0 +1,71 @@
+# http_clients.py
+"""
+Pooled HTTP clients for the upstreams the activities call (AIS mock, OpenAI, OpenWeatherMap).
+The worker creates one client per upstream at startup and closes them on shutdown, so
+connections (and their TLS sessions) are kept alive and reused across activity calls.
+HTTP/2 is used when the h2 package is installed. Pool sizes are read from the environment:
+HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS and HTTP_KEEPALIVE_EXPIRY_SECONDS,
+overridable per upstream with an AIS_, OPENAI_ or OPENWEATHERMAP_ prefix.
+"""
+import importlib.util
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    import httpx
+
+UPSTREAMS = ("ais", "openai", "openweathermap")
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 10
+DEFAULT_KEEPALIVE_EXPIRY_SECONDS = 30.0
+
+def _setting(upstream: str, name: str, default: float) -> float:
+    """Reads {UPSTREAM}_{name}, then {name}, from the environment."""
+    value = os.getenv(f"{upstream.upper()}_{name}", os.getenv(name))
+    return float(value) if value else default
+
+class HttpClients:
+    """One httpx.AsyncClient per upstream, shared by all activities for the worker's lifetime."""
+
+    def __init__(self, clients: Dict[str, "httpx.AsyncClient"]):
+        self.clients = clients
+
+    @classmethod
+    def from_env(cls) -> "HttpClients":
+        import httpx  # Only import here to avoid workflow sandbox issues
+        # h2 is optional: without it, the clients speak HTTP/1.1 only
+        http2 = importlib.util.find_spec("h2") is not None and os.getenv("HTTP2_ENABLED", "1") != "0"
+        clients = {}
+        for upstream in UPSTREAMS:
+            limits = httpx.Limits(
+                max_connections=int(_setting(upstream, "HTTP_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)),
+                max_keepalive_connections=int(_setting(upstream, "HTTP_MAX_KEEPALIVE_CONNECTIONS", DEFAULT_MAX_KEEPALIVE_CONNECTIONS)),
+                keepalive_expiry=_setting(upstream, "HTTP_KEEPALIVE_EXPIRY_SECONDS", DEFAULT_KEEPALIVE_EXPIRY_SECONDS),
+            )
+            clients[upstream] = httpx.AsyncClient(limits=limits, http2=http2)
+            logging.info(f"HTTP pool for {upstream}: {limits}, HTTP/2 {'on' if http2 else 'off'}")
+        return cls(clients)
+
+    def get(self, upstream: str) -> "httpx.AsyncClient":
+        return self.clients[upstream]
+
+    async def aclose(self):
+        """Closes every pool, waiting for their connections to shut down."""
+        for upstream, client in self.clients.items():
+            await client.aclose()
+            logging.info(f"Closed HTTP pool for {upstream}")
+
+@asynccontextmanager
+async def client_for(clients: Optional[HttpClients], upstream: str):
+    """
+    Yields the pooled client for upstream, or, without pools (e.g. an activity called
+    outside the worker), a client used for this call only.
+    """
+    if clients is not None:
+        yield clients.get(upstream)
+        return
+    import httpx  # Only import here to avoid workflow sandbox issues
+    async with httpx.AsyncClient() as client:
+        yield client
@@ -4,7 +4,8 @@ from temporalio.client import Client
 import os
 from dotenv import load_dotenv
 
-from activities import assign_report_number, calculate_trust_score, calculate_visibility, find_ais_neighbours, convert_to_prometheus_metrics, llm_enrich
+from activities import assign_report_number, calculate_trust_score, calculate_visibility, find_ais_neighbours, convert_to_prometheus_metrics, llm_enrich, use_http_clients
+from http_clients import HttpClients
 from workflow import ReportDetailsWorkflow
 
 # Load environment variables from .env file
@@ -53,9 +54,17 @@ async def run_worker():
         activities=[assign_report_number, calculate_trust_score, calculate_visibility, find_ais_neighbours, convert_to_prometheus_metrics, llm_enrich],
     )
 
+    # One connection pool per upstream for the worker's lifetime, shared by all activities
+    http_clients = HttpClients.from_env()
+    use_http_clients(http_clients)
+
     logger.info("Worker started, waiting for tasks...")
     logging.info(f"Registered activities: {[fn.__name__ for fn in [assign_report_number, calculate_trust_score, calculate_visibility, find_ais_neighbours, convert_to_prometheus_metrics, llm_enrich]]}")
-    await worker.run()
+    try:
+        await worker.run()
+    finally:
+        use_http_clients(None)
+        await http_clients.aclose()
 
 if __name__ == "__main__":
     import asyncio
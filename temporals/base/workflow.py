@@ -1,6 +1,7 @@
 from temporalio import workflow
 from temporalio.common import RetryPolicy
 
+import asyncio
 import logging
 
 from datetime import timedelta
@@ -42,38 +43,46 @@ class ReportDetailsWorkflow:
 
         enriched = EnrichedReportDetails(**ship.__dict__)
 
-        enriched.report_number = await workflow.execute_activity(
-            assign_report_number,
-            enriched,
-            start_to_close_timeout=timedelta(seconds=10),
-            retry_policy=RETRY_POLICY,
-        )
-        logging.info(f"Enriched with AIS number: {enriched.report_number}")
+        # Report number and trust score depend on nothing but the report, and the AIS lookup only needs the
+        # visibility, so the three branches run concurrently and the report waits for the slowest one
+        async def enrich_report_number():
+            enriched.report_number = await workflow.execute_activity(
+                assign_report_number,
+                enriched,
+                start_to_close_timeout=timedelta(seconds=10),
+                retry_policy=RETRY_POLICY,
+            )
+            logging.info(f"Enriched with AIS number: {enriched.report_number}")
 
-        enriched.visibility = await workflow.execute_activity(
-            calculate_visibility,
-            enriched,
-            start_to_close_timeout=timedelta(seconds=10),
-            retry_policy=RETRY_POLICY,
-        )
-        logging.info(f"Enriched with neighbours: {enriched.ais_neighbours}")
+        async def enrich_visibility_and_neighbours():
+            enriched.visibility = await workflow.execute_activity(
+                calculate_visibility,
+                enriched,
+                start_to_close_timeout=timedelta(seconds=10),
+                retry_policy=RETRY_POLICY,
+            )
+            logging.info(f"Enriched with visibility: {enriched.visibility}")
 
-        enriched.ais_neighbours = await workflow.execute_activity(
-            find_ais_neighbours,
-            enriched,
-            start_to_close_timeout=timedelta(seconds=10),
-            retry_policy=RETRY_POLICY,
-        )
-        logging.info(f"Enriched with neighbours: {enriched.ais_neighbours}")
+            enriched.ais_neighbours = await workflow.execute_activity(
+                find_ais_neighbours,
+                enriched,
+                start_to_close_timeout=timedelta(seconds=10),
+                retry_policy=RETRY_POLICY,
+            )
+            logging.info(f"Enriched with neighbours: {enriched.ais_neighbours}")
 
-        enriched.trust_score = await workflow.execute_activity(
-            calculate_trust_score,
-            enriched.source_account_id,
-            start_to_close_timeout=timedelta(seconds=10),
-            retry_policy=RETRY_POLICY,
-        )
-        logging.info(f"Trust score calculated: {enriched.trust_score}")
+        async def enrich_trust_score():
+            enriched.trust_score = await workflow.execute_activity(
+                calculate_trust_score,
+                enriched.source_account_id,
+                start_to_close_timeout=timedelta(seconds=10),
+                retry_policy=RETRY_POLICY,
+            )
+            logging.info(f"Trust score calculated: {enriched.trust_score}")
+
+        await asyncio.gather(enrich_report_number(), enrich_visibility_and_neighbours(), enrich_trust_score())
 
+        # The LLM sees every enrichment, so it runs once all branches are done
         logging.info("Starting LLM enrichment activity...")
         try:
             enriched.enriched_description = await workflow.execute_activity(